@@ -0,0 +1,177 @@
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from common import write_dicts_to_csv
+from generate_matchups import load_weapons
+from kill_matrix import SRC_DIR, Target, load_targets
+
+SEQUENCE_ATTACKS = ["slash", "overhead", "stab"]
+SEQUENCE_VARIANTS = ["light", "heavy"]
+OPTION_STATS = ["windup", "release", "recovery", "combo", "damage", "staminaDamage"]
+
+# What each objective adds up, and what the attack after a hit has to wait for. Damage assumes every
+# hit lands, so the next attack is comboed. Stamina damage is only dealt to a parry, which leaves the
+# attacker to sit out the recovery, like in duel_simulator.py
+OBJECTIVES = {
+    "damage": "combo",
+    "staminaDamage": "recovery",
+}
+
+DEFAULT_WINDOW = 5000
+DEFAULT_STEP = 1
+
+@dataclass
+class AttackOption:
+    """One attack a weapon can start, "slashHeavy" and so on."""
+    name: str
+    windup: float
+    # Start of this attack to the start of the next, per objective
+    transitions: Dict[str, float]
+    # Value of a hit per objective, damage is a row per target
+    values: Dict[str, np.ndarray]
+
+def attack_options(weapon: Dict, targets: List[Target]) -> List[AttackOption]:
+    """The transition graph of a weapon: every complete swing, and how long until the next one can start."""
+    options = []
+    for attack_name in SEQUENCE_ATTACKS:
+        attack = weapon["attacks"].get(attack_name)
+        if attack is None:
+            continue
+        for variant in SEQUENCE_VARIANTS:
+            stats = attack[variant]
+            if not all(type(stats.get(stat)) in [int, float] for stat in OPTION_STATS):
+                continue
+            damage_type = stats.get("damageTypeOverride", weapon.get("damageType"))
+            options.append(AttackOption(
+                attack_name + variant.capitalize(),
+                stats["windup"],
+                {objective: stats["windup"] + stats["release"] + stats[follow_up] for objective, follow_up in OBJECTIVES.items()},
+                {
+                    "damage": np.array([stats["damage"] * target.damage_multiplier(damage_type) for target in targets], dtype=np.float64),
+                    "staminaDamage": np.full(len(targets), stats["staminaDamage"], dtype=np.float64),
+                },
+            ))
+    return options
+
+def best_sequences(lands_by: np.ndarray, transitions: np.ndarray, values: np.ndarray, window: float, step: float) -> Tuple[np.ndarray, List[List[int]]]:
+    """
+    Most value that fits in window ms, and the options that get it, for many columns (weapon and target) at once.
+    Every argument is (column x option), options a column doesn't have land at inf.
+
+    best[t] is the most that can still be dealt by an attack started at step t, a hit counting if it lands
+    (at the end of its windup) inside the window. It's filled backwards, each step looking at the steps its
+    transitions lead to, so every state is solved once. Transitions round up to the step, never starting an attack early.
+    """
+    steps = int(window // step)
+    (column_count, option_count) = values.shape
+    if option_count == 0:
+        return (np.zeros(column_count), [[] for _ in range(column_count)])
+
+    jumps = np.maximum(1, np.ceil(np.nan_to_num(transitions, posinf=step) / step)).astype(np.intp)
+    columns = np.arange(column_count)
+
+    # Padded with zeros past the end of the window
+    best = np.zeros((steps + 1 + jumps.max(), column_count), dtype=np.float64)
+    choice = np.full((steps + 1, column_count), -1, dtype=np.intp)
+    for t in range(steps, -1, -1):
+        fits = t * step + lands_by <= window
+        if not fits.any():
+            continue
+        candidates = np.where(fits, values + best[t + jumps, columns[:, None]], -np.inf)
+        picked = np.argmax(candidates, axis=1)
+        gained = candidates[columns, picked]
+        better = gained > 0
+        best[t] = np.where(better, gained, 0)
+        choice[t] = np.where(better, picked, -1)
+
+    sequences = []
+    for column in columns:
+        (t, sequence) = (0, [])
+        while t <= steps and choice[t, column] >= 0:
+            sequence.append(int(choice[t, column]))
+            t += jumps[column, choice[t, column]]
+        sequences.append(sequence)
+    return (best[0], sequences)
+
+def describe(options: List[AttackOption], sequence: List[int]) -> str:
+    """overheadHeavy x3 > stabLight, repeats of the same attack are run length encoded."""
+    runs = []
+    for o in sequence:
+        if len(runs) > 0 and runs[-1][0] == o:
+            runs[-1][1] += 1
+        else:
+            runs.append([o, 1])
+    return " > ".join(options[o].name + (f" x{count}" if count > 1 else "") for (o, count) in runs)
+
+def pack_options(roster_options: List[List[AttackOption]], objective: str, target_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """lands_by, transitions and values of best_sequences, a column per weapon and target."""
+    width = max((len(options) for options in roster_options), default=0)
+    shape = (len(roster_options), target_count, width)
+    (lands_by, transitions, values) = (np.full(shape, np.inf), np.full(shape, np.inf), np.zeros(shape))
+    for w, options in enumerate(roster_options):
+        for o, option in enumerate(options):
+            lands_by[w, :, o] = option.windup
+            transitions[w, :, o] = option.transitions[objective]
+            values[w, :, o] = option.values[objective]
+    return (lands_by.reshape(-1, width), transitions.reshape(-1, width), values.reshape(-1, width))
+
+def weapon_sequences(weapons: List[Dict], targets: List[Target], window: float, step: float) -> List[Dict]:
+    """A row per weapon, target and objective with the best sequence, every weapon searched at once."""
+    roster_options = [attack_options(weapon, targets) for weapon in weapons]
+    results = {objective: best_sequences(*pack_options(roster_options, objective, len(targets)), window, step) for objective in OBJECTIVES}
+
+    rows = []
+    for w, weapon in enumerate(weapons):
+        for objective, (totals, sequences) in results.items():
+            for t, target in enumerate(targets):
+                column = w * len(targets) + t
+                rows.append({
+                    "name": weapon["name"],
+                    "target": target.name,
+                    "objective": objective,
+                    "perSecond": float(totals[column]) / (window / 1000),
+                    "total": float(totals[column]),
+                    "attacks": len(sequences[column]),
+                    "sequence": describe(roster_options[w], sequences[column]),
+                })
+    return rows
+
+def roster_sequences(weapons: List[Dict], targets: List[Target], window: float = DEFAULT_WINDOW, step: float = DEFAULT_STEP, workers: int = 1) -> List[Dict]:
+    """weapon_sequences of the roster split over workers, in roster order whatever the number of workers."""
+    if workers <= 1:
+        return weapon_sequences(weapons, targets, window, step)
+    chunk = math.ceil(len(weapons) / workers)
+    chunks = [weapons[start:start + chunk] for start in range(0, len(weapons), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(weapon_sequences, chunks, [targets] * len(chunks), [window] * len(chunks), [step] * len(chunks))
+        return [row for rows in results for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser(description="Best sequence of slashes, overheads and stabs per weapon for damage and stamina damage per second over a fixed window")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(SRC_DIR, "weapons"), help="Path to the weapons directory, or to a weapon store built by weapon_store.py")
+    parser.add_argument("-o", "--output", required=True, help="Where to put the results, json if it ends in .json, csv otherwise")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW, help="Length of the window in ms, hits have to land inside it")
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP, help="Time step of the search in ms. Transitions are rounded up to it")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of processes to spread the weapons over")
+    args = parser.parse_args()
+
+    weapons_location = args.weapons_dir + "/" if args.weapons_dir[-1] != "/" and not os.path.isfile(args.weapons_dir) else args.weapons_dir
+    weapons = [weapon for weapon in load_weapons(weapons_location) if "id" in weapon]
+    rows = roster_sequences(weapons, load_targets(), args.window, args.step, args.workers)
+
+    if args.output.endswith(".json"):
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+    else:
+        write_dicts_to_csv(rows, args.output)
+    print(f"Wrote the best sequences of {len(weapons)} weapons to {args.output}")
+
+if __name__ == '__main__':
+    main()
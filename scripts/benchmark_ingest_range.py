@@ -0,0 +1,97 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ["baseline", "csv"]
+# The last commit where ingest-range-data read the CSV with pandas and wrote every row's file back
+BASELINE_REV = "7620e1d"
+
+def write_baseline_script(rev, output_dir):
+    """Check out ingest-range-data.py as it was at rev into output_dir, so the baseline mode runs the old code itself."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    source = subprocess.run(["git", "show", f"{rev}:scripts/ingest-range-data.py"], cwd=root, check=True, capture_output=True, text=True).stdout
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "ingest-range-data.py"), "w") as f:
+        f.write(source)
+
+def run_mode(mode, csv_file_path, json_dir, baseline_dir=None):
+    """Import and run one path end to end, in this process. The baseline imports pandas at module level, so that is part of its import."""
+    if mode == "baseline":
+        sys.path.insert(0, baseline_dir)
+    start = time.perf_counter()
+    ingest = importlib.import_module("ingest-range-data")
+    import_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ingest.process_csv_and_update_json(csv_file_path, json_dir)
+    run_seconds = time.perf_counter() - start
+    return {"mode": mode, "importSeconds": import_seconds, "runSeconds": run_seconds, "changes": len(ingest.changelog)}
+
+def make_range_csv(range_dir, output_path):
+    import process_range_save
+    range_data = process_range_save.process_directory(range_dir)
+    process_range_save.generate_csv(range_data, output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare import time and total runtime of ingest-range-data against its pandas version from an earlier commit")
+    parser.add_argument("-d", "--data_dir", required=True, help="Synthetic data directory from synthetic_data.py, with weapons and range_test_iterations")
+    parser.add_argument("--repeat", type=int, default=7, help="Runs per mode, the median is reported")
+    parser.add_argument("--baseline_rev", default=BASELINE_REV, help="Commit to take the baseline ingest-range-data.py from")
+    parser.add_argument("-o", "--output", help="Where to write the results json")
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--csv", help=argparse.SUPPRESS)
+    parser.add_argument("--weapons_dir", help=argparse.SUPPRESS)
+    parser.add_argument("--baseline_dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Each run gets its own process, so every import is a cold one. The ingest output is swallowed.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_mode(args.run, args.csv, args.weapons_dir, args.baseline_dir)
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        csv_path = os.path.join(temp_dir, "range-output.csv")
+        baseline_dir = os.path.join(temp_dir, "baseline")
+        write_baseline_script(args.baseline_rev, baseline_dir)
+        with contextlib.redirect_stdout(io.StringIO()):
+            make_range_csv(os.path.join(args.data_dir, "range_test_iterations"), csv_path)
+
+        print(f"{'mode':<10}{'import (s)':>12}{'run (s)':>10}{'total (s)':>12}{'changes':>10}")
+        results = {}
+        for mode in MODES:
+            runs = []
+            for _ in range(args.repeat):
+                # A fresh copy every run, so both paths write the same changes
+                weapons_dir = os.path.join(temp_dir, "weapons")
+                shutil.rmtree(weapons_dir, ignore_errors=True)
+                shutil.copytree(os.path.join(args.data_dir, "weapons"), weapons_dir)
+
+                start = time.perf_counter()
+                output = subprocess.run([sys.executable, __file__, "-d", args.data_dir, "--run", mode, "--csv", csv_path, "--weapons_dir", weapons_dir, "--baseline_dir", baseline_dir], check=True, capture_output=True, text=True).stdout
+                result = json.loads(output)
+                result["totalSeconds"] = time.perf_counter() - start
+                runs.append(result)
+
+            median = {key: sorted(run[key] for run in runs)[len(runs) // 2] for key in ["importSeconds", "runSeconds", "totalSeconds"]}
+            median["changes"] = runs[0]["changes"]
+            results[mode] = median
+            print(f"{mode:<10}{median['importSeconds']:>12.3f}{median['runSeconds']:>10.3f}{median['totalSeconds']:>12.3f}{median['changes']:>10}")
+
+    if results["baseline"]["changes"] != results["csv"]["changes"]:
+        print(f"WARNING: baseline made {results['baseline']['changes']} changes and csv {results['csv']['changes']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
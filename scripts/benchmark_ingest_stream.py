@@ -0,0 +1,94 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ingest = importlib.import_module("ingest-abilities-override")
+
+MODES = ["load", "stream"]
+
+def peak_rss_kb() -> int:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def run_mode(mode, input_json):
+    """Parse every row the way ingest-abilities-override does, in this process."""
+    base_defaults = {}
+    attack_defaults = {}
+    weapon_defaults = {}
+    weapons = {}
+
+    start = time.perf_counter()
+    rows = ingest.stream_rows(input_json) if mode == "stream" else ingest.fetch_data(input_json)[0]["Rows"].items()
+    for name, item in rows:
+        ingest.process_item(name, item, base_defaults, attack_defaults, weapon_defaults, weapons)
+    seconds = time.perf_counter() - start
+
+    return {"mode": mode, "seconds": seconds, "peakRssKb": peak_rss_kb(), "weapons": len(weapons)}
+
+def make_scaled_input(input_json, scale, output_path):
+    """Copy the data table with every weapon row repeated scale times under a new weapon name."""
+    data = ingest.fetch_data(input_json)
+    rows = {}
+    for name, item in data[0]["Rows"].items():
+        if name.startswith("Default"):
+            rows[name] = item
+            continue
+        for i in range(scale):
+            parts = name.split(".")
+            parts[0] = parts[0] + "Copy" + str(i) if i > 0 else parts[0]
+            rows[".".join(parts)] = item
+    data[0]["Rows"] = rows
+
+    with open(output_path, "w") as f:
+        json.dump(data, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak RSS and wall time of loading vs streaming AbilitiesOverride.json")
+    parser.add_argument("-i", "--input_json", required=True, help="Path to AbilitiesOverride.json")
+    parser.add_argument("--scale", type=int, default=1, help="Repeat every weapon this many times to simulate a larger export")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode, the fastest is reported")
+    parser.add_argument("--run", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        # Each mode runs in its own process so peak RSS isn't shared between them.
+        # The ingest warnings are swallowed so only the result reaches the parent.
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_mode(args.run, args.input_json)
+        print(json.dumps(result))
+        return
+
+    input_json = args.input_json
+    temp_dir = None
+    if args.scale > 1:
+        temp_dir = tempfile.TemporaryDirectory()
+        input_json = os.path.join(temp_dir.name, "AbilitiesOverride.json")
+        make_scaled_input(args.input_json, args.scale, input_json)
+
+    size_mb = os.path.getsize(input_json) / 1024 / 1024
+    print(f"Input: {input_json} ({size_mb:.1f} MB)")
+    print(f"{'mode':<8}{'seconds':>10}{'peak rss (MB)':>16}{'weapons':>10}")
+
+    for mode in MODES:
+        results = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, __file__, "-i", input_json, "--run", mode], check=True, capture_output=True, text=True).stdout
+            results.append(json.loads(output))
+        best = min(results, key=lambda r: r["seconds"])
+        peak = max(r["peakRssKb"] for r in results)
+        print(f"{mode:<8}{best['seconds']:>10.3f}{peak / 1024:>16.1f}{best['weapons']:>10}")
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+if __name__ == '__main__':
+    main()
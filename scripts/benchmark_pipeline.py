@@ -0,0 +1,202 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import generate_matchups
+import process_range_save
+from benchmark_ingest_stream import peak_rss_kb
+from synthetic_data import write_synthetic_data
+
+ingest_abilities = importlib.import_module("ingest-abilities-override")
+ingest_ranges = importlib.import_module("ingest-range-data")
+
+# Bump when the stages measure something different, results from older versions aren't compared
+RESULTS_VERSION = 2
+
+DEFAULT_SIZES = [70, 500, 2000]
+
+# Each stage gets the paths of the generated data and returns the call to time. Everything the stage
+# needs but doesn't do itself (its input, already parsed) is prepared before that and isn't timed.
+
+def setup_abilities_parse(paths: Dict[str, str], workers: int) -> Callable[[], None]:
+    """Reading the data table and applying the attack defaults."""
+    return lambda: ingest_abilities.read_weapons(paths["input_json"])
+
+def setup_abilities_merge(paths: Dict[str, str], workers: int) -> Callable[[], None]:
+    """deep_merge of every ingested weapon into its weapon file, and the derived stats."""
+    weapons = ingest_abilities.read_weapons(paths["input_json"])
+    return lambda: ingest_abilities.merge_weapons(weapons, paths["weapons_dir"], {}, {}, {})
+
+def setup_range_process(paths: Dict[str, str], workers: int) -> Callable[[], None]:
+    """process_directory over the range saves."""
+    return lambda: process_range_save.process_directory(paths["range_dir"], workers)
+
+def setup_range_ingest(paths: Dict[str, str], workers: int) -> Callable[[], None]:
+    """Applying the average ranges to the weapon files."""
+    rows = process_range_save.range_rows(process_range_save.process_directory(paths["range_dir"]))
+    ingest_ranges.changelog.clear()
+    return lambda: ingest_ranges.update_documents_with_ranges(rows, paths["weapons_dir"], {}, {}, {})
+
+def setup_matchups(paths: Dict[str, str], workers: int) -> Callable[[], None]:
+    """calculate_matchups over the whole roster."""
+    weapons = generate_matchups.load_weapons(paths["weapons_dir"] + "/")
+    return lambda: generate_matchups.calculate_matchups(weapons, workers)
+
+STAGES = {
+    "abilities_parse": setup_abilities_parse,
+    "abilities_merge": setup_abilities_merge,
+    "range_process": setup_range_process,
+    "range_ingest": setup_range_ingest,
+    "matchups": setup_matchups,
+}
+
+def run_stage(stage: str, paths: Dict[str, str], workers: int, measure: str) -> Dict:
+    """
+    Time one stage in this process, or with measure "memory" trace the peak of what it allocates on top of its setup.
+    Tracing slows the stage down, so the two are separate runs. Worker processes aren't traced.
+    The peak RSS of the process is kept for reference, it's mostly the interpreter, the imports and the setup.
+    """
+    # The scripts print a line per weapon, which would be timed too and would reach the parent
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = STAGES[stage](paths, workers)
+        if measure == "memory":
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return {"peakKb": peak / 1024, "processPeakRssKb": peak_rss_kb()}
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+    return {"seconds": seconds}
+
+def data_paths(data_dir: str, size: int, saves: int, seed: int) -> Dict[str, str]:
+    """Synthetic data for size weapons, generated the first time it's asked for."""
+    output_dir = os.path.join(data_dir, f"{size}-weapons-{saves}-saves-seed-{seed}")
+    if not os.path.isdir(output_dir):
+        print(f"Generating {size} synthetic weapons in {output_dir}")
+        return write_synthetic_data(output_dir, size, saves, seed)
+    return {
+        "input_json": os.path.join(output_dir, "AbilitiesOverride.json"),
+        "weapons_dir": os.path.join(output_dir, "weapons"),
+        "range_dir": os.path.join(output_dir, "range_test_iterations"),
+    }
+
+def benchmark(stages: List[str], sizes: List[int], data_dir: str, saves: int, seed: int, repeat: int, workers: int) -> List[Dict]:
+    results = []
+    for size in sizes:
+        paths = data_paths(data_dir, size, saves, seed)
+        for stage in stages:
+            # Every run gets its own process, so nothing an earlier one cached or imported is counted
+            command = [sys.executable, __file__, "--run", stage, "--paths", json.dumps(paths), "-j", str(workers)]
+            runs = [json.loads(subprocess.run(command, check=True, capture_output=True, text=True).stdout) for _ in range(repeat)]
+            memory = json.loads(subprocess.run(command + ["--measure", "memory"], check=True, capture_output=True, text=True).stdout)
+            results.append({
+                "stage": stage,
+                "weapons": size,
+                "seconds": min(run["seconds"] for run in runs),
+                "peakMb": memory["peakKb"] / 1024,
+                "processPeakRssMb": memory["processPeakRssKb"] / 1024,
+            })
+            print_result(results[-1])
+    return results
+
+def print_result(result: Dict, baseline: Optional[Dict] = None):
+    line = f"{result['stage']:<18}{result['weapons']:>8}{result['seconds']:>10.3f}{result['peakMb']:>12.2f}{result['processPeakRssMb']:>12.1f}"
+    if baseline is not None:
+        line += f"{baseline['seconds']:>12.3f}{change(result, baseline, 'seconds'):>+9.1%}{baseline['peakMb']:>12.2f}{change(result, baseline, 'peakMb'):>+9.1%}"
+    print(line)
+
+def change(result: Dict, baseline: Dict, key: str) -> float:
+    return result[key] / baseline[key] - 1 if baseline[key] > 0 else 0.0
+
+def load_results(path: str) -> Dict:
+    with open(path) as f:
+        results = json.load(f)
+    if results.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{path} is from a different version of the benchmark")
+    return results
+
+def save_results(path: str, results: List[Dict], args):
+    with open(path, "w") as f:
+        json.dump({
+            "version": RESULTS_VERSION,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "saves": args.saves,
+            "seed": args.seed,
+            "workers": args.workers,
+            "results": results,
+        }, f, indent=2)
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    """Print every result next to its baseline. Returns the ones that got slower or bigger by more than threshold."""
+    baseline_results = {(result["stage"], result["weapons"]): result for result in baseline["results"]}
+    print(f"\n{'stage':<18}{'weapons':>8}{'seconds':>10}{'peak (MB)':>12}{'rss (MB)':>12}{'baseline s':>12}{'change':>9}{'base MB':>12}{'change':>9}")
+    regressions = []
+    for result in results:
+        previous = baseline_results.get((result["stage"], result["weapons"]))
+        if previous is None:
+            print_result(result)
+            continue
+        print_result(result, previous)
+        if change(result, previous, "seconds") > threshold or change(result, previous, "peakMb") > threshold:
+            regressions.append(result)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark wall time and peak memory allocated by every pipeline stage on synthetic rosters")
+    parser.add_argument("-n", "--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma separated roster sizes, from 70 up to 10000 weapons")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma separated stages to run, out of {', '.join(STAGES)}")
+    parser.add_argument("-o", "--output", help="Where to write the results json")
+    parser.add_argument("-b", "--baseline", help="Results json of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown or memory growth over the baseline, as a fraction, that counts as a regression")
+    parser.add_argument("--data_dir", help="Where to keep the synthetic data between runs. A temporary directory when not given")
+    parser.add_argument("--saves", type=int, default=4, help="Number of range test saves to generate")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage and size, the fastest is reported")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Workers passed to the stages that take them")
+    parser.add_argument("--run", choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--paths", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", choices=["time", "memory"], default="time", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_stage(args.run, json.loads(args.paths), args.workers, args.measure)))
+        return
+
+    stages = args.stages.split(",")
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"Unknown stage {stage}, expected one of {', '.join(STAGES)}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    baseline = load_results(args.baseline) if args.baseline else None
+
+    temp_dir = tempfile.TemporaryDirectory() if args.data_dir is None else None
+    data_dir = temp_dir.name if temp_dir is not None else args.data_dir
+
+    print(f"{'stage':<18}{'weapons':>8}{'seconds':>10}{'peak (MB)':>12}{'rss (MB)':>12}")
+    results = benchmark(stages, sizes, data_dir, args.saves, args.seed, args.repeat, args.workers)
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+    if args.output:
+        save_results(args.output, results, args)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if len(regressions) > 0:
+            sys.exit(f"{len(regressions)} results regressed by more than {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import argparse
+import copy
+import gc
+import json
+import os
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from generate_matchups import calculate_damage_output, calculate_matchup, calculate_stamina_damage_output
+from matchup_engine import damage_output_multiplier
+from weapon_model import Weapon, load_roster
+from weapon_store import is_weapon_document, read_weapons_dir
+
+def allocated(build: Callable):
+    """(result, bytes still allocated by it) of build()."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (result, size)
+
+def best_seconds(call: Callable, repeat: int = 5) -> float:
+    """Fastest of repeat calls, without tracemalloc slowing them down."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+def dict_copy_and_scale(weapon: Dict, other_weapon: Dict):
+    """What calculate_matchup does to a pair before comparing them."""
+    weapon = copy.deepcopy(weapon)
+    other_weapon = copy.deepcopy(other_weapon)
+    calculate_damage_output(weapon)
+    calculate_damage_output(other_weapon)
+    calculate_stamina_damage_output(weapon, other_weapon)
+    return (weapon, other_weapon)
+
+def model_copy_and_scale(weapon: Weapon, other_weapon: Weapon):
+    """dict_copy_and_scale on the model, one array copy and two array multiplies per weapon."""
+    (copied, other_copied) = (weapon.copy(), other_weapon.copy())
+    copied.scale("damage", damage_output_multiplier(weapon))
+    other_copied.scale("damage", damage_output_multiplier(other_weapon))
+    copied.scale("staminaDamage", (100 - (other_weapon.staminaDamageNegation or 0)) / 100)
+    other_copied.scale("staminaDamage", (100 - (weapon.staminaDamageNegation or 0)) / 100)
+    return (copied, other_copied)
+
+def model_copy_and_scale_scratch(weapon: Weapon, other_weapon: Weapon):
+    """model_copy_and_scale, leaving the pool as it was like calculate_matchup does. The copies can't be read after."""
+    with weapon.pool.scratch():
+        model_copy_and_scale(weapon, other_weapon)
+
+def time_pairs(copy_and_scale: Callable, weapons: List, pairs: int) -> float:
+    """Seconds per pair, over the first pairs pairs of the roster."""
+    start = time.perf_counter()
+    for n in range(pairs):
+        copy_and_scale(weapons[n % len(weapons)], weapons[(n * 7 + 1) % len(weapons)])
+    return (time.perf_counter() - start) / pairs
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory, copy-and-scale time and round trip of weapon_model.Weapon against the weapon dicts")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "weapons"), help="Path to the weapons directory")
+    parser.add_argument("--pairs", type=int, default=5000, help="Number of weapon pairs to copy and scale")
+    parser.add_argument("-o", "--output", help="Where to write the results json")
+    args = parser.parse_args()
+
+    ((documents, _), dict_bytes) = allocated(lambda: read_weapons_dir(args.weapons_dir))
+    (roster, model_bytes) = allocated(lambda: load_roster(args.weapons_dir))
+    dict_seconds = best_seconds(lambda: read_weapons_dir(args.weapons_dir))
+    model_seconds = best_seconds(lambda: load_roster(args.weapons_dir))
+    (models, formats) = (roster.weapons, roster.formats)
+    # Loading again into the same pool only adds the weapons, the layouts and values are already there
+    weapon_bytes = allocated(lambda: load_roster(args.weapons_dir, roster.pool))[1]
+
+    # Same files on both sides, read_weapons_dir also keeps the ones that aren't weapons
+    documents = {file: document for file, document in documents.items() if is_weapon_document(document)}
+    dict_bytes = allocated(lambda: copy.deepcopy(documents))[1]
+    round_trip_mismatches = 0
+    for file, weapon in models.items():
+        with open(os.path.join(args.weapons_dir, file), "r", newline="") as f:
+            if weapon.dumps(formats[file]).replace("\n", formats[file]["newline"]) != f.read():
+                round_trip_mismatches += 1
+
+    files = [file for file in sorted(models) if "damageType" in documents[file]]
+    dict_pair_seconds = time_pairs(dict_copy_and_scale, [documents[file] for file in files], args.pairs)
+    pool_size = roster.pool.size
+    model_pair_seconds = time_pairs(model_copy_and_scale_scratch, [models[file] for file in files], args.pairs)
+    dict_matchup_seconds = time_pairs(calculate_matchup, [documents[file] for file in files], args.pairs)
+    model_matchup_seconds = time_pairs(calculate_matchup, [models[file] for file in files], args.pairs)
+    # Every copy was scaled in a scratch, none of the numbers they added are left
+    pool_growth = roster.pool.size - pool_size
+
+    (scale_mismatches, matchup_mismatches) = (0, 0)
+    for n in range(min(args.pairs, len(files) ** 2)):
+        (a, b) = (files[n % len(files)], files[(n * 7 + 1) % len(files)])
+        expected = dict_copy_and_scale(documents[a], documents[b])
+        with models[a].pool.scratch():
+            if json.dumps(expected) != json.dumps([weapon.to_document() for weapon in model_copy_and_scale(models[a], models[b])]):
+                scale_mismatches += 1
+        (expected, matchup) = (calculate_matchup(documents[a], documents[b]), calculate_matchup(models[a], models[b]))
+        if expected != matchup or type(expected) != type(matchup):
+            matchup_mismatches += 1
+
+    results = {
+        "weapons": len(models),
+        "dictBytesPerWeapon": dict_bytes / len(models),
+        "modelBytesPerWeapon": model_bytes / len(models),
+        "modelSharedBytes": model_bytes - weapon_bytes,
+        "modelWeaponBytes": weapon_bytes / len(models),
+        "dictLoadSeconds": dict_seconds,
+        "modelLoadSeconds": model_seconds,
+        "dictCopyAndScaleUs": dict_pair_seconds * 1e6,
+        "modelCopyAndScaleUs": model_pair_seconds * 1e6,
+        "dictMatchupUs": dict_matchup_seconds * 1e6,
+        "modelMatchupUs": model_matchup_seconds * 1e6,
+        "poolGrowth": pool_growth,
+        "roundTripMismatches": round_trip_mismatches,
+        "scaleMismatches": scale_mismatches,
+        "matchupMismatches": matchup_mismatches,
+    }
+    print(f"{'':<22}{'dicts':>12}{'model':>12}{'ratio':>8}")
+    print(f"{'bytes per weapon':<22}{results['dictBytesPerWeapon']:>12.0f}{results['modelBytesPerWeapon']:>12.0f}{results['dictBytesPerWeapon'] / results['modelBytesPerWeapon']:>7.1f}x")
+    print(f"{'  of which per weapon':<22}{'':>12}{results['modelWeaponBytes']:>12.0f}{results['dictBytesPerWeapon'] / results['modelWeaponBytes']:>7.1f}x")
+    print(f"{'  shared by the roster':<22}{'':>12}{results['modelSharedBytes']:>12.0f}")
+    print(f"{'copy and scale (us)':<22}{results['dictCopyAndScaleUs']:>12.1f}{results['modelCopyAndScaleUs']:>12.1f}{results['dictCopyAndScaleUs'] / results['modelCopyAndScaleUs']:>7.1f}x")
+    print(f"{'calculate_matchup (us)':<22}{results['dictMatchupUs']:>12.1f}{results['modelMatchupUs']:>12.1f}{results['dictMatchupUs'] / results['modelMatchupUs']:>7.1f}x")
+    print(f"{'load (ms)':<22}{dict_seconds * 1000:>12.1f}{model_seconds * 1000:>12.1f}{dict_seconds / model_seconds:>7.1f}x")
+    print(f"{len(models)} weapons, {round_trip_mismatches} round trip mismatches, {scale_mismatches} copy and scale mismatches, {matchup_mismatches} matchup mismatches")
+    print(f"The pool grew by {pool_growth} numbers over {args.pairs} copies and scales and {args.pairs} matchups")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
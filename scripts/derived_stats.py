@@ -1,3 +1,8 @@
+from collections import Counter
+from operator import itemgetter
+
+import numpy as np
+
 BASE_STAMINA_DAMAGE_MULT = 0.3;
 
 def stamina_damage(damage: int, damage_type: str) -> float:
@@ -76,3 +81,170 @@ def make_average_attack(weapon):
 
     weapon["attacks"]["average"] = average_attack
     
+
+# Batch versions, for deriving the stats of a whole roster at once. They give exactly the same results as the
+# per weapon functions above: values are gathered into arrays, combined in the same order, and written back.
+
+STAMINA_DAMAGE_TYPE_MULTS = {"chop": 1.1, "blunt": 1.25, "cut": 1.0}
+SWING_ATTACKS = ["slash", "overhead", "stab"]
+AVERAGE_IGNORE_KEYS = ["cleaveOverride", "damageTypeOverride"]
+
+# Exact type check, like make_average_attack. bools and numeric strings don't count
+NUMBER_TYPES = (float, int)
+
+def damage_type_mult(damage_type):
+    return STAMINA_DAMAGE_TYPE_MULTS.get(damage_type.lower()) if isinstance(damage_type, str) else None
+
+def make_stamina_damage_batch(weapons):
+    """make_stamina_damage for every weapon in one array pass."""
+    attacks = []
+    damages = []
+    mults = []
+    for weapon in weapons:
+        damage_type = weapon["damageType"]
+        weapon_mult = damage_type_mult(damage_type)
+        for attack_name, attack_data in weapon["attacks"].items():
+            if attack_name == "average":
+                continue
+            for attack in ((attack_data["light"], attack_data["heavy"]) if attack_name in SWING_ATTACKS else (attack_data,)):
+                if "damageTypeOverride" in attack:
+                    attack_damage_type = attack["damageTypeOverride"]
+                    mult = damage_type_mult(attack_damage_type)
+                else:
+                    (attack_damage_type, mult) = (damage_type, weapon_mult)
+                damage = attack["damage"]
+                if mult is None or type(damage) not in NUMBER_TYPES:
+                    # Anything unusual goes through the scalar path, which raises the same errors it always did
+                    attack["staminaDamage"] = stamina_damage(damage, attack_damage_type)
+                    continue
+                attacks.append(attack)
+                damages.append(damage)
+                mults.append(mult)
+
+    # Same operation order as stamina_damage, multiplying a cut attack by 1.0 changes nothing
+    values = (np.array(damages, dtype=np.float64) * BASE_STAMINA_DAMAGE_MULT) * np.array(mults, dtype=np.float64)
+    for attack, value in zip(attacks, values.tolist()):
+        attack["staminaDamage"] = value
+
+def average_layout(weapon):
+    """
+    Keys and value types of the three swings. Weapons with the same layout are averaged together,
+    so every type check is done once per layout instead of once per value.
+    """
+    swings = [weapon["attacks"][attack] for attack in SWING_ATTACKS]
+    return ("range" in swings[0],) + tuple(
+        (tuple(swing["light"]), tuple(map(type, swing["light"].values())), tuple(swing["heavy"]), tuple(map(type, swing["heavy"].values())), type(swing.get("range")), type(swing.get("altRange")))
+        for swing in swings
+    )
+
+def exact_in_float(values) -> bool:
+    """
+    False if any value is too big for float64 sums to match make_average_attack,
+    which adds ints exactly before dividing.
+    """
+    return not (np.abs(values) >= 2 ** 53).any()
+
+def row_getter(keys):
+    """itemgetter that always returns a tuple, even for a single key."""
+    if len(keys) == 1:
+        return lambda values: (values[keys[0]],)
+    return itemgetter(*keys)
+
+def average_group(layout, weapons, non_numeric) -> bool:
+    """
+    make_average_attack for weapons that all have the given layout.
+    Returns False without touching them when the layout has something only make_average_attack handles
+    (a heavy stat that's missing or not a number, a range that isn't a number).
+    Non numeric light values are collected per stat in non_numeric.
+    """
+    has_range = layout[0]
+    if has_range and not all(range_type in NUMBER_TYPES for swing in layout[1:] for range_type in swing[4:]):
+        return False
+
+    stats = {}
+    swing_columns = []
+    for (light_keys, light_types, heavy_keys, heavy_types, _, _) in layout[1:]:
+        heavy_type_of = dict(zip(heavy_keys, heavy_types))
+        numeric = []
+        skipped = []
+        for (stat, light_type) in zip(light_keys, light_types):
+            if stat in AVERAGE_IGNORE_KEYS:
+                continue
+            # make_average_attack reads the heavy value before checking the light one
+            if stat not in heavy_type_of:
+                return False
+            if light_type not in NUMBER_TYPES:
+                skipped.append(stat)
+                continue
+            if heavy_type_of[stat] not in NUMBER_TYPES:
+                return False
+            numeric.append(stat)
+            stats.setdefault(stat, len(stats))
+        swing_columns.append((numeric, skipped))
+
+    skipped_values = {}
+    light_sums = np.zeros((len(weapons), len(stats)), dtype=np.float64)
+    heavy_sums = np.zeros_like(light_sums)
+    range_sums = np.zeros((len(weapons), 2), dtype=np.float64)
+    # Summed one swing at a time in the same order as make_average_attack. Adding 0 for a stat a swing doesn't
+    # have leaves the sum unchanged, it starts at 0 so it can't be -0.0.
+    for (attack, (numeric, skipped)) in zip(SWING_ATTACKS, swing_columns):
+        swings = [weapon["attacks"][attack] for weapon in weapons]
+        if len(skipped) > 0:
+            get_row = row_getter(skipped)
+            for (stat, values) in zip(skipped, zip(*[get_row(swing["light"]) for swing in swings])):
+                skipped_values.setdefault(stat, []).extend(values)
+        if len(numeric) > 0:
+            columns = [stats[stat] for stat in numeric]
+            get_row = row_getter(numeric)
+            light = np.array([get_row(swing["light"]) for swing in swings], dtype=np.float64)
+            heavy = np.array([get_row(swing["heavy"]) for swing in swings], dtype=np.float64)
+            if not exact_in_float(light) or not exact_in_float(heavy):
+                return False
+            light_sums[:, columns] += light
+            heavy_sums[:, columns] += heavy
+        if has_range:
+            ranges = np.array([(swing["range"], swing["altRange"]) for swing in swings], dtype=np.float64)
+            if not exact_in_float(ranges):
+                return False
+            range_sums += ranges
+
+    for (stat, values) in skipped_values.items():
+        non_numeric.setdefault(stat, []).extend(values)
+
+    stat_names = list(stats)
+    for (weapon, light, heavy, ranges) in zip(weapons, (light_sums / 3).tolist(), (heavy_sums / 3).tolist(), (range_sums / 3).tolist()):
+        average_attack = {"light": dict(zip(stat_names, light)), "heavy": dict(zip(stat_names, heavy))}
+        if has_range:
+            (average_attack["range"], average_attack["altRange"]) = ranges
+        weapon["attacks"]["average"] = average_attack
+    return True
+
+def make_average_attack_batch(weapons):
+    """
+    make_average_attack for every weapon, summed as arrays of weapon x stat per layout.
+    Non numeric stats are reported once per stat instead of once per value.
+    """
+    groups = {}
+    for weapon in weapons:
+        groups.setdefault(average_layout(weapon), []).append(weapon)
+
+    non_numeric = {}
+    for (layout, group) in groups.items():
+        if not average_group(layout, group, non_numeric):
+            for weapon in group:
+                make_average_attack(weapon)
+
+    for (stat, values) in non_numeric.items():
+        try:
+            counts = Counter(values).items()
+        except TypeError:
+            counts = [(value, 1) for value in values]
+        unconvertible = []
+        for (value, count) in counts:
+            try:
+                float(value)
+            except (TypeError, ValueError):
+                unconvertible.extend([value] * count)
+        if len(unconvertible) > 0:
+            print(f"WARNING: {stat} has type {type(unconvertible[0])}, with value {unconvertible[0]} ({len(unconvertible)} values left out of the average)")
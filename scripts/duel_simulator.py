@@ -0,0 +1,310 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import profiling
+from common import write_dicts_to_csv
+from generate_matchups import load_weapons
+from kill_matrix import SRC_DIR, Target, load_targets
+
+# Attacks a fighter picks from, each as a light and a heavy
+DUEL_ATTACKS = ["slash", "overhead", "stab"]
+DUEL_VARIANTS = ["light", "heavy"]
+OPTION_STATS = ["windup", "release", "recovery", "combo", "riposte", "damage", "staminaDamage"]
+# Range of the attack is packed after them, the shorter one has to close the distance first
+TABLE_STATS = OPTION_STATS + ["reach"]
+(WINDUP, RELEASE, RECOVERY, COMBO, RIPOSTE, DAMAGE, STAMINA_DAMAGE, REACH) = range(len(TABLE_STATS))
+
+# Centimeters per millisecond the shorter weapon spends closing the reach difference
+CLOSING_SPEED = 0.3
+PARRY_CHANCE = 0.5
+# Duels still going after this many exchanges are draws
+MAX_EXCHANGES = 200
+
+# Finished duels are dropped from the arrays once they're this share of them
+COMPACT_FINISHED = 0.25
+
+# Work is split into fixed blocks of pairs and trials, each with its own random stream,
+# so the merged result only depends on the seed, never on the number of workers
+PAIRS_PER_TASK = 16
+TRIALS_PER_TASK = 8192
+
+WINS, DRAWS, LOSSES = 0, 1, 2
+
+@dataclass
+class DuelTable:
+    """Every weapon's attack options, padded to the weapon with the most."""
+    names: List[str]
+    option_count: np.ndarray
+    # (weapon x option x TABLE_STATS), float32 so each exchange gathers half as much
+    options: np.ndarray
+    # Multiplier on stamina damage the weapon takes when parrying, (100 - staminaDamageNegation) / 100
+    stamina_multiplier: np.ndarray
+
+@dataclass
+class DuelSettings:
+    hp: float
+    stamina: float
+    parry_chance: float = PARRY_CHANCE
+    closing_speed: float = CLOSING_SPEED
+    max_exchanges: int = MAX_EXCHANGES
+
+def is_number(value) -> bool:
+    return type(value) in [int, float]
+
+def pack_duel_table(weapons: List[Dict], target: Target) -> DuelTable:
+    """
+    Damage is scaled by the target's multiplier for the attack's damage type, both fighters play that class.
+    Options missing a stat are left out, weapons left with none can't duel and are skipped.
+    """
+    options = []
+    for weapon in weapons:
+        weapon_options = []
+        for attack_name in DUEL_ATTACKS:
+            attack = weapon["attacks"].get(attack_name)
+            if attack is None or not is_number(attack.get("range")):
+                continue
+            for variant in DUEL_VARIANTS:
+                stats = attack[variant]
+                if not all(is_number(stats.get(stat)) for stat in OPTION_STATS):
+                    continue
+                option = {stat: stats[stat] for stat in OPTION_STATS}
+                option["damage"] *= target.damage_multiplier(stats.get("damageTypeOverride", weapon.get("damageType")))
+                option["reach"] = attack["range"]
+                weapon_options.append(option)
+        if len(weapon_options) == 0:
+            print(f"WARNING: {weapon['name']} has no complete slash, overhead or stab, it's left out of the duels")
+            continue
+        options.append((weapon, weapon_options))
+
+    width = max((len(weapon_options) for (_, weapon_options) in options), default=0)
+    packed = np.zeros((len(options), width, len(TABLE_STATS)), dtype=np.float32)
+    for w, (_, weapon_options) in enumerate(options):
+        for o, option in enumerate(weapon_options):
+            packed[w, o] = [option[stat] for stat in TABLE_STATS]
+
+    return DuelTable(
+        [weapon["name"] for (weapon, _) in options],
+        np.array([len(weapon_options) for (_, weapon_options) in options], dtype=np.intp),
+        packed,
+        np.array([(100 - weapon.get("staminaDamageNegation", 0)) / 100 for (weapon, _) in options], dtype=np.float32),
+    )
+
+def simulate_pairs(table: DuelTable, pairs: np.ndarray, trials: int, settings: DuelSettings, rng: np.random.Generator) -> np.ndarray:
+    """
+    (pair x [wins, draws, losses]) of the first weapon of each pair over trials duels, all played at once.
+
+    Each exchange both fighters start a random attack. Whoever's hit lands first (windup, or riposte right after
+    a parry, plus the time to close any reach difference) strikes, and the other parries with parry_chance or gets hit.
+    Landing a hit leaves the striker release + combo behind and the one hit the striker's release. A parried striker is
+    stuck in recovery while the parrier ripostes, unless the staminaDamage emptied the parrier's stamina, then the hit
+    goes through. Hits landing at the same time trade. Duels end when someone's hp runs out.
+    """
+    width = table.options.shape[1]
+    options = table.options.reshape(-1, len(TABLE_STATS))
+    counts = np.zeros((len(pairs), 3), dtype=np.int64)
+
+    pair = np.repeat(np.arange(len(pairs)), trials)
+    fighters = pairs[pair]
+    # Per duel copies of everything looked up by weapon, compacted along with the duel state
+    state = {
+        "pair": pair,
+        "first_option": fighters * width,
+        "option_count": table.option_count[fighters].astype(np.float32),
+        "stamina_multiplier": table.stamina_multiplier[fighters],
+        "hp": np.full((len(pair), 2), settings.hp, dtype=np.float32),
+        "stamina": np.full((len(pair), 2), settings.stamina, dtype=np.float32),
+        "offset": np.zeros((len(pair), 2), dtype=np.float32),
+        "riposting": np.zeros((len(pair), 2), dtype=bool),
+        "live": np.ones(len(pair), dtype=bool),
+    }
+    sides = np.arange(2)[None, :]
+
+    for _ in range(settings.max_exchanges):
+        count = len(state["pair"])
+        if count == 0:
+            break
+        (hp, stamina, live) = (state["hp"], state["stamina"], state["live"])
+        draws = rng.random((count, 3), dtype=np.float32)
+        choice = state["first_option"] + (draws[:, :2] * state["option_count"]).astype(np.intp)
+        stats = options[choice]
+        opponent = stats[:, ::-1]
+
+        closing = np.maximum(opponent[:, :, REACH] - stats[:, :, REACH], 0) / settings.closing_speed
+        time = state["offset"] + np.where(state["riposting"], stats[:, :, RIPOSTE], stats[:, :, WINDUP]) + closing
+
+        trade = time[:, 0] == time[:, 1]
+        striker = (time[:, 1] < time[:, 0]).astype(np.intp)
+        striker_side = sides == striker[:, None]
+
+        parried = ~trade & (draws[:, 2] < settings.parry_chance)
+        parrying = parried[:, None] & ~striker_side
+        stamina -= np.where(parrying, opponent[:, :, STAMINA_DAMAGE] * state["stamina_multiplier"], 0)
+        broken = parrying & (stamina <= 0)
+        stamina[broken] = settings.stamina
+        parried &= ~broken.any(axis=1)
+
+        lands = ~trade & ~parried
+        hit = trade[:, None] | (lands[:, None] & ~striker_side)
+        hp -= np.where(hit, opponent[:, :, DAMAGE], 0)
+
+        offset = np.where(hit, opponent[:, :, RELEASE], 0)
+        offset = np.where(lands[:, None] & striker_side, stats[:, :, RELEASE] + stats[:, :, COMBO], offset)
+        state["offset"] = np.where(parried[:, None] & striker_side, stats[:, :, RECOVERY], offset)
+        state["riposting"] = parried[:, None] & ~striker_side
+
+        dead = hp <= 0
+        finished = live & (dead[:, 0] | dead[:, 1])
+        if finished.any():
+            outcome = np.where(dead[:, 0], np.where(dead[:, 1], DRAWS, LOSSES), WINS)[finished]
+            np.add.at(counts, (state["pair"][finished], outcome), 1)
+            live &= ~finished
+            # Finished duels keep being played until there are enough of them to be worth copying everything else
+            if np.count_nonzero(live) <= count * (1 - COMPACT_FINISHED):
+                state = {key: value[live] for key, value in state.items()}
+
+    # Out of exchanges
+    np.add.at(counts, (state["pair"][state["live"]], DRAWS), 1)
+    return counts
+
+def duel_tasks(pair_count: int, trials: int) -> List[Tuple[int, int, int, int]]:
+    """(pair block, trial chunk, first pair, trials) of every task, laid out the same whatever the worker count."""
+    tasks = []
+    for block, start in enumerate(range(0, pair_count, PAIRS_PER_TASK)):
+        for chunk, done in enumerate(range(0, trials, TRIALS_PER_TASK)):
+            tasks.append((block, chunk, start, min(TRIALS_PER_TASK, trials - done)))
+    return tasks
+
+def run_task(table: DuelTable, pairs: np.ndarray, settings: DuelSettings, seed: int, task: Tuple[int, int, int, int]) -> Tuple[int, np.ndarray]:
+    (block, chunk, start, trials) = task
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block, chunk)))
+    return start, simulate_pairs(table, pairs[start:start + PAIRS_PER_TASK], trials, settings, rng)
+
+# Set once per worker process by _init_worker, so tasks only carry their block
+_worker_state: Optional[Tuple[DuelTable, np.ndarray, DuelSettings, int]] = None
+
+def _init_worker(table: DuelTable, pairs: np.ndarray, settings: DuelSettings, seed: int):
+    global _worker_state
+    _worker_state = (table, pairs, settings, seed)
+
+def _worker_run_task(task: Tuple[int, int, int, int]) -> Tuple[int, np.ndarray]:
+    return run_task(*_worker_state, task)
+
+def simulate_roster(table: DuelTable, trials: int, settings: DuelSettings, seed: int = 0, workers: int = 1) -> np.ndarray:
+    """
+    (weapon x weapon x [wins, draws, losses]) of the row weapon over trials duels against every other weapon.
+    Each unordered pair is simulated once and mirrored, a weapon against itself is left at 0.
+    """
+    count = len(table.names)
+    pairs = np.array([(a, b) for a in range(count) for b in range(a + 1, count)], dtype=np.intp).reshape(-1, 2)
+    tasks = duel_tasks(len(pairs), trials)
+    pair_counts = np.zeros((len(pairs), 3), dtype=np.int64)
+
+    if workers <= 1:
+        results = (run_task(table, pairs, settings, seed, task) for task in tasks)
+        for (start, counts) in results:
+            pair_counts[start:start + len(counts)] += counts
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(table, pairs, settings, seed)) as executor:
+            for (start, counts) in executor.map(_worker_run_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                pair_counts[start:start + len(counts)] += counts
+
+    matrix = np.zeros((count, count, 3), dtype=np.int64)
+    matrix[pairs[:, 0], pairs[:, 1]] = pair_counts
+    matrix[pairs[:, 1], pairs[:, 0]] = pair_counts[:, ::-1]
+    return matrix
+
+def win_probabilities(matrix: np.ndarray, confidence: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Win probability, a draw counting as half a win, and the bounds of its normal confidence interval.
+    A weapon against itself is 0.5 exactly.
+    """
+    (wins, draws, losses) = (matrix[:, :, k].astype(np.float64) for k in (WINS, DRAWS, LOSSES))
+    trials = wins + draws + losses
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = (wins + draws / 2) / trials
+        variance = (wins * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + losses * mean ** 2) / (trials - 1)
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(variance / trials)
+    mean[trials == 0] = 0.5
+    half_width[~(trials > 1)] = 0
+    return (mean, np.clip(mean - half_width, 0, 1), np.clip(mean + half_width, 0, 1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo duels between every pair of weapons, written as a win probability matrix with confidence intervals")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(SRC_DIR, "weapons"), help="Path to the weapons directory, or to a weapon store built by weapon_store.py")
+    parser.add_argument("-o", "--output", required=True, help="Where to put the results. A json matrix if it ends in .json, a csv row per pair otherwise")
+    parser.add_argument("-n", "--trials", type=int, default=10000, help="Duels per pair of weapons")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, the same seed and trials give the same results whatever the number of workers")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of processes to run the duels on")
+    parser.add_argument("-t", "--target", default="Footman", help="Class from src/all_targets.ts both fighters play, for hp, stamina and damage multipliers")
+    parser.add_argument("--parry_chance", type=float, default=PARRY_CHANCE, help="Chance the slower fighter parries instead of getting hit")
+    parser.add_argument("--confidence", type=float, default=0.95, help="Confidence level of the intervals")
+    parser.add_argument("--profile", help="Record where the time goes and write it to this path as a Chrome trace, with a text summary next to it")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    try:
+        targets = {target.name.lower(): target for target in load_targets()}
+        if args.target.lower() not in targets:
+            parser.error(f"Unknown target {args.target}, expected one of {', '.join(target.name for target in targets.values())}")
+        target = targets[args.target.lower()]
+
+        weapons_location = args.weapons_dir + "/" if args.weapons_dir[-1] != "/" and not os.path.isfile(args.weapons_dir) else args.weapons_dir
+        weapons = [weapon for weapon in load_weapons(weapons_location) if "id" in weapon]
+        with profiling.span("pack"):
+            table = pack_duel_table(weapons, target)
+
+        settings = DuelSettings(target.hp, target.stamina, args.parry_chance)
+        with profiling.span("simulate", weapons=len(table.names), trials=args.trials, workers=args.workers):
+            matrix = simulate_roster(table, args.trials, settings, args.seed, args.workers)
+        (mean, lower, upper) = win_probabilities(matrix, args.confidence)
+
+        with profiling.span("write"):
+            write_results(args.output, table.names, matrix, mean, lower, upper, args)
+            profiling.file_written(args.output)
+        print(f"Simulated {args.trials} duels for each of {len(table.names) * (len(table.names) - 1) // 2} pairs, written to {args.output}")
+    finally:
+        profiling.finish(args.profile)
+
+def write_results(path: str, names: List[str], matrix: np.ndarray, mean: np.ndarray, lower: np.ndarray, upper: np.ndarray, args):
+    if path.endswith(".json"):
+        with open(path, "w") as f:
+            json.dump({
+                "names": names,
+                "trials": args.trials,
+                "seed": args.seed,
+                "target": args.target,
+                "confidence": args.confidence,
+                "winProbability": mean.tolist(),
+                "lower": lower.tolist(),
+                "upper": upper.tolist(),
+                "draws": matrix[:, :, DRAWS].tolist(),
+            }, f, separators=(",", ":"))
+        return
+
+    rows = []
+    for i, name in enumerate(names):
+        for j, opponent in enumerate(names):
+            if i == j:
+                continue
+            rows.append({
+                "name": name,
+                "opponent": opponent,
+                "wins": int(matrix[i, j, WINS]),
+                "draws": int(matrix[i, j, DRAWS]),
+                "losses": int(matrix[i, j, LOSSES]),
+                "winProbability": float(mean[i, j]),
+                "lower": float(lower[i, j]),
+                "upper": float(upper[i, j]),
+            })
+    write_dicts_to_csv(rows, path)
+
+if __name__ == '__main__':
+    main()
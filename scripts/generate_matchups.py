@@ -2,9 +2,18 @@ import json
 import argparse
 import os
 import copy
+import itertools
 from typing import Callable
 
+import numpy as np
+
+import profiling
 from common import VALID_ATTACKS, write_dicts_to_csv
+from matchup_cache import incremental_matchup_matrix
+from matchup_engine import build_comparisons, configuration_weights, damage_output_multiplier, pack_bundle, pack_weapons, parallel_matchup_matrix, rank_weapons, sweep_average_matchups
+from weapon_bundle import open_bundle
+from weapon_model import Weapon
+from weapon_store import load_store
 
 # slashHeavy, stabHeavy, and overheadHeavy get filtered out, because after processing they are nested under the heavy key
 VALID_PROCESSED_ATTACKS = list(filter(lambda name: not name.endswith("Heavy") ,VALID_ATTACKS))
@@ -39,61 +48,250 @@ MATCHUP_ATTACK_WEIGHTS = {
 HEAVY_WEIGHT = 1
 LIGHT_WEIGHT = 1
 
+WEIGHT_GROUPS = ["stat_weights", "attack_weights", "light_weight", "heavy_weight"]
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("-w", "--weapons_dir", required=True, help="Path to the weapons directory")
+    parser.add_argument("-w", "--weapons_dir", required=True, help="Path to the weapons directory, or to a weapon store built by weapon_store.py")
     parser.add_argument("-o", "--output", required=True, help="Where to put the file")
+    parser.add_argument("-s", "--sweep", help="Path to a weight sweep json. Writes the ranking for every configuration to --output instead of the matchup table")
+    parser.add_argument("--sweep_summary", help="Where to put the per weapon rank change summary of a sweep")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of processes used to compute the matchup matrix")
+    parser.add_argument("-b", "--bundle", help="Path to a binary weapon bundle. It's rebuilt from --weapons_dir when the json files change, and mapped instead of parsing them")
+    parser.add_argument("-c", "--cache", help="Path to a matchup cache. Only weapons whose files changed since the last run are recomputed")
+    parser.add_argument("--profile", help="Record where the time goes and write it to this path as a Chrome trace, with a text summary next to it")
     args = parser.parse_args()
-    
-    weapons_location = args.weapons_dir + "/" if args.weapons_dir[-1] != "/" else args.weapons_dir
-    output_file_path = args.output
+    if args.profile:
+        profiling.enable()
 
-    weapons = []
-    weapons_files = os.listdir(weapons_location)
-    for weapon_file in weapons_files:
-        if weapon_file[-5:] != ".json":
-            continue
-
-        with open(weapons_location + weapon_file, "r") as f:
-            weapons.append(json.load(f))
-    
-    matchups = calculate_matchups(weapons)
-    write_dicts_to_csv(matchups, output_file_path, ["name"] + list(map(lambda r: r["name"], matchups)) + ["average_matchup", "winning_matchups", "losing_matchups", "tied_matchups"])
+    try:
+        run(parser, args)
+    finally:
+        profiling.finish(args.profile)
 
+def run(parser, args):
+    weapons_location = args.weapons_dir + "/" if args.weapons_dir[-1] != "/" and not os.path.isfile(args.weapons_dir) else args.weapons_dir
+    output_file_path = args.output
 
-def calculate_matchups(weapons):
+    if args.sweep:
+        try:
+            configurations = load_sweep_configurations(args.sweep)
+        except ValueError as e:
+            parser.error(str(e))
+        weapons = load_weapons(weapons_location)
+        with profiling.span("matchup", configurations=len(configurations)):
+            (rankings, summary) = calculate_weight_sweep(weapons, configurations)
+        with profiling.span("write"):
+            write_dicts_to_csv(rankings, output_file_path, sweep_ranking_keys(configurations, [weapon["name"] for weapon in weapons if "id" in weapon]))
+            profiling.file_written(output_file_path)
+            if args.sweep_summary:
+                write_dicts_to_csv(summary, args.sweep_summary)
+                profiling.file_written(args.sweep_summary)
+        return
+
+    if args.bundle:
+        with profiling.span("parse", bundle=args.bundle):
+            bundle = open_bundle(args.bundle, weapons_location)
+        with bundle, profiling.span("matchup"):
+            matchups = calculate_bundle_matchups(bundle, args.workers)
+    elif args.cache:
+        if os.path.isfile(weapons_location):
+            parser.error("--cache needs a weapons directory, not a weapon store")
+        with profiling.span("matchup", cache=args.cache):
+            (names, scores, is_float) = incremental_matchup_matrix(weapons_location, args.cache, VALID_PROCESSED_ATTACKS, list(MATCHUP_STAT_WEIGHTS), current_weight_configuration())
+            matchups = summarize_matchups(names, scores, is_float)
+    else:
+        weapons = load_weapons(weapons_location)
+        with profiling.span("matchup"):
+            matchups = calculate_matchups(weapons, args.workers)
+
+    with profiling.span("write"):
+        write_dicts_to_csv(matchups, output_file_path, ["name"] + list(map(lambda r: r["name"], matchups)) + ["average_matchup", "winning_matchups", "losing_matchups", "tied_matchups"])
+        profiling.file_written(output_file_path)
+
+def load_weapons(weapons_location):
+    with profiling.span("parse"):
+        if os.path.isfile(weapons_location):
+            profiling.file_read(weapons_location)
+            return load_store(weapons_location).weapons()
+
+        weapons = []
+        weapons_files = os.listdir(weapons_location)
+        for weapon_file in weapons_files:
+            if weapon_file[-5:] != ".json":
+                continue
+
+            with profiling.span("parse", file=weapon_file):
+                with open(weapons_location + weapon_file, "r") as f:
+                    weapons.append(json.load(f))
+                profiling.file_read(weapons_location + weapon_file)
+        return weapons
+
+def current_weight_configuration():
+    return {
+        "stat_weights": dict(MATCHUP_STAT_WEIGHTS),
+        "attack_weights": dict(MATCHUP_ATTACK_WEIGHTS),
+        "light_weight": LIGHT_WEIGHT,
+        "heavy_weight": HEAVY_WEIGHT,
+    }
+
+def make_weight_configuration(overrides):
+    """Apply a flat {path: weight} dict on top of the current constants. Paths look like "stat_weights.windup" or "heavy_weight"."""
+    configuration = current_weight_configuration()
+    for path, weight in overrides.items():
+        parts = path.split(".")
+        if parts[0] not in WEIGHT_GROUPS:
+            raise ValueError(f"Unknown weight group: {parts[0]}")
+        if len(parts) == 1:
+            configuration[parts[0]] = weight
+        elif parts[1] in configuration[parts[0]]:
+            configuration[parts[0]][parts[1]] = weight
+        else:
+            raise ValueError(f"Unknown weight: {path}")
+    return configuration
+
+def load_sweep_configurations(path):
+    """
+    A sweep json holds one of:
+      "configurations": a list of {path: weight} overrides
+      "grid": {path: [weights]}, every combination is swept
+      "random": {"samples": n, "seed": s, "weights": {path: [low, high]}}, weights are sampled uniformly
+    Weights that aren't mentioned keep their current value.
+    """
+    with open(path, "r") as f:
+        sweep = json.load(f)
+
+    if "configurations" in sweep:
+        overrides = sweep["configurations"]
+    elif "grid" in sweep:
+        paths = list(sweep["grid"].keys())
+        overrides = [dict(zip(paths, values)) for values in itertools.product(*sweep["grid"].values())]
+    elif "random" in sweep:
+        rng = np.random.default_rng(sweep["random"].get("seed"))
+        samples = sweep["random"]["samples"]
+        sampled = {path: rng.uniform(low, high, samples).tolist() for path, (low, high) in sweep["random"]["weights"].items()}
+        overrides = [{path: values[i] for path, values in sampled.items()} for i in range(samples)]
+    else:
+        raise ValueError("Sweep json needs one of configurations, grid or random")
+    if len(overrides) == 0:
+        raise ValueError("sweep has no configurations")
+
+    return [(override, make_weight_configuration(override)) for override in overrides]
+
+def sweep_ranking_keys(configurations, names):
+    """Columns of the sweep rankings: the configuration, every weight any configuration overrides, then the weapons."""
+    override_keys = []
+    for (override, _) in configurations:
+        override_keys += [path for path in override if path not in override_keys]
+    return ["configuration"] + override_keys + names
+
+def calculate_weight_sweep(weapons, configurations):
+    """
+    Rank every weapon under every weight configuration.
+    The per stat win/loss signs are computed once, each configuration is then just a matrix product.
+    Returns one ranking row per configuration and a per weapon summary of how often its rank changes.
+    """
     weapons = list(filter(lambda w : "id" in w, weapons))
-    matchups = []
-    for weapon in weapons:
-        current_matchups = {}
-        current_matchups["name"] = weapon["name"]
-        for other_weapon in weapons:
-            current_matchups[other_weapon["name"]] = calculate_matchup(weapon, other_weapon)
+    names = [weapon["name"] for weapon in weapons]
+
+    packed = pack_weapons(weapons, VALID_PROCESSED_ATTACKS, list(MATCHUP_STAT_WEIGHTS))
+    comparisons = build_comparisons(packed, MATCHUP_STAT_WEIGHTS, MATCHUP_ATTACK_WEIGHTS, LIGHT_WEIGHT, HEAVY_WEIGHT, skip_unweighted_attacks=False)
+
+    # The current constants go first so every configuration can be compared against them
+    weights = configuration_weights(packed, comparisons, [current_weight_configuration()] + [configuration for (_, configuration) in configurations])
+    ranks = rank_weapons(sweep_average_matchups(packed, comparisons, weights))
+    current_ranks = ranks[0]
+    ranks = ranks[1:]
+
+    rankings = []
+    for c, (override, _) in enumerate(configurations):
+        ranking = {"configuration": c}
+        ranking.update(override)
+        ranking.update({name: int(rank) for name, rank in zip(names, ranks[c])})
+        rankings.append(ranking)
+
+    summary = []
+    for w, name in enumerate(names):
+        weapon_ranks = ranks[:, w]
+        changes = int(np.count_nonzero(weapon_ranks != current_ranks[w]))
+        summary.append({
+            "name": name,
+            "current_rank": int(current_ranks[w]),
+            "best_rank": int(weapon_ranks.min()),
+            "worst_rank": int(weapon_ranks.max()),
+            "mean_rank": float(weapon_ranks.mean()),
+            "rank_changes": changes,
+            "rank_change_frequency": changes / len(configurations),
+        })
+    summary.sort(key=lambda x: x["current_rank"])
+
+    return (rankings, summary)
+
+def calculate_matchups(weapons, workers=1):
+    weapons = list(filter(lambda w : "id" in w, weapons))
+
+    # Stats are packed once and every pair is compared at the same time, rather than deep copying both weapons per pair
+    with profiling.span("pack"):
+        packed = pack_weapons(weapons, VALID_PROCESSED_ATTACKS, list(MATCHUP_STAT_WEIGHTS))
+        comparisons = build_comparisons(packed, MATCHUP_STAT_WEIGHTS, MATCHUP_ATTACK_WEIGHTS, LIGHT_WEIGHT, HEAVY_WEIGHT)
+    with profiling.span("matchup_matrix", weapons=len(packed.names), workers=workers):
+        scores, is_float = parallel_matchup_matrix(packed, comparisons, workers)
 
-        matchup_numbers = [v for k, v in current_matchups.items() if type(v) in [int, float]]
+    return summarize_matchups(packed.names, scores, is_float)
 
-        current_matchups["winning_matchups"] = len([v for v in matchup_numbers if v > 0.01])
-        current_matchups["losing_matchups"] = len([v for v in matchup_numbers if v < -0.01])
-        current_matchups["tied_matchups"] = len(weapons) - current_matchups["winning_matchups"] - current_matchups["losing_matchups"]
-        current_matchups["average_matchup"] = sum(matchup_numbers) / len(matchup_numbers);
+def calculate_bundle_matchups(bundle, workers=1):
+    with profiling.span("pack"):
+        packed = pack_bundle(bundle, VALID_PROCESSED_ATTACKS, list(MATCHUP_STAT_WEIGHTS))
+        comparisons = build_comparisons(packed, MATCHUP_STAT_WEIGHTS, MATCHUP_ATTACK_WEIGHTS, LIGHT_WEIGHT, HEAVY_WEIGHT)
+    with profiling.span("matchup_matrix", weapons=len(packed.names), workers=workers):
+        scores, is_float = parallel_matchup_matrix(packed, comparisons, workers)
 
-        matchups.append(current_matchups)
+    return summarize_matchups(packed.names, scores, is_float)
+
+def summarize_matchups(names, scores, is_float):
+    matchups = []
+    with profiling.span("summarize"):
+        for i, name in enumerate(names):
+            with profiling.span("summarize", weapon=name):
+                current_matchups = {}
+                current_matchups["name"] = name
+                row_scores = scores[i].tolist()
+                row_is_float = is_float[i].tolist()
+                for j, other_name in enumerate(names):
+                    current_matchups[other_name] = row_scores[j] if row_is_float[j] else int(row_scores[j])
+
+                matchup_numbers = [v for k, v in current_matchups.items() if type(v) in [int, float]]
+
+                current_matchups["winning_matchups"] = len([v for v in matchup_numbers if v > 0.01])
+                current_matchups["losing_matchups"] = len([v for v in matchup_numbers if v < -0.01])
+                current_matchups["tied_matchups"] = len(names) - current_matchups["winning_matchups"] - current_matchups["losing_matchups"]
+                current_matchups["average_matchup"] = sum(matchup_numbers) / len(matchup_numbers);
+
+                matchups.append(current_matchups)
     
     matchups.sort(key=lambda x: x["average_matchup"], reverse=True)
     return matchups
 
 def calculate_matchup(weapon, other_weapon):
-    matchup = 0
-    
+    """Matchup of two weapon dicts, or two weapon_model.Weapons."""
+    if isinstance(weapon, Weapon):
+        # Copies are an array copy each, and the numbers scaling adds to the pools are dropped once they're compared
+        with weapon.pool.scratch(), other_weapon.pool.scratch():
+            return copied_matchup(weapon.copy(), other_weapon.copy())
+
     # We're about to mutate the weapon dicts, so we need to copy them first
-    weapon = copy.deepcopy(weapon)
-    other_weapon = copy.deepcopy(other_weapon)
+    return copied_matchup(copy.deepcopy(weapon), copy.deepcopy(other_weapon))
+
+def copied_matchup(weapon, other_weapon):
+    matchup = 0
 
     calculate_damage_output(weapon)
     calculate_damage_output(other_weapon)
     calculate_stamina_damage_output(weapon, other_weapon)
 
     for attack_name in VALID_PROCESSED_ATTACKS:
+        if attack_name not in weapon["attacks"] or attack_name not in other_weapon["attacks"]:
+            continue
         attack = weapon["attacks"][attack_name]
         other_attack = other_weapon["attacks"][attack_name]
         matchup += calculate_matchup_stats(weapon, other_weapon, attack_name, attack, other_attack)
@@ -152,19 +350,21 @@ def calculate_matchup_winner(weight, a, b):
         return 0
 
 def calculate_damage_output(weapon):
-    damage_type = weapon["damageType"]
-    damage_multiplier = 1
-    if damage_type == "Blunt":
-        damage_multiplier = 1.2125 # (1 + 1 + 1.35 + 1.5) / 4
-    elif damage_type == "Slash":
-        damage_multiplier = 1.10625
+    damage_multiplier = damage_output_multiplier(weapon)
 
+    if isinstance(weapon, Weapon):
+        weapon.scale("damage", damage_multiplier)
+        return
     apply_to_all_attacks(weapon, lambda attack: attack.update({"damage": attack["damage"] * damage_multiplier}))
     
 def calculate_stamina_damage_output(weapon: dict, other_weapon: dict) -> None:
     weapon_stamina_damage_multiplier = (100 - other_weapon.get("staminaDamageNegation", 0)) / 100
     other_weapon_stamina_damage_multiplier = (100 - weapon.get("staminaDamageNegation", 0)) / 100
 
+    if isinstance(weapon, Weapon):
+        weapon.scale("staminaDamage", weapon_stamina_damage_multiplier)
+        other_weapon.scale("staminaDamage", other_weapon_stamina_damage_multiplier)
+        return
     apply_to_all_attacks(weapon, lambda attack: attack.update({"staminaDamage": attack["staminaDamage"] * weapon_stamina_damage_multiplier}))
     apply_to_all_attacks(other_weapon, lambda attack: attack.update({"staminaDamage": attack["staminaDamage"] * other_weapon_stamina_damage_multiplier}))
 
@@ -1,26 +1,20 @@
 import json
-import re
 import sys
 import os
 from collections.abc import Mapping
+from typing import Optional
 import argparse
 
+import profiling
 from common import write_dicts_to_csv, VALID_ATTACKS
-from derived_stats import make_average_attack, make_stamina_damage
+from derived_stats import make_average_attack_batch, make_stamina_damage_batch
+from json_stream import iter_items_at
+from weapon_names import NameIndex, display_name, load_name_index, pascal_to_space, raw_file_name
+from weapon_store import DEFAULT_WRITE_WORKERS, WRITE_FORMAT, load_document, load_weapon_store, save_documents, write_changed_documents
 
 def seconds_to_millis(n):
     return n * 1000 if n != -1 else -1
 
-WEAPON_NAME_OVERRIDES = {
-    "Longsword_Argon_Citadel": "Argon's Sword",
-    "Greatsword_Malric": "Lion's Bane",
-    "Carryable_Candelabra": "Candelabra",
-}
-
-def adapt_name(name: str) -> str:
-    """Adapt weapon name to match the JSON file name."""
-    return WEAPON_NAME_OVERRIDES[name] if name in WEAPON_NAME_OVERRIDES else pascal_to_space(name)
-
 STAT_TRANSFORMS = {
     "windup": seconds_to_millis,
     "release": seconds_to_millis,
@@ -42,28 +36,54 @@ def main():
     parser.add_argument("-i", "--input_json", required=True, help="Path to the input JSON file")
     parser.add_argument("-o", "--output_dir", required=True, help="Path to the output directory")
     parser.add_argument("-c", "--changelog_location", required=True, help="Path to output the changelog json")
+    parser.add_argument("-s", "--stream", action="store_true", help="Read rows one at a time instead of loading the whole input json")
+    parser.add_argument("--store", help="Path to a weapon store. Existing weapons are read from it in one go, and it is updated with the merged weapons")
+    parser.add_argument("-j", "--workers", type=int, default=DEFAULT_WRITE_WORKERS, help="Threads used to write changed weapon files")
+    parser.add_argument("--profile", help="Record where the time goes and write it to this path as a Chrome trace, with a text summary next to it")
     args = parser.parse_args()
 
+    if args.profile:
+        profiling.enable()
+    try:
+        write_to_file(read_weapons(args.input_json, args.stream), args.output_dir, args.changelog_location, args.store, args.workers)
+    finally:
+        profiling.finish(args.profile)
+
+def read_weapons(input_json, stream=False):
+    """Every weapon in the data table, with the attack defaults applied."""
     base_defaults = {}
     attack_defaults = {}
     weapon_defaults = {}
     weapons = {}
 
-    data = fetch_data(args.input_json)[0]["Rows"]
+    # Streamed rows are parsed as they're transformed, so their parse time shows up under transform
+    with profiling.span("parse"):
+        rows = stream_rows(input_json) if stream else fetch_data(input_json)[0]["Rows"].items()
 
-    for name, item in data.items():
-        process_item(name, item, base_defaults, attack_defaults, weapon_defaults, weapons)
+    with profiling.span("transform"):
+        for name, item in rows:
+            with profiling.span("transform", weapon=name):
+                process_item(name, item, base_defaults, attack_defaults, weapon_defaults, weapons)
 
-    apply_defaults(weapons, attack_defaults)
+    with profiling.span("apply_defaults"):
+        apply_defaults(weapons, attack_defaults)
 
-    write_to_file(list(weapons.values()), args.output_dir, args.changelog_location)
+    return list(weapons.values())
 
 def lowercase_first_char(in_str):
     return in_str[0].lower() + in_str[1:]
 
 def fetch_data(path):
     with open(path) as user_file:
-      return json.load(user_file)
+      data = json.load(user_file)
+    profiling.file_read(path)
+    return data
+
+def stream_rows(path):
+    """Yield (name, item) for every row in the data table without loading the whole file."""
+    with open(path) as user_file:
+        yield from iter_items_at(user_file, [0, "Rows"])
+    profiling.file_read(path)
 
 def clean_item(item):#, VALID_STATS):
     return {lowercase_first_char(key): item[key] for key in item.keys()}#VALID_STATS}
@@ -114,80 +134,111 @@ def process_attack(attack_type, item, attacks):
         attacks[attack_type] = apply_stat_transforms(item)
     return attacks
 
-def derive_stats(weapon):
-    if "slash" not in weapon["attacks"]:
-        return 
-
-    if "id" in weapon:
-        make_stamina_damage(weapon)
+def derive_stats(weapons):
+    """Stamina damage and the average attack of every weapon with swings, in one batch."""
+    weapons = [weapon for weapon in weapons if "slash" in weapon["attacks"]]
 
-    make_average_attack(weapon)
+    make_stamina_damage_batch([weapon for weapon in weapons if "id" in weapon])
+    make_average_attack_batch(weapons)
 
 def apply_defaults(weapons, attack_defaults):
     for weapon, weapon_data in weapons.items():
-        for attack, attack_data in weapon_data["attacks"].items():
-            if attack in ["slash", "overhead", "stab"]:
-                for attack_subtype, item in attack_data.items():
-                    for key in item.keys():
-                        if item[key] == -1:
-                            item[key] = attack_defaults[attack][attack_subtype][key]
-            else:
-                for key in attack_data.keys():
-                    if attack_data[key] == -1:
-                        if key in attack_defaults.get(attack, {}):
-                            attack_data[key] = attack_defaults[attack][key]
-
-def write_to_file(data, foldername, changelog_location):
-    try:
-        if not os.path.exists(foldername):
-            os.mkdir(foldername)
-
-        changelog = {}
-        merged_weapons = []
+        with profiling.span("apply_defaults", weapon=weapon):
+            for attack, attack_data in weapon_data["attacks"].items():
+                if attack in ["slash", "overhead", "stab"]:
+                    for attack_subtype, item in attack_data.items():
+                        for key in item.keys():
+                            if item[key] == -1:
+                                item[key] = attack_defaults[attack][attack_subtype][key]
+                else:
+                    for key in attack_data.keys():
+                        if attack_data[key] == -1:
+                            if key in attack_defaults.get(attack, {}):
+                                attack_data[key] = attack_defaults[attack][key]
+
+def merge_weapons(data, foldername, documents, formats, originals, names: Optional[NameIndex] = None):
+    """
+    Merge the ingested weapons into their documents, loading any that aren't loaded yet. Returns the changelog.
+    Weapons go to the file names resolves them to, new weapons to a new file named after them.
+    """
+    changelog = {}
+    merged_weapons = []
+    if names is None:
+        names = load_name_index(foldername, documents)
+    with profiling.span("merge"):
         for weapon in data:
-            path = foldername + "/" + pascal_to_camel(weapon["name"]) + ".json"
-            weapon["name"] = adapt_name(weapon["name"])
-            exists = os.path.isfile(path)
-            existing_data = {}
-            if exists:
-                existing_data = fetch_data(path)
-
-            with open(path, 'w') as outfile:
+            with profiling.span("merge", weapon=weapon["name"]):
+                file_name = names.resolve(weapon["name"]) or raw_file_name(weapon["name"])
+                weapon["name"] = display_name(weapon["name"])
+                existing_data = load_document(foldername, file_name, documents, formats, originals)
+                if existing_data is None:
+                    existing_data = {}
+
                 (changes, merged) = deep_merge(weapon["name"], existing_data, weapon)
-                derive_stats(merged)
+                merged_weapons.append(merged)
                 if len(changes) > 0:
                     changelog[weapon["name"]] = changes
                 merged["name"] = pascal_to_space(weapon["name"])
-                merged_weapons.append(merged)
-                json.dump(merged, outfile, indent=2)
 
-        for (name, changes) in changelog.items():
-            for change in changes:
-                full_path = name + "." + '.'.join(change['path'])
+                documents[file_name] = merged
+                formats.setdefault(file_name, WRITE_FORMAT)
+
+    with profiling.span("derive"):
+        derive_stats(merged_weapons)
+    return changelog
+
+def print_changelog(changelog):
+    for (name, changes) in changelog.items():
+        for change in changes:
+            full_path = name + "." + '.'.join(change['path'])
 		
-                print(full_path + ": " + str(change['old']) + " -> " + str(change['new']))
-        
-        changelog_text = ""
-        for (name, changes) in changelog.items():
-            changelog_text += name + ":\n"
-            for change in changes:
-                new_string = str(change['new']) if not isinstance(change['new'], dict) else json.dumps(change['new'], indent=12)
-                changelog_text += "\t" + '.'.join(change['path']) + ": " + str(change['old']) + " -> " + new_string + "\n"
+            print(full_path + ": " + str(change['old']) + " -> " + str(change['new']))
+
+def changelog_text(changelog):
+    text = ""
+    for (name, changes) in changelog.items():
+        text += name + ":\n"
+        for change in changes:
+            new_string = str(change['new']) if not isinstance(change['new'], dict) else json.dumps(change['new'], indent=12)
+            text += "\t" + '.'.join(change['path']) + ": " + str(change['old']) + " -> " + new_string + "\n"
+    return text
+
+def write_to_file(data, foldername, changelog_location, store_path=None, workers=DEFAULT_WRITE_WORKERS):
+    try:
+        if not os.path.exists(foldername):
+            os.mkdir(foldername)
+
+        with profiling.span("parse", store=store_path):
+            store = load_weapon_store(store_path, foldername) if store_path else None
+        documents = store.documents() if store else {}
+        formats = dict(zip(store.files, store.formats)) if store else {}
+        originals = {}
+
+        # Nothing is written until every weapon is merged, so a merge that throws leaves the files untouched
+        changelog = merge_weapons(data, foldername, documents, formats, originals)
+
+        (written, skipped, failed) = write_changed_documents(foldername, documents, formats, originals, workers)
+        print(f"Weapon files: wrote {len(written)}, skipped {len(skipped)} unchanged, {len(failed)} failed")
+
+        # A store saved now would claim the failed files hold the merged weapons.
+        # Leaving it alone means it's rebuilt from the files on the next load.
+        if store_path and len(failed) == 0:
+            save_documents(documents, formats, foldername, store_path)
+
+        print_changelog(changelog)
 
         with open(changelog_location, 'w') as changelog_file: 
-            changelog_file.write(changelog_text)
+            changelog_file.write(changelog_text(changelog))
+        profiling.file_written(changelog_location)
+
+        if len(failed) > 0:
+            sys.exit(f"Unable to write {len(failed)} weapon files!")
 
     except IOError as e:
         print(e)
         sys.exit("Unable to write to JSON file!")
 
 
-def pascal_to_camel(s):
-    return re.sub(r'(?<!^)(?=[A-Z])', '_', s).lower()
-
-def pascal_to_space(s):
-    return re.sub(r'(?<!^)(?=[A-Z])', ' ', s).replace("  ", " ")
-
 def apply_stat_transforms(data):
     for key, value in data.items():
         if key in STAT_TRANSFORMS:
@@ -0,0 +1,247 @@
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+import process_range_save
+import profiling
+import roster_bundle
+from stat_history import record_weapons_dir
+from weapon_names import load_name_index
+from weapon_store import write_changed_documents
+
+ingest_abilities = importlib.import_module("ingest-abilities-override")
+ingest_ranges = importlib.import_module("ingest-range-data")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bump when a stage starts producing different output from the same inputs, every stage then reruns
+PIPELINE_VERSION = 1
+
+@dataclass
+class Stage:
+    """One step of the pipeline. Stages share results through the context dict and queue their file writes in context["writes"]."""
+    name: str
+    needs: List[str]
+    # Hash of everything the stage reads, only called once the stages it needs are done
+    fingerprint: Callable[[Dict], str]
+    run: Callable[[Dict], None]
+    # Put the results of a skipped stage in the context from its previous outputs, False if they're gone
+    restore: Callable[[Dict], bool]
+
+def hash_files(paths: List[str]) -> str:
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def json_files(directory: str) -> List[str]:
+    return [os.path.join(directory, file) for file in os.listdir(directory) if file.endswith(".json")]
+
+def hash_values(*values) -> str:
+    return hashlib.sha256(json.dumps([PIPELINE_VERSION, *values]).encode("utf-8")).hexdigest()
+
+# Range stage: range test saves -> range statistics
+
+def range_fingerprint(context: Dict) -> str:
+    # Weapons are named after their file in the output, so it changes with the weapon files there are
+    weapon_files = sorted(file for file in os.listdir(context["args"].weapons_dir) if file.endswith(".json"))
+    return hash_values(hash_files(json_files(context["args"].range_dir)), process_range_save.CACHE_VERSION, weapon_files)
+
+def run_range(context: Dict):
+    args = context["args"]
+    names = load_name_index(args.weapons_dir, {})
+    context["range"] = process_range_save.process_directory(args.range_dir, args.workers, args.stream, True, os.path.join(args.output_dir, "range-cache.json"), names)
+
+    def write_range_outputs():
+        with open(os.path.join(args.output_dir, "range-output.json"), "w") as f:
+            json.dump(context["range"], f, indent=2)
+        process_range_save.generate_csv(context["range"], os.path.join(args.output_dir, "range-output.csv"))
+    context["writes"].append(write_range_outputs)
+
+def restore_range(context: Dict) -> bool:
+    path = os.path.join(context["args"].output_dir, "range-output.json")
+    if not os.path.isfile(path) or not os.path.isfile(os.path.join(context["args"].output_dir, "range-output.csv")):
+        return False
+    with open(path) as f:
+        context["range"] = json.load(f)
+    return True
+
+# Weapons stage: abilities override + range statistics -> weapon json files
+
+def weapons_fingerprint(context: Dict) -> str:
+    args = context["args"]
+    return hash_values(hash_files([args.input_json]), process_range_save.range_rows(context["range"]), hash_files(json_files(args.weapons_dir)))
+
+def run_weapons(context: Dict):
+    args = context["args"]
+    documents = {}
+    formats = {}
+    originals = {}
+
+    # Both ingests work on the same documents, every weapon file is read at most once and written at most once
+    weapons = ingest_abilities.read_weapons(args.input_json, args.stream)
+    abilities_changelog = ingest_abilities.merge_weapons(weapons, args.weapons_dir, documents, formats, originals)
+    ingest_abilities.print_changelog(abilities_changelog)
+
+    # Built after the merge, so the display names and aliases of every merged weapon resolve too
+    names = load_name_index(args.weapons_dir, documents)
+    ingest_ranges.changelog.clear()
+    ingest_ranges.update_documents_with_ranges(process_range_save.range_rows(context["range"]), args.weapons_dir, documents, formats, originals, names)
+    range_changelog = ingest_ranges.changelog_text()
+    unresolved_names = names.report()
+
+    def write_weapons():
+        (written, skipped, failed) = write_changed_documents(args.weapons_dir, documents, formats, originals)
+        print(f"Weapon files: wrote {len(written)}, skipped {len(skipped)} unchanged, {len(failed)} failed")
+        if len(failed) > 0:
+            sys.exit(f"Unable to write {len(failed)} weapon files!")
+
+        with open(os.path.join(args.output_dir, "abilities-override-changelog.txt"), "w") as f:
+            f.write(ingest_abilities.changelog_text(abilities_changelog))
+        with open(os.path.join(args.output_dir, "range-changelog.txt"), "w") as f:
+            f.write(range_changelog)
+        with open(os.path.join(args.output_dir, "unresolved-names.txt"), "w") as f:
+            f.write(unresolved_names)
+        if len(names.unresolved) > 0:
+            print(f"WARNING: {len(names.unresolved)} weapon names matched no weapon file, see unresolved-names.txt")
+    context["writes"].append(write_weapons)
+
+# Bundle stage: weapon json files -> roster bundle and its TypeScript accessor, next to the weapons directory
+
+def bundle_dir(context: Dict) -> str:
+    return os.path.dirname(os.path.abspath(context["args"].weapons_dir))
+
+def bundle_fingerprint(context: Dict) -> str:
+    # The weapon files aren't written until every stage ran, so rerun whenever the weapons stage would
+    return hash_values(weapons_fingerprint(context), roster_bundle.BUNDLE_VERSION)
+
+def run_bundle(context: Dict):
+    def write_bundle():
+        bundle = roster_bundle.write_bundle(context["args"].weapons_dir, bundle_dir(context))
+        print(f"Roster bundle: {len(bundle['weapons'])} weapons, {len(bundle['fragments'])} shared fragments")
+    # Queued after the weapon file writes, so it bundles what they wrote
+    context["writes"].append(write_bundle)
+
+def restore_bundle(context: Dict) -> bool:
+    return all(os.path.isfile(os.path.join(bundle_dir(context), file)) for file in [roster_bundle.BUNDLE_FILE, roster_bundle.MODULE_FILE])
+
+STAGES = [
+    Stage("range", [], range_fingerprint, run_range, restore_range),
+    Stage("weapons", ["range"], weapons_fingerprint, run_weapons, lambda context: True),
+    Stage("bundle", ["weapons"], bundle_fingerprint, run_bundle, restore_bundle),
+]
+
+def stage_order(stages: List[Stage]) -> List[Stage]:
+    """Stages sorted so every stage comes after the ones it needs."""
+    by_name = {stage.name: stage for stage in stages}
+    order = []
+    visiting = set()
+
+    def visit(stage):
+        if stage in order:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Pipeline stage {stage.name} depends on itself")
+        visiting.add(stage.name)
+        for need in stage.needs:
+            visit(by_name[need])
+        order.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return order
+
+def load_state(path: str) -> Dict[str, str]:
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            state = json.load(f)
+        return state["stages"] if state.get("version") == PIPELINE_VERSION else {}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"WARNING: Unable to read pipeline state {path}: {e}")
+        return {}
+
+def save_state(path: str, stages: Dict[str, str]):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"version": PIPELINE_VERSION, "stages": stages}, f, indent=2)
+    os.replace(temp_path, path)
+
+def run_pipeline(stages: List[Stage], context: Dict, state: Dict[str, str], force: bool = False) -> Dict[str, str]:
+    """
+    Run every stage whose inputs changed since the fingerprints in state, then write every output.
+    Returns the new state.
+    """
+    context["writes"] = []
+    timings = []
+    ran = []
+    for stage in stage_order(stages):
+        start = time.perf_counter()
+        fingerprint = stage.fingerprint(context)
+        if not force and state.get(stage.name) == fingerprint and stage.restore(context):
+            status = "skipped"
+        else:
+            with profiling.span(stage.name):
+                stage.run(context)
+            ran.append(stage)
+            status = "ran"
+        timings.append((stage.name, status, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    with profiling.span("write"):
+        for write in context["writes"]:
+            write()
+    timings.append(("write", "ran" if len(context["writes"]) > 0 else "skipped", time.perf_counter() - start))
+
+    # Fingerprinted again after writing, a stage that writes its own inputs (the weapon files) shouldn't rerun next time
+    new_state = dict(state)
+    for stage in ran:
+        new_state[stage.name] = stage.fingerprint(context)
+
+    print(f"{'stage':<10}{'status':<10}{'seconds':>10}")
+    for (name, status, seconds) in timings:
+        print(f"{name:<10}{status:<10}{seconds:>10.3f}")
+    return new_state
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the whole data refresh (range saves, abilities override, range ingest, roster bundle) in one process")
+    parser.add_argument("--range_dir", default=os.path.join(ROOT, "raw_data", "range_test_iterations"), help="Directory of range test saves")
+    parser.add_argument("-i", "--input_json", default=os.path.join(ROOT, "raw_data", "AbilitiesOverride.json"), help="Path to AbilitiesOverride.json")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(ROOT, "src", "weapons"), help="Path to the weapons directory")
+    parser.add_argument("-o", "--output_dir", default=os.path.join(ROOT, "processed_data"), help="Where the range output, changelogs and pipeline state go")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of processes used to parse the range test saves")
+    parser.add_argument("-s", "--stream", action="store_true", help="Stream the input json files instead of loading them whole")
+    parser.add_argument("-p", "--patch", help="Patch name to tag the stat history snapshot with. Without it, a snapshot tagged with the time is recorded if any stat changed")
+    parser.add_argument("--history_dir", help="Where the stat history goes, stat-history in --output_dir by default")
+    parser.add_argument("-f", "--force", action="store_true", help="Run every stage even if its inputs didn't change")
+    parser.add_argument("--profile", help="Record where the time goes and write it to this path as a Chrome trace, with a text summary next to it")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
+
+    if not os.path.exists(args.output_dir):
+        os.mkdir(args.output_dir)
+    state_path = os.path.join(args.output_dir, "pipeline-state.json")
+
+    try:
+        state = run_pipeline(STAGES, {"args": args}, load_state(state_path), args.force)
+        save_state(state_path, state)
+
+        with profiling.span("history"):
+            changes = record_weapons_dir(args.history_dir or os.path.join(args.output_dir, "stat-history"), args.weapons_dir, args.patch)
+        if changes is not None:
+            print(f"Stat history: recorded {changes} changes")
+    finally:
+        profiling.finish(args.profile)
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
-import json
+import argparse
+import csv
 import math
 import os
-import sys
 
-import pandas as pd
+import profiling
+from weapon_names import load_name_index
+from weapon_store import load_document, load_weapon_store, save_documents, write_changed_documents
 
 # Required headers in the CSV (with "Right " prefix removed)
 REQUIRED_HEADERS = [
@@ -35,18 +37,11 @@ def add_changelog_entry(weapon_name, field_name, old_value, new_value):
     }
     
 
-# Function to update the JSON file with new range data
-def update_json_with_ranges(json_file_path, ranges):
+# Function to update a weapon with new range data
+def update_weapon_ranges(weapon_name, data, ranges):
     """
-    Update JSON file with new range data and track changes in changelog
+    Update the parsed weapon file with new range data and track changes in changelog.
     """
-    # Read the current data
-    with open(json_file_path, "r") as json_file:
-        data = json.load(json_file)
-        
-    # Get weapon name from the file
-    weapon_name = os.path.splitext(os.path.basename(json_file_path))[0]
-    
     # Update the relevant attack range fields and track changes
     if "attacks" in data:
         attacks = data["attacks"]
@@ -88,51 +83,97 @@ def update_json_with_ranges(json_file_path, ranges):
                             old_value,
                             new_value
                         )
-    
-    # Save the updated data back to the JSON file
-    with open(json_file_path, "w") as json_file:
-        json.dump(data, json_file, indent=2)
+
+    return data
+
+# Group the range rows by the weapon file they belong to
+def group_rows_by_file(rows, json_dir, documents, names=None):
+    """
+    Range data of every row, grouped by weapon file in the order the files first appear.
+    Row names are resolved with the name index, so save names like "LIONS BANE" find greatsword__malric.json.
+    """
+    if names is None:
+        names = load_name_index(json_dir, documents)
+
+    grouped = {}
+    for row in rows:
+        weapon_name = names.resolve(row["Name"], "range data")
+
+        if weapon_name is not None:
+            grouped.setdefault(weapon_name, []).append({header: row[header] for header in REQUIRED_HEADERS if header != "Name"})
+        else:
+            suggestions = names.suggest(row["Name"])
+            print(f"Warning: JSON file for {row['Name']} not found." + (f" Did you mean {', '.join(suggestions)}?" if len(suggestions) > 0 else ""))
+    return grouped
+
+def update_documents_with_ranges(rows, json_dir, documents, formats, originals, names=None):
+    """
+    Apply every range row (a dict with Name and the REQUIRED_HEADERS) to its weapon document,
+    loading the documents that aren't loaded yet. Nothing is written.
+    """
+    # The CSV is read while the rows are grouped
+    with profiling.span("parse"):
+        grouped = group_rows_by_file(rows, json_dir, documents, names)
+
+    with profiling.span("transform"):
+        for weapon_name, ranges in grouped.items():
+            with profiling.span("transform", weapon=weapon_name):
+                data = load_document(json_dir, weapon_name, documents, formats, originals)
+                # Rows for the same weapon are applied in order, so the last valid value wins
+                for range_data in ranges:
+                    update_weapon_ranges(os.path.splitext(weapon_name)[0], data, range_data)
+            print(f"Updated {weapon_name} with new range data.")
+
+def changelog_text():
+    changelog_string = ""
+    for key, v in changelog.items():
+        changelog_string += f"{key}: {v['old_value']} -> {v['new_value']}\n"
+    return changelog_string
 
 # Function to validate the CSV file
-def validate_csv_headers(df):
-    if not all(header in df.columns for header in REQUIRED_HEADERS):
+def validate_csv_headers(columns):
+    if not all(header in columns for header in REQUIRED_HEADERS):
         missing_headers = [
-            header for header in REQUIRED_HEADERS if header not in df.columns
+            header for header in REQUIRED_HEADERS if header not in columns
         ]
         raise ValueError(
             f"CSV is missing the following required headers: {', '.join(missing_headers)}"
         )
 
+def parse_range_value(value):
+    """Empty cells are missing ranges"""
+    return float(value) if value is not None and value.strip() != "" else None
+
+def read_range_csv(csv_file_path):
+    """Yield the rows of the range CSV one at a time, with the ranges parsed."""
+    with open(csv_file_path, newline="") as csv_file:
+        reader = csv.DictReader(csv_file)
+
+        # Validate the headers
+        validate_csv_headers(reader.fieldnames or [])
+
+        for row in reader:
+            yield {header: (row[header] if header == "Name" else parse_range_value(row[header])) for header in REQUIRED_HEADERS}
+    profiling.file_read(csv_file_path)
+
 
 # Main function to process the CSV and JSON files
-def process_csv_and_update_json(csv_file_path, json_dir):
+def process_csv_and_update_json(csv_file_path, json_dir, store_path=None):
     try:
-        # Load the CSV into a DataFrame
-        df = pd.read_csv(csv_file_path)
+        # With a weapon store every weapon is read in one go, and the store is kept up to date
+        with profiling.span("parse", store=store_path):
+            store = load_weapon_store(store_path, json_dir) if store_path else None
+        documents = store.documents() if store else {}
+        formats = dict(zip(store.files, store.formats)) if store else {}
+        originals = {}
 
-        # Validate the headers
-        validate_csv_headers(df)
-
-        # Iterate over each row in the CSV and update the corresponding JSON file
-        for _, row in df.iterrows():
-            # Construct the expected JSON file name
-            weapon_name = row["Name"].lower().replace(" ", "_") + ".json"
-            json_file_path = os.path.join(json_dir, weapon_name)
-
-            # If the JSON file exists, update it with range data
-            if os.path.exists(json_file_path):
-                range_data = {
-                    "Alt Slash": row["Alt Slash"],
-                    "Slash": row["Slash"],
-                    "Stab": row["Stab"],
-                    "Alt Stab": row["Alt Stab"],
-                    "Overhead": row["Overhead"],
-                    "Alt Overhead": row["Alt Overhead"],
-                }
-                update_json_with_ranges(json_file_path, range_data)
-                print(f"Updated {weapon_name} with new range data.")
-            else:
-                print(f"Warning: JSON file for {weapon_name} not found.")
+        # Update the weapons in memory, then write the ones that changed
+        update_documents_with_ranges(read_range_csv(csv_file_path), json_dir, documents, formats, originals)
+        (written, skipped, failed) = write_changed_documents(json_dir, documents, formats, originals)
+        print(f"Weapon files: wrote {len(written)}, skipped {len(skipped)} unchanged, {len(failed)} failed")
+
+        if store_path and len(failed) == 0:
+            save_documents(documents, formats, json_dir, store_path)
 
     except FileNotFoundError:
         print(
@@ -145,25 +186,29 @@ def process_csv_and_update_json(csv_file_path, json_dir):
 
 
 if __name__ == "__main__":
-    # Ensure CSV file path and JSON directory path are provided as input
-    if len(sys.argv) != 4:
-        script_name = sys.argv[0]
-        print(f"Usage: {script_name} <path_to_csv_file> <path_to_json_dir> <path_to_changelog_file>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_file", help="Path to the range csv")
+    parser.add_argument("json_dir", help="Path to the weapons directory")
+    parser.add_argument("changelog_file", help="Path to output the changelog")
+    parser.add_argument("--store", help="Path to a weapon store, read instead of the individual json files and updated with the new ranges")
+    parser.add_argument("--profile", help="Record where the time goes and write it to this path as a Chrome trace, with a text summary next to it")
+    args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
 
     # Get the CSV file path and JSON directory path from the command-line arguments
-    csv_file_path = sys.argv[1]
-    json_dir = sys.argv[2]
-    changelog_path = sys.argv[3]
-
-    # Process the CSV and update the JSON files
-    process_csv_and_update_json(csv_file_path, json_dir)
+    csv_file_path = args.csv_file
+    json_dir = args.json_dir
+    changelog_path = args.changelog_file
 
-    # Write the changelog to a file
-    changelog_string = ""
-    for key, v in changelog.items():
-        changelog_string += f"{key}: {v['old_value']} -> {v['new_value']}\n"
-
-    with open(changelog_path, "w") as changelog_file:
-        changelog_file.write(changelog_string)
+    try:
+        # Process the CSV and update the JSON files
+        process_csv_and_update_json(csv_file_path, json_dir, args.store)
+
+        # Write the changelog to a file
+        with open(changelog_path, "w") as changelog_file:
+            changelog_file.write(changelog_text())
+        profiling.file_written(changelog_path)
+    finally:
+        profiling.finish(args.profile)
 
@@ -0,0 +1,168 @@
+import json
+import re
+from typing import Any, Iterator, List, TextIO, Tuple, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = " \t\n\r"
+
+# Characters that can follow a complete value
+DELIMITERS = WHITESPACE + ",:]}"
+
+STRUCTURAL = re.compile(r'[\[\]{}"]')
+# Rest of a string after its opening quote
+STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)
+
+class JsonStream:
+    """
+    Incremental JSON reader over a text file.
+    Containers are walked one token at a time, only the values that are asked for are decoded,
+    so memory depends on the size of one value instead of the whole file.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Read another chunk, dropping everything before pos. Returns False at the end of the file."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if chunk == "":
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Next non whitespace character without consuming it, "" at the end of the file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}'")
+        self.pos += 1
+
+    def read_value(self) -> Any:
+        """Decode the next complete value, reading more of the file until it fits in the buffer."""
+        self._peek()
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number cut off by the end of the buffer (1. or 1.5e) can still decode,
+                # so only trust the value once the character after it is visible
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in DELIMITERS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def skip_value(self):
+        """Move past the next value. Containers are scanned for their closing bracket without being decoded."""
+        if self._peek() not in "[{":
+            self.read_value()
+            return
+
+        depth = 0
+        while True:
+            match = STRUCTURAL.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self._fill():
+                    raise ValueError("Unexpected end of file")
+                continue
+
+            self.pos = match.end()
+            char = match.group()
+            if char == '"':
+                while True:
+                    end = STRING_END.match(self.buffer, self.pos)
+                    if end is not None:
+                        self.pos = end.end()
+                        break
+                    if not self._fill():
+                        raise ValueError("Unexpected end of file")
+            elif char in "[{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def iter_items(self) -> Iterator[Tuple[str, Any]]:
+        """Yield (key, value) pairs of the object at the current position, one at a time."""
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key, self.read_value()
+            if self._peek() == ",":
+                self.pos += 1
+            else:
+                self._expect("}")
+                return
+
+    def iter_array(self) -> Iterator[Any]:
+        """Yield the values of the array at the current position, one at a time."""
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self._peek() == ",":
+                self.pos += 1
+            else:
+                self._expect("]")
+                return
+
+    def seek(self, path: List[Union[int, str]]):
+        """
+        Move to the value at path, e.g. [0, "Rows"], skipping every sibling before it.
+        Whatever follows the value is left unread.
+        """
+        for part in path:
+            if isinstance(part, int):
+                self._expect("[")
+                for _ in range(part):
+                    self.skip_value()
+                    self._expect(",")
+            else:
+                self._expect("{")
+                while True:
+                    if self._peek() == "}":
+                        raise KeyError(part)
+                    key = self.read_value()
+                    self._expect(":")
+                    if key == part:
+                        break
+                    self.skip_value()
+                    if self._peek() != ",":
+                        # A truncated file is not a missing key
+                        self._expect("}")
+                        raise KeyError(part)
+                    self.pos += 1
+
+def iter_items_at(f: TextIO, path: List[Union[int, str]], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """Stream the (key, value) pairs of the object found at path in f."""
+    stream = JsonStream(f, chunk_size)
+    stream.seek(path)
+    yield from stream.iter_items()
@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from common import write_dicts_to_csv
+from generate_matchups import load_weapons
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT, "src")
+
+SWING_ATTACKS = ["slash", "overhead", "stab", "average"]
+
+# Stats of an attack that go into the matrix, in packed column order
+ATTACK_STATS = ["damage", "windup", "release", "recovery", "combo"]
+
+ENUM = re.compile(r"export enum (\w+) \{(.*?)\}", re.S)
+ENUM_MEMBER = re.compile(r"(\w+)\s*=\s*\"([^\"]*)\"")
+TARGET = re.compile(r"export const (\w+) = new Target\(\s*CharacterClass\.(\w+),\s*\[[^\]]*\],\s*([\w.]+),\s*([\w.]+),\s*(.*?)\n\);", re.S)
+TARGET_LIST = re.compile(r"const (\w+) = \[([\w,\s]*)\];")
+# const averageHp = allTargetsNoAverage.reduce((acc, target) => acc + target.hp, 0) / allTargetsNoAverage.length;
+TARGET_MEAN = re.compile(r"const (\w+) = (\w+)\.reduce\(\(acc, target\) => acc \+ target\.(\w+), 0\) / \2\.length;")
+CONSTANT_MULTIPLIER = re.compile(r"^_\s*=>\s*([\d.]+)$")
+SWITCH_CASE = re.compile(r"case DamageType\.(\w+):\s*return ([\d.]+);")
+SWITCH_DEFAULT = re.compile(r"default:\s*return ([\d.]+);")
+MEAN_MULTIPLIER = re.compile(r"(\w+)\.reduce\(\(acc, target\) => acc \+ target\.damageMultiplier\(dt\), 0\)")
+
+@dataclass
+class Target:
+    """A character class from src/all_targets.ts."""
+    name: str
+    hp: float
+    stamina: float
+    # By DamageType value ("Cut", "Chop", "Blunt"), anything else gets default_multiplier
+    multipliers: Dict[str, float] = field(default_factory=dict)
+    default_multiplier: float = 1.0
+
+    def damage_multiplier(self, damage_type: str) -> float:
+        return self.multipliers.get(damage_type, self.default_multiplier)
+
+def read_enums(*paths: str) -> Dict[str, Dict[str, str]]:
+    enums = {}
+    for path in paths:
+        with open(path) as f:
+            for (name, body) in ENUM.findall(f.read()):
+                enums[name] = dict(ENUM_MEMBER.findall(body))
+    return enums
+
+def load_targets(src_dir: str = SRC_DIR) -> List[Target]:
+    """
+    Every target in all_targets.ts, read the way the TypeScript evaluates it. Targets are built in file order,
+    so the average target can refer to the ones before it. Anything the parser doesn't understand raises ValueError.
+    """
+    enums = read_enums(os.path.join(src_dir, "weapon.ts"), os.path.join(src_dir, "classes.ts"))
+    damage_types = enums["DamageType"]
+    with open(os.path.join(src_dir, "all_targets.ts")) as f:
+        text = f.read()
+
+    targets = {}
+
+    def target_list(name: str) -> List[Target]:
+        for (list_name, members) in TARGET_LIST.findall(text):
+            if list_name == name:
+                return [targets[member.strip()] for member in members.split(",") if member.strip()]
+        raise ValueError(f"Unknown target list {name} in all_targets.ts")
+
+    def value(expression: str) -> float:
+        if re.fullmatch(r"[\d.]+", expression):
+            return float(expression)
+        for (name, list_name, stat) in TARGET_MEAN.findall(text):
+            if name == expression:
+                members = target_list(list_name)
+                return sum(getattr(member, stat) for member in members) / len(members)
+        raise ValueError(f"Can't evaluate {expression} in all_targets.ts")
+
+    for (constant, character_class, hp, stamina, multiplier) in TARGET.findall(text):
+        target = Target(enums["CharacterClass"][character_class], value(hp), value(stamina))
+        multiplier = multiplier.strip()
+        if CONSTANT_MULTIPLIER.match(multiplier):
+            target.default_multiplier = float(CONSTANT_MULTIPLIER.match(multiplier).group(1))
+        elif "switch" in multiplier:
+            target.multipliers = {damage_types[member]: float(mult) for (member, mult) in SWITCH_CASE.findall(multiplier)}
+            default = SWITCH_DEFAULT.search(multiplier)
+            target.default_multiplier = float(default.group(1)) if default else 1.0
+        elif MEAN_MULTIPLIER.search(multiplier):
+            members = target_list(MEAN_MULTIPLIER.search(multiplier).group(1))
+            target.multipliers = {damage_type: sum(member.damage_multiplier(damage_type) for member in members) / len(members) for damage_type in damage_types.values()}
+            target.default_multiplier = sum(member.default_multiplier for member in members) / len(members)
+        else:
+            raise ValueError(f"Unsupported damage multiplier for {constant} in all_targets.ts")
+        targets[constant] = target
+
+    return list(targets.values())
+
+@dataclass
+class PackedAttacks:
+    """One row per weapon x attack x variant (light, heavy, or base for attacks that aren't swings)."""
+    weapons: List[str]
+    attacks: List[str]
+    variants: List[str]
+    damage_types: List[str]
+    # rows x ATTACK_STATS, NaN where the stat is missing or not a number
+    stats: np.ndarray
+
+def pack_attacks(weapons: List[Dict]) -> PackedAttacks:
+    rows = []
+    values = []
+    for weapon in weapons:
+        for (attack_name, attack) in weapon["attacks"].items():
+            variants = [("light", attack["light"]), ("heavy", attack["heavy"])] if attack_name in SWING_ATTACKS else [("base", attack)]
+            for (variant, stats) in variants:
+                rows.append((weapon["name"], attack_name, variant, stats.get("damageTypeOverride", weapon.get("damageType"))))
+                values.append([stats.get(stat) if type(stats.get(stat)) in [int, float] else np.nan for stat in ATTACK_STATS])
+
+    (names, attacks, variants, damage_types) = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+    return PackedAttacks(names, attacks, variants, damage_types, np.array(values, dtype=np.float64).reshape(len(rows), len(ATTACK_STATS)))
+
+def kill_matrix(packed: PackedAttacks, targets: List[Target]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Hits to kill, time to kill while comboing and time to kill without comboing, each rows x targets.
+    A hit lands at the end of the windup. Comboing, the next windup starts once the release and the combo
+    window are over, otherwise once the release and the whole recovery are. NaN where there's no damage or timing.
+    """
+    known_types = sorted({damage_type for target in targets for damage_type in target.multipliers})
+    # Last column is every other damage type
+    multipliers = np.array([[target.damage_multiplier(damage_type) for damage_type in known_types] + [target.default_multiplier] for target in targets], dtype=np.float64)
+    type_index = np.array([known_types.index(damage_type) if damage_type in known_types else len(known_types) for damage_type in packed.damage_types], dtype=np.intp)
+    hp = np.array([target.hp for target in targets], dtype=np.float64)
+
+    (damage, windup, release, recovery, combo) = (packed.stats[:, [i]] for i in range(len(ATTACK_STATS)))
+    per_hit = damage * multipliers[:, type_index].T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hits = np.ceil(hp / per_hit)
+        # hp / per_hit can round up past a whole number, the last hit is only needed if the others fall short
+        hits = np.where((hits - 1) * per_hit >= hp, hits - 1, hits)
+    hits[~(per_hit > 0)] = np.nan
+
+    time_to_kill = windup + (hits - 1) * (release + combo + windup)
+    time_to_kill_no_combo = windup + (hits - 1) * (release + recovery + windup)
+    return (hits, time_to_kill, time_to_kill_no_combo)
+
+def matrix_rows(packed: PackedAttacks, targets: List[Target], hits: np.ndarray, time_to_kill: np.ndarray, time_to_kill_no_combo: np.ndarray) -> List[Dict]:
+    """The matrix as one row per weapon x attack x variant, with a hits and two times to kill column per target."""
+    columns = {stat: packed.stats[:, i].tolist() for i, stat in enumerate(ATTACK_STATS)}
+    (hits, time_to_kill, time_to_kill_no_combo) = (hits.tolist(), time_to_kill.tolist(), time_to_kill_no_combo.tolist())
+
+    rows = []
+    for r in range(len(packed.weapons)):
+        row = {"name": packed.weapons[r], "attack": packed.attacks[r], "variant": packed.variants[r], "damageType": packed.damage_types[r]}
+        row.update({stat: number(columns[stat][r]) for stat in ATTACK_STATS})
+        for t, target in enumerate(targets):
+            key = target.name[0].lower() + target.name[1:]
+            row[key + "HitsToKill"] = None if np.isnan(hits[r][t]) else int(hits[r][t])
+            row[key + "TimeToKill"] = number(time_to_kill[r][t])
+            row[key + "TimeToKillNoCombo"] = number(time_to_kill_no_combo[r][t])
+        rows.append(row)
+    return rows
+
+def number(value: float):
+    """NaN as None, whole numbers as ints, so the table stays compact."""
+    if np.isnan(value):
+        return None
+    return int(value) if value.is_integer() else value
+
+def main():
+    parser = argparse.ArgumentParser(description="Hits to kill and time to kill of every weapon attack against every target in src/all_targets.ts")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(SRC_DIR, "weapons"), help="Path to the weapons directory, or to a weapon store built by weapon_store.py")
+    parser.add_argument("-t", "--targets_dir", default=SRC_DIR, help="Directory with all_targets.ts, weapon.ts and classes.ts")
+    parser.add_argument("-o", "--output", required=True, help="Where to put the table, json if it ends in .json, csv otherwise")
+    args = parser.parse_args()
+
+    weapons_location = args.weapons_dir + "/" if args.weapons_dir[-1] != "/" and not os.path.isfile(args.weapons_dir) else args.weapons_dir
+    weapons = [weapon for weapon in load_weapons(weapons_location) if "id" in weapon]
+    targets = load_targets(args.targets_dir)
+
+    packed = pack_attacks(weapons)
+    rows = matrix_rows(packed, targets, *kill_matrix(packed, targets))
+
+    if args.output.endswith(".json"):
+        with open(args.output, "w") as f:
+            json.dump({"targets": [{"name": target.name, "hp": target.hp, "stamina": target.stamina, "multipliers": target.multipliers, "defaultMultiplier": target.default_multiplier} for target in targets], "rows": rows}, f, separators=(",", ":"))
+    else:
+        write_dicts_to_csv(rows, args.output)
+    print(f"Wrote {len(rows)} attacks against {len(targets)} targets to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+# Share of requests per path, /weapons/<id> cycles through every weapon
+DEFAULT_MIX = {"/weapons/<id>": 0.7, "/weapons": 0.1, "/matchups": 0.1, "/kill-matrix": 0.1}
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str, path: str, headers: Dict[str, str]) -> Dict:
+    """One GET on a kept alive connection, returns the status and headers, the body is read and dropped."""
+    lines = [f"GET {path} HTTP/1.1", f"Host: {host}"] + [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    response_headers = {}
+    for line in head[1:]:
+        if ":" in line:
+            (name, value) = line.split(":", 1)
+            response_headers[name.strip().lower()] = value.strip()
+    await reader.readexactly(int(response_headers.get("content-length", 0)))
+    return {"status": int(head[0].split(" ")[1]), "headers": response_headers}
+
+async def fetch(host: str, port: int, path: str) -> bytes:
+    (reader, writer) = await asyncio.open_connection(host, port)
+    try:
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode("latin-1"))
+        return (await reader.read()).split(b"\r\n\r\n", 1)[1]
+    finally:
+        writer.close()
+
+async def client(host: str, port: int, paths: List[str], offset: int, deadline: float, headers: Dict[str, str], revalidate: bool, latencies: List[float], errors: List[str]):
+    """One connection sending requests back to back until the deadline."""
+    (reader, writer) = await asyncio.open_connection(host, port)
+    etags = {}
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            request_headers = dict(headers)
+            if revalidate and path in etags:
+                request_headers["If-None-Match"] = etags[path]
+            start = time.perf_counter()
+            try:
+                response = await request(reader, writer, host, path, request_headers)
+            except (asyncio.IncompleteReadError, ConnectionError) as e:
+                errors.append(f"{path}: {e!r}")
+                return
+            latencies.append(time.perf_counter() - start)
+            if response["status"] not in [200, 304]:
+                errors.append(f"{path}: {response['status']}")
+            elif "etag" in response["headers"]:
+                etags[path] = response["headers"]["etag"]
+    finally:
+        writer.close()
+
+def request_paths(weapon_ids: List[str], mix: Dict[str, float], count: int = 1000) -> List[str]:
+    """count paths spread by mix, interleaved so every connection sees the same blend."""
+    paths = []
+    for path, share in mix.items():
+        for n in range(round(share * count)):
+            paths.append(f"/weapons/{weapon_ids[n % len(weapon_ids)]}" if path == "/weapons/<id>" else path)
+    random.Random(0).shuffle(paths)
+    return paths
+
+def percentile(values: List[float], share: float) -> float:
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+async def load_test(host: str, port: int, connections: int, duration: float, headers: Dict[str, str], revalidate: bool, mix: Dict[str, float]) -> Dict:
+    weapon_ids = [weapon["id"] for weapon in json.loads(await fetch(host, port, "/weapons"))]
+    paths = request_paths(weapon_ids, mix)
+    (latencies, errors) = ([], [])
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, paths, c * len(paths) // connections, start + duration, headers, revalidate, latencies, errors) for c in range(connections)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "requestsPerSecond": len(latencies) / elapsed,
+        "p50Ms": percentile(latencies, 0.5) * 1000 if len(latencies) > 0 else None,
+        "p99Ms": percentile(latencies, 0.99) * 1000 if len(latencies) > 0 else None,
+        "maxMs": latencies[-1] * 1000 if len(latencies) > 0 else None,
+        "firstErrors": errors[:5],
+    }
+
+async def wait_for_server(host: str, port: int, server: subprocess.Popen, timeout: float):
+    """The server builds every response before listening, which takes a while on big rosters."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await fetch(host, port, "/")
+            return
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError(f"weapon_server.py exited with {server.returncode}")
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test weapon_server.py over localhost, reporting sustained requests per second and latency percentiles")
+    parser.add_argument("--host", default="127.0.0.1", help="Address of the server")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="Port of the server")
+    parser.add_argument("-c", "--connections", type=int, default=32, help="Number of concurrent keep-alive connections")
+    parser.add_argument("-d", "--duration", type=float, default=10, help="Seconds to send requests for")
+    parser.add_argument("--gzip", action="store_true", help="Ask for gzip encoded responses")
+    parser.add_argument("--revalidate", action="store_true", help="Send If-None-Match with the last ETag of a path, like a caching client")
+    parser.add_argument("--spawn", metavar="WEAPONS_DIR", help="Start weapon_server.py on the port serving this weapons directory, and stop it afterwards")
+    parser.add_argument("--startup_timeout", type=float, default=300, help="Seconds to wait for a spawned server to start listening")
+    parser.add_argument("-o", "--output", help="Write the results to this json file as well")
+    args = parser.parse_args()
+
+    server: Optional[subprocess.Popen] = None
+    if args.spawn is not None:
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "weapon_server.py"), "-w", args.spawn, "--host", args.host, "-p", str(args.port)], stdout=subprocess.DEVNULL)
+    try:
+        if server is not None:
+            asyncio.run(wait_for_server(args.host, args.port, server, args.startup_timeout))
+        headers = {"Accept-Encoding": "gzip"} if args.gzip else {}
+        results = asyncio.run(load_test(args.host, args.port, args.connections, args.duration, headers, args.revalidate, DEFAULT_MIX))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    results.update({"connections": args.connections, "gzip": args.gzip, "revalidate": args.revalidate})
+    print(f"{results['requests']} requests in {results['seconds']:.1f} s over {args.connections} connections, {results['errors']} errors")
+    if results["requests"] > 0:
+        print(f"{results['requestsPerSecond']:.0f} requests/s, p50 {results['p50Ms']:.2f} ms, p99 {results['p99Ms']:.2f} ms, max {results['maxMs']:.2f} ms")
+    for error in results["firstErrors"]:
+        print(f"WARNING: {error}")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from matchup_engine import PackedWeapons, build_comparisons, concatenate_packed, matchup_block, pack_weapons
+
+# Bump when the cached arrays change meaning, old caches are then ignored
+CACHE_VERSION = 1
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def cache_key(attacks: List[str], stats: List[str], configuration: Dict) -> str:
+    """Anything that changes every score at once. A cache built with a different key is thrown away."""
+    return json.dumps({"version": CACHE_VERSION, "attacks": attacks, "stats": stats, "configuration": configuration}, sort_keys=True)
+
+def load_cache(cache_path: str, key: str) -> Optional[Dict]:
+    if not os.path.isfile(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path, allow_pickle=False) as cache:
+            metadata = json.loads(str(cache["metadata"]))
+            if metadata["key"] != key:
+                print("Matchup cache was built with different weights, recomputing everything")
+                return None
+            return {
+                "files": metadata["files"],
+                "packed": PackedWeapons(metadata["names"], metadata["attacks"], metadata["stats"], cache["values"], cache["has_attack"], cache["stamina_multiplier"]),
+                "scores": cache["scores"],
+                "is_float": cache["is_float"],
+            }
+    except (OSError, KeyError, ValueError) as e:
+        print(f"WARNING: Unable to read matchup cache {cache_path}: {e}")
+        return None
+
+def save_cache(cache_path: str, key: str, files: Dict[str, Dict], packed: PackedWeapons, scores: np.ndarray, is_float: np.ndarray):
+    metadata = json.dumps({"key": key, "files": files, "names": packed.names, "attacks": packed.attacks, "stats": packed.stats})
+
+    # Write next to the cache and swap it in, so an interrupted run never leaves a half written cache
+    temp_path = cache_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, metadata=np.array(metadata), values=packed.values, has_attack=packed.has_attack, stamina_multiplier=packed.stamina_multiplier, scores=scores, is_float=is_float)
+    os.replace(temp_path, cache_path)
+
+def incremental_matchup_matrix(weapons_location: str, cache_path: str, attacks: List[str], stats: List[str], configuration: Dict) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Matchup matrix for every weapon file in weapons_location, reusing the cached rows and columns of
+    every file whose content hash is unchanged. Only new or changed files are parsed.
+    Returns names, scores and is_float in the same order calculate_matchups would use.
+    """
+    key = cache_key(attacks, stats, configuration)
+    cache = load_cache(cache_path, key)
+    cached_files = cache["files"] if cache is not None else {}
+
+    files = {}
+    packs = []
+    # (new index, cached index) of every weapon whose file didn't change
+    reused = []
+    changed = []
+
+    for weapon_file in os.listdir(weapons_location):
+        if weapon_file[-5:] != ".json":
+            continue
+
+        with open(os.path.join(weapons_location, weapon_file), "rb") as f:
+            data = f.read()
+        file_hash = hash_bytes(data)
+
+        cached_file = cached_files.get(weapon_file)
+        if cached_file is not None and cached_file["hash"] == file_hash:
+            files[weapon_file] = {"hash": file_hash, "name": cached_file["name"], "index": None}
+            if cached_file["index"] is not None:
+                old_index = cached_file["index"]
+                files[weapon_file]["index"] = len(packs)
+                reused.append((len(packs), old_index))
+                packs.append(PackedWeapons([cached_file["name"]], cache["packed"].attacks, cache["packed"].stats, cache["packed"].values[old_index:old_index + 1], cache["packed"].has_attack[old_index:old_index + 1], cache["packed"].stamina_multiplier[old_index:old_index + 1]))
+            continue
+
+        weapon = json.loads(data)
+        if "id" not in weapon:
+            files[weapon_file] = {"hash": file_hash, "name": None, "index": None}
+            continue
+
+        files[weapon_file] = {"hash": file_hash, "name": weapon["name"], "index": len(packs)}
+        changed.append(len(packs))
+        packs.append(pack_weapons([weapon], attacks, stats))
+
+    if len(packs) == 0:
+        return [], np.zeros((0, 0)), np.zeros((0, 0), dtype=bool)
+
+    packed = concatenate_packed(packs)
+    count = len(packed.names)
+    scores = np.zeros((count, count), dtype=np.float64)
+    is_float = np.zeros((count, count), dtype=bool)
+
+    if len(reused) > 0:
+        new_indices = np.array([new for (new, _) in reused])
+        old_indices = np.array([old for (_, old) in reused])
+        scores[np.ix_(new_indices, new_indices)] = cache["scores"][np.ix_(old_indices, old_indices)]
+        is_float[np.ix_(new_indices, new_indices)] = cache["is_float"][np.ix_(old_indices, old_indices)]
+
+    if len(changed) > 0:
+        comparisons = build_comparisons(packed, configuration["stat_weights"], configuration["attack_weights"], configuration["light_weight"], configuration["heavy_weight"])
+        rows = np.array(changed)
+        (row_scores, row_is_float) = matchup_block(packed, comparisons, rows)
+
+        # Matchups are antisymmetric, so the changed columns are the negated changed rows.
+        # Adding 0.0 turns -0.0 back into 0.0 so the csv doesn't change.
+        scores[:, rows] = -row_scores.T + 0.0
+        is_float[:, rows] = row_is_float.T
+        scores[rows, :] = row_scores
+        is_float[rows, :] = row_is_float
+
+    print(f"Matchup cache: reused {len(reused)} weapons, recomputed {len(changed)}")
+    save_cache(cache_path, key, files, packed, scores, is_float)
+
+    return (packed.names, scores, is_float)
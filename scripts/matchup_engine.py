@@ -0,0 +1,281 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+SWING_ATTACKS = ["slash", "overhead", "stab", "average"]
+
+# "base" holds the values stored directly on the attack: range/altRange for swings,
+# every stat for special attacks. Swings keep their per-attack stats under light/heavy.
+VARIANTS = ["base", "light", "heavy"]
+BASE, LIGHT, HEAVY = 0, 1, 2
+
+SWING_RANGE_STATS = ["range", "altRange"]
+
+# Matrix rows are computed in blocks so the (rows x weapons x comparisons) sign tensor stays small.
+DEFAULT_BLOCK_SIZE = 256
+
+@dataclass
+class PackedWeapons:
+    """Every weapon's attack stats packed into one (weapon x attack x variant x stat) array."""
+    names: List[str]
+    attacks: List[str]
+    stats: List[str]
+    values: np.ndarray
+    # (weapon x attack) mask, attacks only compare when both weapons have them
+    has_attack: np.ndarray
+    # Multiplier applied to the *opponent's* stamina damage, (100 - staminaDamageNegation) / 100
+    stamina_multiplier: np.ndarray
+
+@dataclass
+class Comparisons:
+    """Flattened list of (attack, variant, stat) comparisons in the order the scalar matchup sums them."""
+    attack_index: np.ndarray
+    variant_index: np.ndarray
+    stat_index: np.ndarray
+    weights: np.ndarray
+    # True where the python weight is a float, which makes the scalar matchup a float instead of an int
+    float_weights: np.ndarray
+
+def damage_output_multiplier(weapon) -> float:
+    damage_type = weapon["damageType"]
+    if damage_type == "Blunt":
+        return 1.2125 # (1 + 1 + 1.35 + 1.5) / 4
+    elif damage_type == "Slash":
+        return 1.10625
+    return 1
+
+def pack_weapons(weapons, attacks: List[str], stats: List[str]) -> PackedWeapons:
+    """Pack weapon dicts once. Missing stats are packed as 0, matching .get(stat, 0)."""
+    values = np.zeros((len(weapons), len(attacks), len(VARIANTS), len(stats)), dtype=np.float64)
+    has_attack = np.zeros((len(weapons), len(attacks)), dtype=bool)
+    stamina_multiplier = np.empty(len(weapons), dtype=np.float64)
+
+    for w, weapon in enumerate(weapons):
+        multiplier = damage_output_multiplier(weapon)
+        stamina_multiplier[w] = (100 - weapon.get("staminaDamageNegation", 0)) / 100
+
+        for a, attack_name in enumerate(attacks):
+            attack = weapon["attacks"].get(attack_name)
+            if attack is None:
+                continue
+            has_attack[w, a] = True
+
+            if attack_name in SWING_ATTACKS:
+                variants = [(BASE, {stat: attack[stat] for stat in SWING_RANGE_STATS if stat in attack}), (LIGHT, attack["light"]), (HEAVY, attack["heavy"])]
+            else:
+                variants = [(BASE, attack)]
+
+            for v, attack_stats in variants:
+                for s, stat in enumerate(stats):
+                    value = attack_stats.get(stat, 0)
+                    if stat == "damage":
+                        value = value * multiplier
+                    values[w, a, v, s] = value
+
+    return PackedWeapons([weapon["name"] for weapon in weapons], list(attacks), list(stats), values, has_attack, stamina_multiplier)
+
+def pack_bundle(bundle, attacks: List[str], stats: List[str]) -> PackedWeapons:
+    """
+    Same as pack_weapons for every weapon with an id in a weapon_bundle.WeaponBundle,
+    sliced straight out of the mapped stat array instead of walking dicts.
+    """
+    weapons = np.flatnonzero(bundle.has_id)
+    bundle_attacks = bundle.attack_names
+    bundle_stats = bundle.stat_names
+    names = bundle.names
+    damage_types = bundle.damage_types
+
+    values = np.zeros((len(weapons), len(attacks), len(VARIANTS), len(stats)), dtype=np.float64)
+    has_attack = np.zeros((len(weapons), len(attacks)), dtype=bool)
+
+    for a, attack_name in enumerate(attacks):
+        if attack_name not in bundle_attacks:
+            continue
+        bundle_attack = bundle_attacks.index(attack_name)
+        has_attack[:, a] = bundle.has_attack[weapons, bundle_attack]
+        for s, stat in enumerate(stats):
+            if stat in bundle_stats:
+                values[:, a, :, s] = bundle.stats[weapons, bundle_attack, :, bundle_stats.index(stat)]
+
+    # Missing stats are NaN in the bundle, .get(stat, 0) in pack_weapons
+    values = np.nan_to_num(values, nan=0.0)
+    if "damage" in stats:
+        multipliers = np.array([damage_output_multiplier({"damageType": damage_types[w]}) for w in weapons], dtype=np.float64)
+        values[:, :, :, stats.index("damage")] *= multipliers[:, None, None]
+
+    stamina_multiplier = (100 - np.nan_to_num(bundle.stamina_negation[weapons], nan=0.0)) / 100
+    return PackedWeapons([names[w] for w in weapons], list(attacks), list(stats), values, has_attack, stamina_multiplier)
+
+def build_comparisons(packed: PackedWeapons, stat_weights: Dict[str, float], attack_weights: Dict[str, float], light_weight, heavy_weight, skip_unweighted_attacks: bool = True) -> Comparisons:
+    entries = []
+
+    for a, attack_name in enumerate(packed.attacks):
+        attack_weight = attack_weights[attack_name]
+        if attack_weight == 0 and skip_unweighted_attacks:
+            continue
+
+        if attack_name in SWING_ATTACKS:
+            for stat in SWING_RANGE_STATS:
+                entries.append((a, BASE, packed.stats.index(stat), attack_weight * stat_weights[stat]))
+            for variant, variant_weight in [(LIGHT, light_weight), (HEAVY, heavy_weight)]:
+                for stat in stat_weights:
+                    entries.append((a, variant, packed.stats.index(stat), attack_weight * stat_weights[stat] * variant_weight))
+        else:
+            for stat in stat_weights:
+                entries.append((a, BASE, packed.stats.index(stat), attack_weight * stat_weights[stat]))
+
+    return Comparisons(
+        np.array([e[0] for e in entries], dtype=np.intp),
+        np.array([e[1] for e in entries], dtype=np.intp),
+        np.array([e[2] for e in entries], dtype=np.intp),
+        np.array([e[3] for e in entries], dtype=np.float64),
+        np.array([isinstance(e[3], float) for e in entries], dtype=bool),
+    )
+
+def comparison_values(packed: PackedWeapons, comparisons: Comparisons) -> np.ndarray:
+    """(weapon x comparison) matrix of the values each comparison looks at."""
+    return packed.values[:, comparisons.attack_index, comparisons.variant_index, comparisons.stat_index]
+
+def sign_tensor(packed: PackedWeapons, comparisons: Comparisons, rows: Optional[Union[slice, np.ndarray]] = None) -> np.ndarray:
+    """
+    (row weapon x weapon x comparison) tensor of np.sign(row stat - other stat).
+    Stamina damage is scaled by the opponent's staminaDamageNegation before comparing.
+    """
+    if rows is None:
+        rows = slice(0, len(packed.names))
+
+    values = comparison_values(packed, comparisons)
+    row_values = values[rows]
+
+    signs = np.sign(row_values[:, None, :] - values[None, :, :])
+
+    stamina_columns = np.flatnonzero(np.array(packed.stats)[comparisons.stat_index] == "staminaDamage")
+    if len(stamina_columns) > 0:
+        multiplier = packed.stamina_multiplier
+        row_stamina = row_values[:, None, stamina_columns] * multiplier[None, :, None]
+        other_stamina = values[None, :, stamina_columns] * multiplier[rows, None, None]
+        signs[:, :, stamina_columns] = np.sign(row_stamina - other_stamina)
+
+    has_attack = packed.has_attack[:, comparisons.attack_index]
+    signs *= has_attack[rows][:, None, :] & has_attack[None, :, :]
+
+    return signs.astype(np.int8)
+
+def matchup_block(packed: PackedWeapons, comparisons: Comparisons, rows: Union[slice, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Matchup scores for a block of rows (a slice or an index array) against every weapon.
+    Comparisons are accumulated in the scalar order so float results are bit-identical.
+    Also returns which scores the scalar implementation would produce as floats.
+    """
+    signs = sign_tensor(packed, comparisons, rows)
+
+    # Each attack is summed on its own and then added to the total, same as calculate_matchup_stats
+    scores = np.zeros(signs.shape[:2], dtype=np.float64)
+    for attack in np.unique(comparisons.attack_index):
+        attack_scores = np.zeros(signs.shape[:2], dtype=np.float64)
+        for k in np.flatnonzero(comparisons.attack_index == attack):
+            attack_scores += signs[:, :, k] * comparisons.weights[k]
+        scores += attack_scores
+
+    is_float = np.any((signs != 0) & comparisons.float_weights[None, None, :], axis=2)
+    return scores, is_float
+
+def matchup_matrix(packed: PackedWeapons, comparisons: Comparisons, block_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    count = len(packed.names)
+    scores = np.zeros((count, count), dtype=np.float64)
+    is_float = np.zeros((count, count), dtype=bool)
+
+    for start in range(0, count, block_size):
+        rows = slice(start, min(start + block_size, count))
+        scores[rows], is_float[rows] = matchup_block(packed, comparisons, rows)
+
+    return scores, is_float
+
+# Set once per worker process by _init_worker, so tasks only carry their row range
+_worker_packed: Optional[PackedWeapons] = None
+_worker_comparisons: Optional[Comparisons] = None
+
+def _init_worker(packed: PackedWeapons, comparisons: Comparisons):
+    global _worker_packed, _worker_comparisons
+    _worker_packed = packed
+    _worker_comparisons = comparisons
+
+def _worker_matchup_rows(start: int, stop: int) -> Tuple[int, np.ndarray, np.ndarray]:
+    (scores, is_float) = matchup_block(_worker_packed, _worker_comparisons, slice(start, stop))
+    return start, scores, is_float
+
+def parallel_matchup_matrix(packed: PackedWeapons, comparisons: Comparisons, workers: int, block_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """Same as matchup_matrix, with row blocks scheduled across a process pool."""
+    count = len(packed.names)
+    if workers <= 1 or count == 0:
+        return matchup_matrix(packed, comparisons, block_size)
+
+    # A few blocks per worker keeps every worker busy when blocks finish unevenly
+    block_size = max(1, min(block_size, math.ceil(count / (workers * 4))))
+
+    scores = np.zeros((count, count), dtype=np.float64)
+    is_float = np.zeros((count, count), dtype=bool)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(packed, comparisons)) as executor:
+        futures = [executor.submit(_worker_matchup_rows, start, min(start + block_size, count)) for start in range(0, count, block_size)]
+        for future in futures:
+            (start, block_scores, block_is_float) = future.result()
+            scores[start:start + len(block_scores)] = block_scores
+            is_float[start:start + len(block_scores)] = block_is_float
+
+    return scores, is_float
+
+def configuration_weights(packed: PackedWeapons, comparisons: Comparisons, configurations: List[Dict]) -> np.ndarray:
+    """
+    (comparison x configuration) weight matrix. Each configuration is a dict with
+    stat_weights, attack_weights, light_weight and heavy_weight, like the generate_matchups constants.
+    """
+    attack_weights = np.array([[configuration["attack_weights"][attack] for attack in packed.attacks] for configuration in configurations], dtype=np.float64)
+    stat_weights = np.array([[configuration["stat_weights"][stat] for stat in packed.stats] for configuration in configurations], dtype=np.float64)
+    variant_weights = np.array([[1, configuration["light_weight"], configuration["heavy_weight"]] for configuration in configurations], dtype=np.float64)
+
+    weights = attack_weights[:, comparisons.attack_index] * stat_weights[:, comparisons.stat_index] * variant_weights[:, comparisons.variant_index]
+    return weights.T
+
+def sweep_matchup_matrices(signs: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Every configuration's full (weapon x weapon) matchup matrix as a single matrix product, shape (weapon x weapon x configuration)."""
+    rows, count, comparison_count = signs.shape
+    return (signs.reshape(rows * count, comparison_count) @ weights).reshape(rows, count, weights.shape[1])
+
+def sweep_average_matchups(packed: PackedWeapons, comparisons: Comparisons, weights: np.ndarray, block_size: int = DEFAULT_BLOCK_SIZE, configuration_block_size: int = 1024) -> np.ndarray:
+    """(weapon x configuration) average matchup. The sign tensor is built once per row block and reused for every configuration."""
+    count = len(packed.names)
+    averages = np.empty((count, weights.shape[1]), dtype=np.float64)
+
+    for start in range(0, count, block_size):
+        rows = slice(start, min(start + block_size, count))
+        signs = sign_tensor(packed, comparisons, rows).astype(np.float64)
+        for configuration_start in range(0, weights.shape[1], configuration_block_size):
+            configurations = slice(configuration_start, configuration_start + configuration_block_size)
+            averages[rows, configurations] = sweep_matchup_matrices(signs, weights[:, configurations]).mean(axis=1)
+
+    return averages
+
+def rank_weapons(averages: np.ndarray) -> np.ndarray:
+    """
+    (configuration x weapon) rank, 1 being the best average matchup.
+    Ties keep roster order, like the stable sort in calculate_matchups.
+    """
+    order = np.argsort(-averages.T, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, averages.shape[0] + 1)[None, :], axis=1)
+    return ranks
+
+def concatenate_packed(packs: List[PackedWeapons]) -> PackedWeapons:
+    """Join packs that share the same attacks and stats, in order."""
+    return PackedWeapons(
+        [name for packed in packs for name in packed.names],
+        packs[0].attacks,
+        packs[0].stats,
+        np.concatenate([packed.values for packed in packs]),
+        np.concatenate([packed.has_attack for packed in packs]),
+        np.concatenate([packed.stamina_multiplier for packed in packs]),
+    )
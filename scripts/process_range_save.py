@@ -1,61 +1,127 @@
+import hashlib
 import json
+import math
 import os
-import statistics
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
 from typing import Dict, List, Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections import defaultdict
 
-# Names from the save data are not consistent with
-# names from abilities override. This helps.
-name_changes = {
-    'SLEDGE HAMMER': 'SLEDGEHAMMER',
-    'CANDELABRA': 'CARRYABLE  CANDELABRA',
-    'FIST': 'FISTS',
-    'MALLET': 'THROWING MALLET',
-    'PICK AXE': 'PICKAXE',
-    'Lions Bane': 'greatsword__malric',
-    'Argon\'s Sword': 'longsword__argon__citadel',
-}
-
-def adapt_name(name: str) -> str:
-    """Adapt weapon name to match the JSON file name."""
-    return name_changes[name] if name in name_changes else name
+import profiling
+from json_stream import iter_items_at
+from weapon_names import NameIndex, load_name_index, range_name
+
+# Where the range measurements live in a save file
+WEAPON_DATA_PATH = ["properties", "WeaponData", "str_props"]
+
+# Bump when the cached aggregates change meaning, old caches are then ignored
+CACHE_VERSION = 2
+
+def add_exact(partials: List[float], value: float):
+    """Add value to the exact sum held in partials (Shewchuk's algorithm, the one behind math.fsum)."""
+    i = 0
+    for partial in partials:
+        if abs(value) < abs(partial):
+            (value, partial) = (partial, value)
+        high = value + partial
+        low = partial - (high - value)
+        if low:
+            partials[i] = low
+            i += 1
+        value = high
+    partials[i:] = [value]
 
 @dataclass
 class AttackStats:
-    """Class to hold statistics for a weapon's attack."""
-    raw_measurements: List[float]
+    """
+    Running statistics for a weapon's attack.
+    Variance is kept with Welford's update, so adding a measurement or merging another AttackStats
+    is constant time. The sum is kept exactly (as a few non-overlapping partials, like math.fsum) so
+    the average matches statistics.mean to the last bit. raw_measurements is only filled when keep_raw is set.
+    """
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    sum_partials: List[float] = field(default_factory=list)
+    min_measurement: float = math.inf
+    max_measurement: float = -math.inf
+    keep_raw: bool = True
+    raw_measurements: List[float] = field(default_factory=list)
+
+    @classmethod
+    def from_measurements(cls, measurements: List[float], keep_raw: bool = True) -> 'AttackStats':
+        stats = cls(keep_raw=keep_raw)
+        for measurement in measurements:
+            stats.add(measurement)
+        return stats
+
+    def add(self, measurement: float):
+        self.count += 1
+        delta = measurement - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (measurement - self.mean)
+        add_exact(self.sum_partials, measurement)
+        self.min_measurement = min(self.min_measurement, measurement)
+        self.max_measurement = max(self.max_measurement, measurement)
+        if self.keep_raw:
+            self.raw_measurements.append(measurement)
+
+    def merge(self, other: 'AttackStats'):
+        """Fold other into this one (Chan et al.), as if its measurements had been added after ours."""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            (self.count, self.mean, self.m2) = (other.count, other.mean, other.m2)
+        else:
+            count = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / count
+            self.m2 += other.m2 + delta * delta * self.count * other.count / count
+            self.count = count
+        for partial in other.sum_partials:
+            add_exact(self.sum_partials, partial)
+        self.min_measurement = min(self.min_measurement, other.min_measurement)
+        self.max_measurement = max(self.max_measurement, other.max_measurement)
+        if self.keep_raw:
+            self.raw_measurements.extend(other.raw_measurements)
     
     @property
     def average_range_measurement(self) -> float:
-        return statistics.mean(self.raw_measurements)
+        return float(sum(Fraction(partial) for partial in self.sum_partials) / self.count)
     
     @property
     def std_deviation(self) -> float:
-        return statistics.stdev(self.raw_measurements) if len(self.raw_measurements) > 1 else 0.0
-    
-    @property
-    def min_measurement(self) -> float:
-        return min(self.raw_measurements)
-    
-    @property
-    def max_measurement(self) -> float:
-        return max(self.raw_measurements)
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
     
     def to_dict(self) -> Dict:
         """Convert stats to dictionary format."""
-        return {
-            "averageRangeMeasurement": self.average_range_measurement,
-            "rawMeasurements": self.raw_measurements,
+        result = {"averageRangeMeasurement": self.average_range_measurement}
+        if self.keep_raw:
+            result["rawMeasurements"] = self.raw_measurements
+        result.update({
             "stdDeviation": self.std_deviation,
             "min": self.min_measurement,
             "max": self.max_measurement
-        }
+        })
+        return result
+
+    def to_state(self) -> Dict:
+        """Everything needed to resume the aggregate, for the range cache."""
+        state = {"count": self.count, "mean": self.mean, "m2": self.m2, "sumPartials": self.sum_partials, "min": self.min_measurement, "max": self.max_measurement}
+        if self.keep_raw:
+            state["rawMeasurements"] = self.raw_measurements
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict, keep_raw: bool = True) -> 'AttackStats':
+        return cls(state["count"], state["mean"], state["m2"], list(state["sumPartials"]), state["min"], state["max"], keep_raw, list(state["rawMeasurements"]) if keep_raw else [])
 
 def process_json_file(file_path: str) -> Dict[str, Dict[str, float]]:
     """Process a single JSON file and extract weapon-attack pairs."""
     with open(file_path, 'r') as f:
         data = json.load(f)
+    profiling.file_read(file_path)
     
     try:
         str_props = data["properties"]["WeaponData"]["str_props"]
@@ -64,49 +130,160 @@ def process_json_file(file_path: str) -> Dict[str, Dict[str, float]]:
         print(f"Warning: File {file_path} does not have the expected structure")
         return {}
 
+def stream_json_file(file_path: str) -> Dict[str, Dict[str, float]]:
+    """Same as process_json_file, but skips straight to WeaponData without decoding the header."""
+    with open(file_path, 'r') as f:
+        try:
+            data = {key: value["value"] for key, value in iter_items_at(f, WEAPON_DATA_PATH)}
+            profiling.file_read(file_path)
+            return data
+        except (KeyError, ValueError):
+            print(f"Warning: File {file_path} does not have the expected structure")
+            return {}
+
 def parse_weapon_attack(key: str) -> Optional[tuple[str, str]]:
-    """Parse a weapon-attack key into separate components."""
+    """Parse a weapon-attack key into separate components. Weapons keep their save name, weapon_names resolves it."""
     try:
         weapon, attack = key.split('-', 1)
-        return adapt_name(weapon.strip()), attack.strip()
+        return weapon.strip(), attack.strip()
     except ValueError:
         print(f"Warning: Invalid key format: {key}")
         return None
 
-def process_directory(directory_path: str) -> Dict:
-    """Process all JSON files in the directory and compute statistics."""
-    # Dictionary to store all measurements for each weapon-attack pair
-    measurements: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
-    
-    # Process each JSON file in the directory
-    for filename in os.listdir(directory_path):
-        if filename.endswith('.json'):
-            file_path = os.path.join(directory_path, filename)
-            weapon_data = process_json_file(file_path)
-            
-            # Group measurements by weapon and attack
-            for key, value in weapon_data.items():
-                parsed = parse_weapon_attack(key)
-                if parsed:
-                    weapon, attack = parsed
-                    measurements[weapon][attack].append(value)
+def process_file(file_path: str, stream: bool = False, keep_raw: bool = True) -> Dict[str, Dict[str, AttackStats]]:
+    """Statistics of a single file, grouped by weapon and attack."""
+    weapon_data = stream_json_file(file_path) if stream else process_json_file(file_path)
+
+    measurements: Dict[str, Dict[str, AttackStats]] = {}
+    for key, value in weapon_data.items():
+        parsed = parse_weapon_attack(key)
+        if parsed:
+            weapon, attack = parsed
+            measurements.setdefault(weapon, {}).setdefault(attack, AttackStats(keep_raw=keep_raw)).add(value)
+    return measurements
+
+def hash_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_range_cache(cache_path: str) -> Dict:
+    """Cached per file aggregates, keyed by file name. Empty if the cache is missing or stale."""
+    if not os.path.isfile(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+        profiling.file_read(cache_path)
+        if cache.get("version") != CACHE_VERSION:
+            print("Range cache is from a different version, reprocessing everything")
+            return {}
+        return cache["files"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Warning: Unable to read range cache {cache_path}: {e}")
+        return {}
+
+def save_range_cache(cache_path: str, files: Dict):
+    # Write next to the cache and swap it in, so an interrupted run never leaves a half written cache
+    temp_path = cache_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f)
+    os.replace(temp_path, cache_path)
+    profiling.file_written(cache_path)
+
+def cached_hash(entry: Optional[Dict], size: int, mtime: int, file_path: str, keep_raw: bool) -> Optional[str]:
+    """Content hash of file_path if the cache entry still describes it, None if it has to be parsed again."""
+    if entry is None or (keep_raw and not entry["raw"]) or entry["size"] != size:
+        return None
+    # Same size and mtime is trusted without reading the file, otherwise the content decides
+    if entry["mtime"] == mtime:
+        return entry["hash"]
+    file_hash = hash_file(file_path)
+    return file_hash if file_hash == entry["hash"] else None
+
+def process_directory(directory_path: str, workers: int = 1, stream: bool = False, keep_raw: bool = True, cache_path: Optional[str] = None, names: Optional[NameIndex] = None) -> Dict:
+    """
+    Process all JSON files in the directory and compute statistics.
+    With cache_path, only files that are new or changed since the last run are parsed.
+    With names, weapons are keyed by the range_name of their file, so every spelling a save uses ends up in one row.
+    Names that match no file keep their save name.
+    """
+    # Running statistics for each weapon-attack pair
+    measurements: Dict[str, Dict[str, AttackStats]] = defaultdict(lambda: defaultdict(lambda: AttackStats(keep_raw=keep_raw)))
+
+    filenames = [filename for filename in os.listdir(directory_path) if filename.endswith('.json')]
+    file_paths = [os.path.join(directory_path, filename) for filename in filenames]
+    partials: List[Optional[Dict[str, Dict[str, AttackStats]]]] = [None] * len(filenames)
+
+    files = {}
+    if cache_path:
+        cached_files = load_range_cache(cache_path)
+        for i, (filename, file_path) in enumerate(zip(filenames, file_paths)):
+            stat = os.stat(file_path)
+            entry = cached_files.get(filename)
+            file_hash = cached_hash(entry, stat.st_size, stat.st_mtime_ns, file_path, keep_raw)
+            if file_hash is not None:
+                partials[i] = {weapon: {attack: AttackStats.from_state(state, keep_raw) for attack, state in attacks.items()} for weapon, attacks in entry["stats"].items()}
+            files[filename] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": file_hash, "raw": keep_raw}
+
+    # Each file is parsed on its own, in parallel when asked to
+    to_parse = [i for i, partial in enumerate(partials) if partial is None]
+    if workers > 1 and len(to_parse) > 1:
+        # Spans and counters of the worker processes are lost, the files are counted here instead
+        with profiling.span("parse", workers=workers), ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(process_file, [file_paths[i] for i in to_parse], [stream] * len(to_parse), [keep_raw] * len(to_parse))
+            for i, partial in zip(to_parse, parsed):
+                partials[i] = partial
+                profiling.file_read(file_paths[i])
+    else:
+        with profiling.span("parse"):
+            for i in to_parse:
+                with profiling.span("parse", file=filenames[i]):
+                    partials[i] = process_file(file_paths[i], stream, keep_raw)
+
+    if cache_path:
+        print(f"Range cache: reused {len(filenames) - len(to_parse)} files, parsed {len(to_parse)}")
+        for i in to_parse:
+            files[filenames[i]]["hash"] = hash_file(file_paths[i])
+        for filename, partial in zip(filenames, partials):
+            # Without raw measurements when they aren't written, a later run that wants them parses the file again
+            files[filename]["stats"] = {weapon: {attack: stats.to_state() for attack, stats in attacks.items()} for weapon, attacks in partial.items()}
+        save_range_cache(cache_path, files)
+
+    # Partial results are merged in directory order so the output doesn't depend on the cache or the number of workers
+    with profiling.span("merge"):
+        merge_measurements(measurements, partials, names)
     
     # Compute statistics for each weapon-attack pair
     result = {"rangeData": {}}
-    for weapon, attacks in measurements.items():
-        result["rangeData"][weapon] = {}
-        for attack, values in attacks.items():
-            result["rangeData"][weapon][attack] = AttackStats(values).to_dict()
+    with profiling.span("transform"):
+        for weapon, attacks in measurements.items():
+            result["rangeData"][weapon] = {}
+            for attack, stats in attacks.items():
+                result["rangeData"][weapon][attack] = stats.to_dict()
     
     return result
 
-def generate_csv(range_data: Dict, output_file: str):
-    """Generate CSV file with average range values for each attack type."""
-    import csv
-    
-    # Define the headers
-    headers = ['Name', 'Slash', 'Alt Slash', 'Stab', 'Alt Stab', 'Overhead', 'Alt Overhead']
-    
+def output_name(weapon: str, names: Optional[NameIndex]) -> str:
+    """Name of a save's weapon in the output, the range_name of its file if it has one."""
+    file = names.resolve(weapon) if names is not None else None
+    return range_name(file) if file is not None else weapon
+
+def merge_measurements(measurements: Dict[str, Dict[str, AttackStats]], partials, names: Optional[NameIndex] = None):
+    """Merge every partial result into measurements, keeping the order of the partials."""
+    for partial in partials:
+        for weapon, attacks in partial.items():
+            weapon = output_name(weapon, names)
+            for attack, stats in attacks.items():
+                measurements[weapon][attack].merge(stats)
+
+# Columns of the range CSV
+CSV_HEADERS = ['Name', 'Slash', 'Alt Slash', 'Stab', 'Alt Stab', 'Overhead', 'Alt Overhead']
+
+def range_rows(range_data: Dict) -> List[Dict]:
+    """Rows of the range CSV, the average range of each attack type per weapon. Missing attacks are None."""
     # Prepare rows
     rows = []
     for weapon, attacks in range_data["rangeData"].items():
@@ -127,19 +304,24 @@ def generate_csv(range_data: Dict, output_file: str):
                                       .replace('AltStab', 'Alt Stab')\
                                       .replace('AltOverhead', 'Alt Overhead')
             
-            if normalized_name in headers:
+            if normalized_name in CSV_HEADERS:
                 row[normalized_name] = stats['averageRangeMeasurement']
         
         rows.append(row)
     
     # Sort rows by weapon name
     rows.sort(key=lambda x: x['Name'])
+    return rows
+
+def generate_csv(range_data: Dict, output_file: str):
+    """Generate CSV file with average range values for each attack type."""
+    import csv
     
     # Write to CSV
     with open(output_file, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
+        writer = csv.DictWriter(f, fieldnames=CSV_HEADERS)
         writer.writeheader()
-        writer.writerows(rows)
+        writer.writerows(range_rows(range_data))
 
 def main():
     """Main function to run the script."""
@@ -149,18 +331,32 @@ def main():
     parser.add_argument('input_dir', help='Directory containing JSON test files')
     parser.add_argument('output_json', help='Output JSON file path')
     parser.add_argument('output_csv', help='Output CSV file path')
+    parser.add_argument('-w', '--weapons_dir', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'weapons'), help='Weapons directory the save names are matched to, weapons are written under the name of their file')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='Number of processes used to parse the test files')
+    parser.add_argument('-s', '--stream', action='store_true', help='Skip straight to the weapon data instead of loading whole save files')
+    parser.add_argument('--no_raw', action='store_true', help='Leave rawMeasurements out of the output JSON')
+    parser.add_argument('-c', '--cache', help='Path to a range cache. Only save files that changed since the last run are parsed')
+    parser.add_argument('--profile', help='Record where the time goes and write it to this path as a Chrome trace, with a text summary next to it')
     
     args = parser.parse_args()
+    if args.profile:
+        profiling.enable()
     
-    # Process the directory
-    result = process_directory(args.input_dir)
-    
-    # Write the results to a JSON file
-    with open(args.output_json, 'w') as f:
-        json.dump(result, f, indent=2)
-    
-    # Generate CSV file
-    generate_csv(result, args.output_csv)
+    try:
+        # Process the directory
+        result = process_directory(args.input_dir, args.workers, args.stream, not args.no_raw, args.cache, load_name_index(args.weapons_dir, {}))
+        
+        with profiling.span("write"):
+            # Write the results to a JSON file
+            with open(args.output_json, 'w') as f:
+                json.dump(result, f, indent=2)
+            profiling.file_written(args.output_json)
+            
+            # Generate CSV file
+            generate_csv(result, args.output_csv)
+            profiling.file_written(args.output_csv)
+    finally:
+        profiling.finish(args.profile)
     
     print(f"Processing complete. Results written to:")
     print(f"  JSON: {args.output_json}")
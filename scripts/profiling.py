@@ -0,0 +1,164 @@
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on windows, peak RSS is left out of the profile there
+    resource = None
+
+# Per weapon and per file spans listed in the summary, slowest first
+SLOWEST_WEAPONS = 10
+
+class Profiler:
+    """
+    Spans, counters and peak RSS of one run, kept in memory until they're written out.
+    Everything is a no-op until enable() is called, so the scripts can be instrumented unconditionally.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.origin = 0
+        self.events: List[Dict] = []
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+        self.origin = time.perf_counter_ns()
+
+    def timestamp(self) -> float:
+        """Microseconds since enable(), the unit of the trace format."""
+        return (time.perf_counter_ns() - self.origin) / 1000
+
+    def record(self, event: Dict):
+        event["pid"] = os.getpid()
+        event["tid"] = threading.get_ident()
+        self.events.append(event)
+
+    def add(self, counter: str, amount: int):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+            value = self.counters[counter]
+        self.record({"name": counter, "ph": "C", "ts": self.timestamp(), "args": {counter: value}})
+
+    def sample_rss(self):
+        peak = peak_rss_mb()
+        if peak is not None:
+            self.record({"name": "peak rss (MB)", "ph": "C", "ts": self.timestamp(), "args": {"peak rss (MB)": peak}})
+
+PROFILER = Profiler()
+
+class Span:
+    def __init__(self, name: str, args: Dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = PROFILER.timestamp()
+        return self
+
+    def __exit__(self, *exc):
+        end = PROFILER.timestamp()
+        PROFILER.record({"name": self.name, "ph": "X", "ts": self.start, "dur": end - self.start, "args": self.args})
+        # Only top level spans sample RSS, per weapon spans would mostly measure getrusage
+        if sub_span_of(self.args) is None:
+            PROFILER.sample_rss()
+        return False
+
+# Shared by every span while profiling is off, entering it does nothing
+NO_SPAN = contextlib.nullcontext()
+
+def enable():
+    PROFILER.enable()
+
+def enabled() -> bool:
+    return PROFILER.enabled
+
+def span(name: str, **args):
+    """
+    with span("merge", weapon=name): ... records how long the block took.
+    A weapon or file argument marks a per weapon sub-span, summarized separately.
+    """
+    if not PROFILER.enabled:
+        return NO_SPAN
+    return Span(name, args)
+
+def file_read(path: str):
+    """Count a file that was just read."""
+    if PROFILER.enabled:
+        PROFILER.add("bytes read", os.path.getsize(path))
+        PROFILER.add("files read", 1)
+
+def file_written(path: str):
+    """Count a file that was just written."""
+    if PROFILER.enabled:
+        PROFILER.add("bytes written", os.path.getsize(path))
+        PROFILER.add("files written", 1)
+
+def peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def trace() -> Dict:
+    """The recorded events in Chrome's trace event format, for chrome://tracing or ui.perfetto.dev."""
+    return {"traceEvents": PROFILER.events, "displayTimeUnit": "ms", "otherData": {"command": " ".join(sys.argv)}}
+
+def sub_span_of(args: Dict) -> Optional[str]:
+    """The argument that marks a per weapon or per file sub-span, None for everything else."""
+    for key in ["weapon", "file"]:
+        if key in args:
+            return key
+    return None
+
+def summary() -> str:
+    spans = [event for event in PROFILER.events if event["ph"] == "X"]
+    totals = {}
+    for event in spans:
+        total = totals.setdefault((event["name"], sub_span_of(event["args"])), [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += event["dur"]
+        total[2] = max(total[2], event["dur"])
+
+    lines = [f"Profile of {' '.join(sys.argv)}", f"Wall time: {PROFILER.timestamp() / 1000:.1f} ms", ""]
+    lines.append(f"{'span':<32}{'count':>8}{'total ms':>12}{'mean ms':>12}{'max ms':>12}")
+    for ((name, sub), (calls, total, longest)) in sorted(totals.items(), key=lambda item: -item[1][1]):
+        label = f"{name} (per {sub})" if sub else name
+        lines.append(f"{label:<32}{calls:>8}{total / 1000:>12.2f}{total / 1000 / calls:>12.3f}{longest / 1000:>12.2f}")
+
+    per_weapon = sorted((event for event in spans if sub_span_of(event["args"])), key=lambda event: -event["dur"])
+    if len(per_weapon) > 0:
+        lines += ["", f"Slowest {min(SLOWEST_WEAPONS, len(per_weapon))} weapons and files:"]
+        for event in per_weapon[:SLOWEST_WEAPONS]:
+            subject = event["args"][sub_span_of(event["args"])]
+            lines.append(f"  {event['name']:<20}{str(subject):<48}{event['dur'] / 1000:>10.2f} ms")
+
+    lines.append("")
+    for (counter, value) in sorted(PROFILER.counters.items()):
+        lines.append(f"{counter}: {value:,}")
+    peak = peak_rss_mb()
+    if peak is not None:
+        lines.append(f"peak rss: {peak:.1f} MB")
+    return "\n".join(lines) + "\n"
+
+def finish(trace_path: Optional[str]):
+    """Write the Chrome trace to trace_path and the summary next to it, and print the summary. Does nothing when profiling is off."""
+    if not PROFILER.enabled or trace_path is None:
+        return
+    PROFILER.sample_rss()
+    text = summary()
+    with open(trace_path, "w") as f:
+        json.dump(trace(), f)
+    summary_path = os.path.splitext(trace_path)[0] + "-summary.txt"
+    with open(summary_path, "w") as f:
+        f.write(text)
+    print(text)
+    print(f"Trace written to {trace_path}, summary to {summary_path}")
@@ -0,0 +1,333 @@
+import argparse
+import gzip
+import json
+import os
+import shutil
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+from weapon_store import read_weapons_dir
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# Bump when the bundle layout changes, the accessor module checks it
+BUNDLE_VERSION = 1
+BUNDLE_FILE = "roster.bundle.json"
+MODULE_FILE = "roster.ts"
+
+# Bytes a use of a shared fragment is charged on top of its text. Besides the index it splits the weapon's text
+# in two, and every piece is one more string to join when the weapon is decoded, so only runs worth it are shared
+FRAGMENT_COST = 20
+
+MINIFIER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+def minify(value) -> str:
+    return MINIFIER.encode(value)
+
+def escaped_length(text: str) -> int:
+    """Length of text once it's inside a json string."""
+    return len(text) + text.count('"') + text.count("\\")
+
+def roster_documents(weapons_dir: str) -> Dict[str, Any]:
+    """The weapons all_weapons.ts exports, every weapon file with an id, keyed by file name without .json."""
+    (documents, _) = read_weapons_dir(weapons_dir)
+    return {os.path.splitext(file)[0]: document for file, document in sorted(documents.items()) if isinstance(document, dict) and "id" in document}
+
+def collect_shapes(value, shapes: Dict[Tuple[str, ...], List[Dict]]):
+    """Every object in value, grouped by its keys in order."""
+    if isinstance(value, dict):
+        shapes.setdefault(tuple(value), []).append(value)
+        for child in value.values():
+            collect_shapes(child, shapes)
+    elif isinstance(value, list):
+        for child in value:
+            collect_shapes(child, shapes)
+
+def plan_runs(keys: Tuple[str, ...], objects: List[Dict]) -> Dict[int, int]:
+    """
+    start -> end of the runs of keys whose text many objects of this shape share, like the -1 fields at the end of
+    every attack or a common set of timings. Picks the runs that make the bundle smallest, by dynamic programming
+    over where each run starts.
+    """
+    count = len(objects)
+    scalar = [all(not isinstance(o[key], (dict, list)) for o in objects) for key in keys]
+    members = [[minify(key) + ":" + minify(o[key]) for o in objects] if scalar[k] else [] for k, key in enumerate(keys)]
+    widths = [[escaped_length(member) for member in column] for column in members]
+
+    # cost[i] is the fewest bytes keys[i:] can take, with the run starting at i ending at end[i]
+    cost = [0] * (len(keys) + 1)
+    end = [0] * len(keys)
+    for i in range(len(keys) - 1, -1, -1):
+        (cost[i], end[i]) = (sum(width + 1 for width in widths[i]) + cost[i + 1], i + 1)
+        # Every object's text of keys[i:j] gets an id, so the distinct ones are counted without building the texts
+        ids = [0] * count
+        lengths = {0: -1}
+        texts: Dict[Tuple[int, str], int] = {}
+        for j in range(i, len(keys)):
+            if not scalar[j]:
+                break
+            distinct = {}
+            for o in range(count):
+                text = texts.setdefault((ids[o], members[j][o]), len(texts) + 1)
+                if text not in distinct:
+                    distinct[text] = lengths[ids[o]] + 1 + widths[j][o]
+                ids[o] = text
+            lengths = distinct
+            if len(distinct) == count:
+                # Nothing is shared any more, and longer runs only share less
+                break
+            if j > i:
+                shared = count * FRAGMENT_COST + sum(length + 3 for length in distinct.values()) + cost[j + 1]
+                if shared < cost[i]:
+                    (cost[i], end[i]) = (shared, j + 1)
+
+    runs = {}
+    i = 0
+    while i < len(keys):
+        if end[i] > i + 1:
+            runs[i] = end[i]
+        i = end[i]
+    return runs
+
+def encode_roster(documents: Dict[str, Any]) -> Dict:
+    """
+    The bundle of documents. Each weapon is its minified json split into pieces, strings are its own text and
+    numbers index the fragments it shares with other weapons, so joining the pieces gives back the json.
+    """
+    objects_by_shape: Dict[Tuple[str, ...], List[Dict]] = {}
+    for document in documents.values():
+        collect_shapes(document, objects_by_shape)
+    runs = {keys: plan_runs(keys, objects) for keys, objects in objects_by_shape.items()}
+
+    fragments: List[str] = []
+    fragment_index: Dict[str, int] = {}
+
+    def emit(value, pieces: List):
+        if isinstance(value, list):
+            pieces.append("[")
+            for i, child in enumerate(value):
+                pieces.append("," if i > 0 else "")
+                emit(child, pieces)
+            pieces.append("]")
+        elif isinstance(value, dict):
+            keys = tuple(value)
+            pieces.append("{")
+            i = 0
+            while i < len(keys):
+                pieces.append("," if i > 0 else "")
+                if i in runs[keys]:
+                    text = ",".join(minify(key) + ":" + minify(value[key]) for key in keys[i:runs[keys][i]])
+                    pieces.append(fragment_index.setdefault(text, len(fragments)))
+                    if pieces[-1] == len(fragments):
+                        fragments.append(text)
+                    i = runs[keys][i]
+                else:
+                    pieces.append(minify(keys[i]) + ":")
+                    emit(value[keys[i]], pieces)
+                    i += 1
+            pieces.append("}")
+        else:
+            pieces.append(minify(value))
+
+    weapons = []
+    for document in documents.values():
+        pieces: List = []
+        emit(document, pieces)
+        weapon = []
+        for piece in pieces:
+            if isinstance(piece, str) and len(weapon) > 0 and isinstance(weapon[-1], str):
+                weapon[-1] += piece
+            elif piece != "":
+                weapon.append(piece)
+        weapons.append(weapon)
+
+    index = {"files": {}, "ids": {}, "names": {}}
+    for i, (file, document) in enumerate(documents.items()):
+        index["files"][file] = i
+        index["ids"].setdefault(document["id"], i)
+        if isinstance(document.get("name"), str):
+            index["names"].setdefault(document["name"], i)
+
+    return {"version": BUNDLE_VERSION, "fragments": fragments, "index": index, "weapons": weapons}
+
+def weapon_text(bundle: Dict, i: int) -> str:
+    """What the accessor module does to decode weapon i, before JSON.parse."""
+    return "".join(bundle["fragments"][piece] if isinstance(piece, int) else piece for piece in bundle["weapons"][i])
+
+def accessor_module(bundle: Dict) -> str:
+    """TypeScript module that imports the bundle and parses each weapon the first time it's asked for."""
+    files = "\n".join(f'  "{file}",' for file in bundle["index"]["files"])
+    return f'''// Generated by scripts/roster_bundle.py from the weapon files, don't edit by hand
+import BUNDLE_IMPORT from "./{BUNDLE_FILE}" assert {{ type: "json" }};
+
+import {{ Weapon }} from "./weapon.js";
+
+type RosterBundle = {{
+  version: number;
+  fragments: string[];
+  index: {{
+    files: Record<string, number>;
+    ids: Record<string, number>;
+    names: Record<string, number>;
+  }};
+  weapons: (string | number)[][];
+}};
+
+const BUNDLE = BUNDLE_IMPORT as unknown as RosterBundle;
+if (BUNDLE.version !== {BUNDLE_VERSION}) {{
+  throw new Error("{BUNDLE_FILE} doesn't match {MODULE_FILE}, run scripts/roster_bundle.py again");
+}}
+
+export const WEAPON_FILES = [
+{files}
+] as const;
+
+export type WeaponFile = (typeof WEAPON_FILES)[number];
+
+const WEAPONS: (Weapon | undefined)[] = [];
+
+function weaponAt(i: number | undefined): Weapon | undefined {{
+  if (i === undefined) {{
+    return undefined;
+  }}
+  let weapon = WEAPONS[i];
+  if (weapon === undefined) {{
+    // Pieces of the weapon's json, numbers are fragments shared with other weapons
+    let text = "";
+    for (const piece of BUNDLE.weapons[i]!) {{
+      text += typeof piece === "number" ? BUNDLE.fragments[piece]! : piece;
+    }}
+    weapon = WEAPONS[i] = JSON.parse(text) as Weapon;
+  }}
+  return weapon;
+}}
+
+export function weaponByFile(file: WeaponFile): Weapon {{
+  return weaponAt(BUNDLE.index.files[file])!;
+}}
+
+export function findWeaponById(id: string): Weapon | undefined {{
+  return weaponAt(BUNDLE.index.ids[id]);
+}}
+
+export function findWeaponByName(name: string): Weapon | undefined {{
+  return weaponAt(BUNDLE.index.names[name]);
+}}
+
+export function allWeapons(): Weapon[] {{
+  return WEAPON_FILES.map((file) => weaponByFile(file));
+}}
+'''
+
+def write_text(path: str, text: str):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def write_bundle(weapons_dir: str, output_dir: str) -> Dict:
+    """Write the bundle and its accessor module to output_dir, after checking every weapon decodes back to its file."""
+    documents = roster_documents(weapons_dir)
+    bundle = encode_roster(documents)
+    for file, i in bundle["index"]["files"].items():
+        if weapon_text(bundle, i) != minify(documents[file]):
+            raise ValueError(f"{file} doesn't survive the roster bundle")
+
+    write_text(os.path.join(output_dir, BUNDLE_FILE), minify(bundle))
+    write_text(os.path.join(output_dir, MODULE_FILE), accessor_module(bundle))
+    return bundle
+
+# What a page view pays, in a fresh node process: JSON.parse of every weapon file, or of the bundle and then
+# decoding none, one or every weapon the way the accessor module does.
+# Reads [weapon file texts, bundle text] from stdin, takes the mode as its argument and prints the time in ms
+NODE_BENCHMARK = """
+const [files, bundleText] = JSON.parse(require("fs").readFileSync(0, "utf8"));
+const mode = process.argv[1];
+let bundle;
+function decode(i) {
+  let text = "";
+  for (const piece of bundle.weapons[i]) {
+    text += typeof piece === "number" ? bundle.fragments[piece] : piece;
+  }
+  return JSON.parse(text);
+}
+const start = process.hrtime.bigint();
+if (mode === "files") {
+  files.map((text) => JSON.parse(text));
+} else {
+  bundle = JSON.parse(bundleText);
+  if (mode === "one") decode(0);
+  if (mode === "all") bundle.weapons.map((_, i) => decode(i));
+}
+console.log(Number(process.hrtime.bigint() - start) / 1e6);
+"""
+
+NODE_MODES = {"files": "nodeFilesMs", "bundle": "nodeBundleMs", "one": "nodeBundleOneMs", "all": "nodeBundleAllMs"}
+
+def compare(weapons_dir: str, output_dir: str, runs: int = 9) -> Dict:
+    """Size and parse time of the bundle against the weapon files all_weapons.ts imports one by one."""
+    documents = roster_documents(weapons_dir)
+    texts = []
+    for file in documents:
+        with open(os.path.join(weapons_dir, file + ".json"), "rb") as f:
+            texts.append(f.read().decode("utf-8"))
+    with open(os.path.join(output_dir, BUNDLE_FILE), "rb") as f:
+        bundle_text = f.read().decode("utf-8")
+    minified = [minify(json.loads(text)) for text in texts]
+
+    results = {
+        "weapons": len(texts),
+        "filesBytes": sum(len(text.encode("utf-8")) for text in texts),
+        "filesMinifiedBytes": sum(len(text.encode("utf-8")) for text in minified),
+        # Consumers bundle the files together, so they compress together too
+        "filesMinifiedGzipBytes": len(gzip.compress("".join(minified).encode("utf-8"), mtime=0)),
+        "bundleBytes": len(bundle_text.encode("utf-8")),
+        "bundleGzipBytes": len(gzip.compress(bundle_text.encode("utf-8"), mtime=0)),
+    }
+    node = shutil.which("node")
+    if node is not None:
+        stdin = json.dumps([texts, bundle_text])
+        for mode, key in NODE_MODES.items():
+            # Median of fresh processes, the first parse is what a page view gets, not a warmed up one
+            times = sorted(float(subprocess.run([node, "-e", NODE_BENCHMARK, mode], input=stdin, capture_output=True, text=True, check=True).stdout) for _ in range(runs))
+            results[key] = times[len(times) // 2]
+    return results
+
+def print_comparison(results: Dict):
+    print(f"{results['weapons']} weapons")
+    print(f"{'':<32}{'files':>12}{'bundle':>12}{'ratio':>8}")
+    rows = [
+        ("bytes", results["filesBytes"], results["bundleBytes"]),
+        ("bytes, files minified", results["filesMinifiedBytes"], results["bundleBytes"]),
+        ("gzip bytes, files minified", results["filesMinifiedGzipBytes"], results["bundleGzipBytes"]),
+    ]
+    if "nodeFilesMs" in results:
+        rows += [
+            ("node parse (ms)", results["nodeFilesMs"], results["nodeBundleMs"]),
+            ("node parse + one weapon (ms)", results["nodeFilesMs"], results["nodeBundleOneMs"]),
+            ("node parse + every weapon (ms)", results["nodeFilesMs"], results["nodeBundleAllMs"]),
+        ]
+    for (label, files, bundle) in rows:
+        print(f"{label:<32}{files:>12.{0 if isinstance(files, int) else 2}f}{bundle:>12.{0 if isinstance(bundle, int) else 2}f}{files / bundle:>7.1f}x")
+    if "nodeFilesMs" not in results:
+        print("WARNING: node isn't installed, skipped the parse times")
+
+def main():
+    parser = argparse.ArgumentParser(description="Bundle the weapon files into one minified roster json, with the TypeScript module that reads it")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(SRC_DIR, "weapons"), help="Path to the weapons directory")
+    parser.add_argument("-o", "--output_dir", default=SRC_DIR, help=f"Where {BUNDLE_FILE} and {MODULE_FILE} go")
+    parser.add_argument("--compare", action="store_true", help="Report the size and parse time of the bundle against the weapon files")
+    parser.add_argument("--results", help="Write the comparison to this json file as well")
+    args = parser.parse_args()
+
+    bundle = write_bundle(args.weapons_dir, args.output_dir)
+    print(f"Bundled {len(bundle['weapons'])} weapons with {len(bundle['fragments'])} shared fragments into {os.path.join(args.output_dir, BUNDLE_FILE)}")
+    if args.compare or args.results:
+        results = compare(args.weapons_dir, args.output_dir)
+        print_comparison(results)
+        if args.results:
+            with open(args.results, "w") as f:
+                json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
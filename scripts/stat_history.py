@@ -0,0 +1,242 @@
+import argparse
+import bisect
+import json
+import os
+import time
+from fnmatch import fnmatchcase
+from typing import Any, Dict, List, Optional, Tuple
+
+from weapon_store import is_weapon_document, read_weapons_dir
+
+# Bump when the layout of the log or the index changes
+HISTORY_VERSION = 1
+
+LOG_FILE = "snapshots.jsonl"
+INDEX_FILE = "index.json"
+
+# value_at of a stat a snapshot doesn't have, null is a value like any other
+MISSING = object()
+
+def flatten(data: Dict, prefix: str, flat: Dict[str, Any]):
+    for key, value in data.items():
+        path = prefix + "." + key
+        if isinstance(value, dict):
+            flatten(value, path, flat)
+        else:
+            flat[path] = value
+
+def roster_stats(documents: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Every value of every weapon file keyed by its path, "Axe.slash.heavy.windup" or "Axe.damageType".
+    Weapons go by name, attacks sit right under it. Files without a name, or with a name that's taken, go by file name.
+    """
+    stats = {}
+    used = set()
+    for file in sorted(documents):
+        document = documents[file]
+        if not isinstance(document, dict):
+            continue
+        key = document.get("name") if is_weapon_document(document) else None
+        if not isinstance(key, str) or key in used:
+            key = os.path.splitext(file)[0]
+        used.add(key)
+        flatten({field: value for field, value in document.items() if field != "attacks"}, key, stats)
+        if isinstance(document.get("attacks"), dict):
+            flatten(document["attacks"], key, stats)
+    return stats
+
+def matches(path: str, pattern: str) -> bool:
+    """Glob patterns match the whole path, anything else matches the end of it: "damage" is every damage stat."""
+    if any(character in pattern for character in "*?["):
+        return fnmatchcase(path, pattern)
+    return path == pattern or path.endswith("." + pattern)
+
+class StatHistory:
+    """
+    Append-only history of the roster. The log holds one line per snapshot with only the paths that changed or
+    disappeared since the one before. The index keeps the same changes per path, [snapshot, value] or [snapshot]
+    for a removal, so a value at any patch is a bisect of that path's changes instead of a replay of the log.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.patches: List[Dict] = []
+        self.series_index: Dict[str, List[List]] = {}
+        # Snapshot numbers of each path's changes, kept next to the index so value_at bisects them directly
+        self.change_numbers: Dict[str, List[int]] = {}
+        self.log_bytes = 0
+        self.load()
+
+    def load(self):
+        log_bytes = os.path.getsize(self.log_path) if os.path.isfile(self.log_path) else 0
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index["version"] == HISTORY_VERSION and index["logBytes"] == log_bytes:
+                (self.patches, self.series_index, self.log_bytes) = (index["patches"], index["series"], log_bytes)
+                self.change_numbers = {path: [change[0] for change in changes] for path, changes in self.series_index.items()}
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        if log_bytes > 0:
+            print(f"Rebuilding the stat history index from {self.log_path}")
+            self.rebuild()
+
+    def rebuild(self):
+        """Index the whole log, only needed when the index is missing or a write was interrupted."""
+        (self.patches, self.series_index, self.change_numbers, self.log_bytes) = ([], {}, {}, 0)
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Half written last line, it's dropped on the next append
+                    break
+                self.index_snapshot(json.loads(line))
+                self.log_bytes += len(line)
+        self.save_index()
+
+    def index_snapshot(self, snapshot: Dict):
+        number = len(self.patches)
+        self.patches.append({"patch": snapshot["patch"], "time": snapshot["time"], "changes": len(snapshot["set"]) + len(snapshot["removed"])})
+        for path, value in snapshot["set"].items():
+            self.series_index.setdefault(path, []).append([number, value])
+            self.change_numbers.setdefault(path, []).append(number)
+        for path in snapshot["removed"]:
+            self.series_index[path].append([number])
+            self.change_numbers[path].append(number)
+
+    def save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": HISTORY_VERSION, "logBytes": self.log_bytes, "patches": self.patches, "series": self.series_index}, f)
+        os.replace(temp_path, self.index_path)
+
+    def current(self) -> Dict[str, Any]:
+        """Every path of the latest snapshot and its value."""
+        return {path: changes[-1][1] for path, changes in self.series_index.items() if len(changes[-1]) == 2}
+
+    def snapshot(self, documents: Dict[str, Any], patch: str, record_unchanged: bool = True) -> Optional[int]:
+        """
+        Append the roster as a snapshot tagged patch, storing only what changed since the last one.
+        Returns the number of changes, or None when nothing changed and record_unchanged is False,
+        or when patch is the latest snapshot and nothing changed since.
+        """
+        stats = roster_stats(documents)
+        previous = self.current()
+        changed = {path: value for path, value in stats.items() if path not in previous or previous[path] != value or type(previous[path]) != type(value)}
+        removed = sorted(path for path in previous if path not in stats)
+        if len(changed) == 0 and len(removed) == 0 and (not record_unchanged or (len(self.patches) > 0 and self.patches[-1]["patch"] == patch)):
+            return None
+
+        snapshot = {"patch": patch, "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "set": changed, "removed": removed}
+        line = (json.dumps(snapshot, separators=(",", ":")) + "\n").encode("utf-8")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.log_path, "ab") as f:
+            # Anything past the indexed end is a line an interrupted run didn't finish
+            f.truncate(self.log_bytes)
+            f.write(line)
+        self.index_snapshot(snapshot)
+        self.log_bytes += len(line)
+        self.save_index()
+        return len(changed) + len(removed)
+
+    def patch_number(self, patch: str) -> int:
+        """Latest snapshot tagged patch. Raises KeyError if there's none."""
+        for number in range(len(self.patches) - 1, -1, -1):
+            if self.patches[number]["patch"] == patch:
+                return number
+        raise KeyError(f"No snapshot of patch {patch}")
+
+    def value_at(self, path: str, number: int) -> Any:
+        changes = self.series_index.get(path, [])
+        position = bisect.bisect_right(self.change_numbers.get(path, []), number) - 1
+        if position < 0 or len(changes[position]) == 1:
+            return MISSING
+        return changes[position][1]
+
+    def paths(self, pattern: str) -> List[str]:
+        return sorted(path for path in self.series_index if matches(path, pattern))
+
+    def series(self, path: str) -> List[Tuple[str, Any]]:
+        """(patch, value) of path at every snapshot, in one walk of its changes."""
+        changes = self.series_index.get(path, [])
+        series = []
+        (position, value) = (0, MISSING)
+        for number, patch in enumerate(self.patches):
+            if position < len(changes) and changes[position][0] == number:
+                value = changes[position][1] if len(changes[position]) == 2 else MISSING
+                position += 1
+            series.append((patch["patch"], value))
+        return series
+
+    def changed_between(self, pattern: str, from_patch: str, to_patch: str) -> List[Tuple[str, Any, Any]]:
+        """(path, value at from_patch, value at to_patch) of every path matching pattern whose value differs."""
+        (start, end) = (self.patch_number(from_patch), self.patch_number(to_patch))
+        changes = []
+        for path in self.paths(pattern):
+            (before, after) = (self.value_at(path, start), self.value_at(path, end))
+            if before != after or type(before) != type(after):
+                changes.append((path, before, after))
+        return changes
+
+def record_weapons_dir(history_dir: str, weapons_dir: str, patch: Optional[str]) -> Optional[int]:
+    """
+    Snapshot a weapons directory. Without a patch name the snapshot is tagged with the time,
+    and only recorded if something changed.
+    """
+    (documents, _) = read_weapons_dir(weapons_dir)
+    history = StatHistory(history_dir)
+    if patch is not None:
+        return history.snapshot(documents, patch)
+    return history.snapshot(documents, "ingest " + time.strftime("%Y-%m-%d %H:%M:%S"), record_unchanged=False)
+
+def format_value(value) -> str:
+    return "-" if value is MISSING else json.dumps(value)
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned history of every weapon stat, one snapshot per patch")
+    parser.add_argument("-d", "--history_dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "processed_data", "stat-history"), help="Directory of the history")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = subparsers.add_parser("snapshot", help="Record the weapons directory as a new snapshot")
+    snapshot.add_argument("-w", "--weapons_dir", required=True, help="Path to the weapons directory")
+    snapshot.add_argument("-p", "--patch", required=True, help="Name of the patch the snapshot is tagged with")
+
+    subparsers.add_parser("patches", help="List every snapshot")
+
+    series = subparsers.add_parser("series", help="Value of a stat at every patch, e.g. Axe.slash.heavy.windup")
+    series.add_argument("pattern", help="Stat path, the end of one (slash.heavy.windup), or a glob (Axe.*.damage)")
+
+    changed = subparsers.add_parser("changed", help="Every stat that changed between two patches, e.g. damage")
+    changed.add_argument("pattern", help="Stat path, the end of one (damage), or a glob (*.heavy.windup)")
+    changed.add_argument("--from", dest="from_patch", required=True, help="Patch to compare from")
+    changed.add_argument("--to", dest="to_patch", required=True, help="Patch to compare to")
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        changes = record_weapons_dir(args.history_dir, args.weapons_dir, args.patch)
+        print(f"Recorded {args.patch}, {changes} changes" if changes is not None else f"Nothing changed since {args.patch}, no snapshot recorded")
+        return
+
+    history = StatHistory(args.history_dir)
+    if args.command == "patches":
+        for patch in history.patches:
+            print(f"{patch['patch']:<32}{patch['time']:<24}{patch['changes']:>8} changes")
+    elif args.command == "series":
+        for path in history.paths(args.pattern):
+            print(path)
+            for (patch, value) in history.series(path):
+                print(f"  {patch:<32}{format_value(value)}")
+    else:
+        try:
+            changes = history.changed_between(args.pattern, args.from_patch, args.to_patch)
+        except KeyError as e:
+            parser.error(e.args[0])
+        for (path, before, after) in changes:
+            print(f"{path}: {format_value(before)} -> {format_value(after)}")
+        print(f"{len(changes)} changes between {args.from_patch} and {args.to_patch}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import copy
+import importlib
+import json
+import os
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from weapon_names import pascal_to_space, raw_file_name
+from weapon_store import is_weapon_document, read_weapons_dir, write_document
+
+ingest = importlib.import_module("ingest-abilities-override")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Attacks in a range save, and where each one is read from in a weapon file
+RANGE_ATTACKS = {
+    "Slash": ("slash", "range"),
+    "Alt Slash": ("slash", "altRange"),
+    "Stab": ("stab", "range"),
+    "Alt Stab": ("stab", "altRange"),
+    "Overhead": ("overhead", "range"),
+    "Alt Overhead": ("overhead", "altRange"),
+}
+
+# How far generated stats stray from their template, and range measurements from each other
+STAT_SPREAD = 0.15
+RANGE_NOISE = 0.01
+
+@dataclass
+class Template:
+    """A real weapon to generate synthetic ones from: its data table rows and its weapon file."""
+    name: str
+    # Keyed by what follows the weapon name in the row name, "" for the weapon's own row
+    rows: Dict[str, Dict]
+    document: Dict
+
+def load_templates(input_json: str, weapons_dir: str) -> Tuple[Dict[str, Dict], List[Template]]:
+    """The Default rows of the data table, and every weapon that has both rows and a weapon file."""
+    rows = ingest.fetch_data(input_json)[0]["Rows"]
+    (documents, _) = read_weapons_dir(weapons_dir)
+
+    default_rows = {}
+    weapon_rows = {}
+    for row_name, item in rows.items():
+        parts = row_name.split(".", 1)
+        if parts[0] == "Default":
+            default_rows[row_name] = item
+            continue
+        weapon_rows.setdefault(parts[0].replace("Weapon_", ""), {})[parts[1] if len(parts) > 1 else ""] = item
+
+    templates = []
+    for name, item_rows in weapon_rows.items():
+        document = documents.get(raw_file_name(name))
+        if is_weapon_document(document):
+            templates.append(Template(name, item_rows, document))
+    return (default_rows, templates)
+
+def synthetic_name(template: Template, i: int) -> str:
+    return f"{template.name}Synth{i}"
+
+def file_name(name: str) -> str:
+    """Weapon file the ingest writes a data table weapon to."""
+    return raw_file_name(name)
+
+def range_name(name: str) -> str:
+    """Name of a weapon in a range save, ingest-range-data maps it back to file_name."""
+    return os.path.splitext(file_name(name))[0].replace("_", " ").upper()
+
+def perturb(value, rng: random.Random, spread: float = STAT_SPREAD):
+    """
+    value scaled by a random factor. -1 and 0 mean "use the default" in the data table, so they're kept,
+    as is anything that isn't a number. Ints stay ints.
+    """
+    if type(value) not in [int, float] or value in [-1, 0]:
+        return value
+    scaled = value * rng.uniform(1 - spread, 1 + spread)
+    if type(value) == int:
+        scaled = round(scaled)
+        return scaled if scaled not in [-1, 0] else value
+    return scaled
+
+def perturb_all(data, rng: random.Random):
+    """Every number in a nested dict perturbed, in place."""
+    for key, value in data.items():
+        if isinstance(value, dict):
+            perturb_all(value, rng)
+        else:
+            data[key] = perturb(value, rng)
+    return data
+
+def pick_templates(templates: List[Template], count: int) -> List[Template]:
+    """The template of each synthetic weapon, cycling through them so every kind of weapon is represented."""
+    return [templates[i % len(templates)] for i in range(count)]
+
+def generate_abilities_override(default_rows: Dict[str, Dict], templates: List[Template], count: int, seed: int = 0) -> List[Dict]:
+    """An AbilitiesOverride data table with count weapons, laid out like the export (Default.Slash, Weapon_X.SlashHeavy, ...)."""
+    rng = random.Random(seed)
+    rows = copy.deepcopy(default_rows)
+    for i, template in enumerate(pick_templates(templates, count)):
+        prefix = "Weapon_" + synthetic_name(template, i)
+        for suffix, item in template.rows.items():
+            rows[prefix + "." + suffix if suffix else prefix] = perturb_all(copy.deepcopy(item), rng)
+
+    return [{
+        "Type": "DataTable",
+        "Name": "AbilitiesOverride",
+        "Class": "UScriptClass'DataTable'",
+        "Properties": {"RowStruct": {"ObjectName": "ScriptStruct'AbilitiesOverrideDataTable'", "ObjectPath": "/Script/TBL"}},
+        "Rows": rows,
+    }]
+
+def generate_roster(templates: List[Template], count: int, seed: int = 0) -> Dict[str, Dict]:
+    """
+    Weapon files for the same count weapons as generate_abilities_override, keyed by file name.
+    Stats are perturbed independently of the data table, so ingesting it changes nearly every stat (the worst case for deep_merge).
+    """
+    rng = random.Random(seed + 1)
+    roster = {}
+    for i, template in enumerate(pick_templates(templates, count)):
+        name = synthetic_name(template, i)
+        document = copy.deepcopy(template.document)
+        perturb_all(document["attacks"], rng)
+        document["name"] = pascal_to_space(name)
+        if "id" in document:
+            document["id"] = f"{document['id']}-synth{i}"
+        roster[file_name(name)] = document
+    return roster
+
+def generate_range_saves(templates: List[Template], count: int, saves: int, seed: int = 0, header: Optional[Dict] = None) -> List[Dict]:
+    """
+    Range test saves measuring the same count weapons, every measurement a little off from the weapon's range.
+    Weapons whose file has no range for an attack don't get a measurement for it.
+    """
+    rng = random.Random(seed + 2)
+    ranges = {}
+    for i, template in enumerate(pick_templates(templates, count)):
+        attacks = template.document["attacks"]
+        name = range_name(synthetic_name(template, i))
+        for attack, (attack_name, stat) in RANGE_ATTACKS.items():
+            value = attacks.get(attack_name, {}).get(stat)
+            if type(value) in [int, float]:
+                ranges[f"{name}-{attack}"] = perturb(float(value), rng)
+
+    return [{
+        "header": header if header is not None else {"type": "Version2"},
+        "properties": {"WeaponData": {
+            "type": "MapProperty",
+            "value_type": "FloatProperty",
+            "str_props": {key: {"type": "FloatProperty", "value": perturb(value, rng, RANGE_NOISE)} for key, value in ranges.items()},
+        }},
+    } for _ in range(saves)]
+
+def save_header(range_dir: str) -> Optional[Dict]:
+    """Header of the first real range save, so generated saves are the same shape."""
+    for save in sorted(os.listdir(range_dir)):
+        if save.endswith(".json"):
+            with open(os.path.join(range_dir, save)) as f:
+                return json.load(f).get("header")
+    return None
+
+def write_synthetic_data(output_dir: str, count: int, saves: int = 4, seed: int = 0,
+                         input_json: str = os.path.join(ROOT, "raw_data", "AbilitiesOverride.json"),
+                         weapons_dir: str = os.path.join(ROOT, "src", "weapons"),
+                         range_dir: str = os.path.join(ROOT, "raw_data", "range_test_iterations")) -> Dict[str, str]:
+    """
+    Write AbilitiesOverride.json, a weapons directory and a directory of range saves for count weapons under output_dir.
+    The same count and seed always give the same files. Returns their paths.
+    """
+    (default_rows, templates) = load_templates(input_json, weapons_dir)
+    paths = {
+        "input_json": os.path.join(output_dir, "AbilitiesOverride.json"),
+        "weapons_dir": os.path.join(output_dir, "weapons"),
+        "range_dir": os.path.join(output_dir, "range_test_iterations"),
+    }
+    os.makedirs(paths["weapons_dir"], exist_ok=True)
+    os.makedirs(paths["range_dir"], exist_ok=True)
+
+    with open(paths["input_json"], "w") as f:
+        json.dump(generate_abilities_override(default_rows, templates, count, seed), f, indent=2)
+    for (file, document) in generate_roster(templates, count, seed).items():
+        write_document(os.path.join(paths["weapons_dir"], file), document)
+    header = save_header(range_dir) if os.path.isdir(range_dir) else None
+    for i, save in enumerate(generate_range_saves(templates, count, saves, seed, header)):
+        with open(os.path.join(paths["range_dir"], f"synthetic-{i}.json"), "w") as f:
+            json.dump(save, f, indent=2)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic AbilitiesOverride.json, weapon roster and range saves, modelled on the real ones")
+    parser.add_argument("-n", "--weapons", type=int, required=True, help="Number of weapons to generate")
+    parser.add_argument("-o", "--output_dir", required=True, help="Where to put the generated files")
+    parser.add_argument("--saves", type=int, default=4, help="Number of range test saves")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed, the same seed gives the same files")
+    args = parser.parse_args()
+
+    paths = write_synthetic_data(args.output_dir, args.weapons, args.saves, args.seed)
+    print(f"Generated {args.weapons} weapons:")
+    for path in paths.values():
+        print(f"  {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from weapon_store import is_weapon_document, read_weapons_dir
+
+MAGIC = b"C2WB"
+BUNDLE_VERSION = 1
+
+VARIANTS = ["base", "light", "heavy"]
+BASE, LIGHT, HEAVY = 0, 1, 2
+
+# Sections in file order, each one starts 8 byte aligned
+SECTIONS = [
+    ("string_offsets", np.uint32),  # string_count + 1 offsets into string_bytes
+    ("string_bytes", np.uint8),     # utf-8 names, ids, weapon types, damage types, attack and stat names
+    ("weapons", np.int32),          # weapon_count x WEAPON_FIELDS, string indices, -1 when missing
+    ("weapon_types", np.uint32),    # string indices, sliced by weaponTypesStart/weaponTypesCount
+    ("stamina_negation", np.float64),
+    ("attack_names", np.uint32),
+    ("stat_names", np.uint32),
+    ("has_attack", np.uint8),       # weapon_count x attack_count
+    ("stats", np.float64),          # weapon_count x attack_count x variant x stat_count, NaN when missing
+]
+
+WEAPON_FIELDS = ["file", "name", "id", "damageType", "weaponTypesStart", "weaponTypesCount"]
+
+# magic, version, weapon count, attack count, stat count, string count,
+# (offset, size) per section, fingerprint of the source files, sha256 of everything after the header
+HEADER = struct.Struct("<4sIIIII" + "QQ" * len(SECTIONS) + "32s32s")
+
+class WeaponBundle:
+    """
+    A compiled, memory mapped copy of the weapons directory.
+    Every array is a read only view straight into the mapped file, nothing is parsed or copied on open.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER.size:
+            raise ValueError(f"{path} is too small to be a weapon bundle")
+        header = HEADER.unpack_from(self._mmap, 0)
+        (magic, version, self.weapon_count, self.attack_count, self.stat_count, self.string_count) = header[:6]
+        if magic != MAGIC or version != BUNDLE_VERSION:
+            raise ValueError(f"{path} is not a version {BUNDLE_VERSION} weapon bundle")
+        self.fingerprint = header[-2]
+        self.checksum = header[-1]
+
+        sections = {}
+        for i, (name, dtype) in enumerate(SECTIONS):
+            (offset, size) = header[6 + i * 2:8 + i * 2]
+            sections[name] = (offset, np.frombuffer(self._mmap, dtype=dtype, count=size // np.dtype(dtype).itemsize, offset=offset))
+
+        self._string_offsets = sections["string_offsets"][1]
+        self._string_base = sections["string_bytes"][0]
+        self._attack_name_indices = sections["attack_names"][1]
+        self._stat_name_indices = sections["stat_names"][1]
+        self.weapons = sections["weapons"][1].reshape(self.weapon_count, len(WEAPON_FIELDS))
+        self.weapon_types = sections["weapon_types"][1]
+        self.stamina_negation = sections["stamina_negation"][1]
+        self.has_attack = sections["has_attack"][1].reshape(self.weapon_count, self.attack_count).view(bool)
+        self.stats = sections["stats"][1].reshape(self.weapon_count, self.attack_count, len(VARIANTS), self.stat_count)
+
+    def close(self):
+        # Views into the map have to be dropped before it can be closed
+        self._string_offsets = self._attack_name_indices = self._stat_name_indices = None
+        self.weapons = self.weapon_types = self.stamina_negation = self.has_attack = self.stats = None
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def verify(self) -> bool:
+        """Check the payload against the checksum in the header."""
+        with memoryview(self._mmap) as view:
+            return hashlib.sha256(view[HEADER.size:]).digest() == self.checksum
+
+    def string(self, index: int) -> Optional[str]:
+        if index < 0:
+            return None
+        start = self._string_base + int(self._string_offsets[index])
+        end = self._string_base + int(self._string_offsets[index + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def field(self, weapon: int, field: str) -> Optional[str]:
+        return self.string(int(self.weapons[weapon, WEAPON_FIELDS.index(field)]))
+
+    @property
+    def names(self) -> List[str]:
+        return [self.field(w, "name") for w in range(self.weapon_count)]
+
+    @property
+    def damage_types(self) -> List[Optional[str]]:
+        return [self.field(w, "damageType") for w in range(self.weapon_count)]
+
+    @property
+    def has_id(self) -> np.ndarray:
+        return self.weapons[:, WEAPON_FIELDS.index("id")] >= 0
+
+    @property
+    def attack_names(self) -> List[str]:
+        return [self.string(int(i)) for i in self._attack_name_indices]
+
+    @property
+    def stat_names(self) -> List[str]:
+        return [self.string(int(i)) for i in self._stat_name_indices]
+
+    def weapon_type_names(self, weapon: int) -> List[str]:
+        start = int(self.weapons[weapon, WEAPON_FIELDS.index("weaponTypesStart")])
+        count = int(self.weapons[weapon, WEAPON_FIELDS.index("weaponTypesCount")])
+        return [self.string(int(i)) for i in self.weapon_types[start:start + count]]
+
+def source_fingerprint(weapons_dir: str) -> bytes:
+    """sha256 of every json file's name, size and mtime. Only stats the files, so checking it is cheap."""
+    digest = hashlib.sha256()
+    for weapon_file in os.listdir(weapons_dir):
+        if weapon_file[-5:] != ".json":
+            continue
+        stat = os.stat(os.path.join(weapons_dir, weapon_file))
+        digest.update(f"{weapon_file}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode("utf-8"))
+    return digest.digest()
+
+def is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def attack_rows(attack: Dict) -> List[Tuple[int, Dict]]:
+    """(variant, stats) rows of one attack, swings are split into their base, light and heavy rows."""
+    if isinstance(attack.get("light"), dict) and isinstance(attack.get("heavy"), dict):
+        return [(BASE, {key: value for key, value in attack.items() if key not in ["light", "heavy"]}), (LIGHT, attack["light"]), (HEAVY, attack["heavy"])]
+    return [(BASE, attack)]
+
+def build_bundle(documents: Dict[str, object], fingerprint: bytes = b"\0" * 32) -> bytes:
+    strings = []
+    string_ids = {}
+
+    def intern(value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    weapons = [(file, document) for file, document in documents.items() if is_weapon_document(document)]
+
+    attack_names = []
+    stat_names = []
+    for (_, weapon) in weapons:
+        for attack_name, attack in weapon["attacks"].items():
+            if attack_name not in attack_names:
+                attack_names.append(attack_name)
+            for (_, values) in attack_rows(attack):
+                for stat, value in values.items():
+                    if is_number(value) and stat not in stat_names:
+                        stat_names.append(stat)
+
+    weapon_table = np.full((len(weapons), len(WEAPON_FIELDS)), -1, dtype=np.int32)
+    weapon_types = []
+    stamina_negation = np.full(len(weapons), np.nan, dtype=np.float64)
+    has_attack = np.zeros((len(weapons), len(attack_names)), dtype=np.uint8)
+    stats = np.full((len(weapons), len(attack_names), len(VARIANTS), len(stat_names)), np.nan, dtype=np.float64)
+
+    for w, (file, weapon) in enumerate(weapons):
+        types = weapon.get("weaponTypes", [])
+        weapon_table[w] = [intern(file), intern(weapon.get("name")), intern(weapon.get("id")), intern(weapon.get("damageType")), len(weapon_types), len(types)]
+        weapon_types.extend(intern(weapon_type) for weapon_type in types)
+        if is_number(weapon.get("staminaDamageNegation")):
+            stamina_negation[w] = weapon["staminaDamageNegation"]
+
+        for attack_name, attack in weapon["attacks"].items():
+            a = attack_names.index(attack_name)
+            has_attack[w, a] = 1
+            for (variant, values) in attack_rows(attack):
+                for stat, value in values.items():
+                    if is_number(value):
+                        stats[w, a, variant, stat_names.index(stat)] = value
+
+    attack_name_indices = np.array([intern(name) for name in attack_names], dtype=np.uint32)
+    stat_name_indices = np.array([intern(name) for name in stat_names], dtype=np.uint32)
+
+    encoded = [string.encode("utf-8") for string in strings]
+    string_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    string_offsets[1:] = np.cumsum([len(string) for string in encoded])
+
+    arrays = {
+        "string_offsets": string_offsets,
+        "string_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "weapons": weapon_table,
+        "weapon_types": np.array(weapon_types, dtype=np.uint32),
+        "stamina_negation": stamina_negation,
+        "attack_names": attack_name_indices,
+        "stat_names": stat_name_indices,
+        "has_attack": has_attack,
+        "stats": stats,
+    }
+
+    payload = bytearray()
+    locations = []
+    for (name, dtype) in SECTIONS:
+        # Pad so every float64 section can be viewed in place
+        payload.extend(b"\0" * (-(HEADER.size + len(payload)) % 8))
+        data = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+        locations.extend([HEADER.size + len(payload), len(data)])
+        payload.extend(data)
+
+    checksum = hashlib.sha256(payload).digest()
+    header = HEADER.pack(MAGIC, BUNDLE_VERSION, len(weapons), len(attack_names), len(stat_names), len(strings), *locations, fingerprint, checksum)
+    return header + bytes(payload)
+
+def write_bundle(weapons_dir: str, path: str):
+    fingerprint = source_fingerprint(weapons_dir)
+    (documents, _) = read_weapons_dir(weapons_dir)
+    data = build_bundle(documents, fingerprint)
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+def open_bundle(path: str, weapons_dir: Optional[str] = None, verify: bool = True) -> WeaponBundle:
+    """
+    Map the bundle at path. When weapons_dir is given, the bundle is rebuilt first if it's missing,
+    unreadable, or the json files changed since it was built. verify checks the payload checksum.
+    """
+    if weapons_dir is not None:
+        fingerprint = source_fingerprint(weapons_dir)
+        try:
+            bundle = WeaponBundle(path)
+            if bundle.fingerprint == fingerprint and (not verify or bundle.verify()):
+                return bundle
+            bundle.close()
+        except (OSError, ValueError):
+            pass
+        print(f"Rebuilding weapon bundle {path} from {weapons_dir}")
+        write_bundle(weapons_dir, path)
+
+    bundle = WeaponBundle(path)
+    if verify and not bundle.verify():
+        bundle.close()
+        raise ValueError(f"{path} failed its checksum, rebuild it with weapon_bundle.py")
+    return bundle
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the weapons directory into a memory mapped binary bundle")
+    parser.add_argument("-w", "--weapons_dir", required=True, help="Path to the weapons directory")
+    parser.add_argument("-o", "--output", required=True, help="Where to put the bundle")
+    args = parser.parse_args()
+
+    write_bundle(args.weapons_dir, args.output)
+    with WeaponBundle(args.output) as bundle:
+        print(f"Bundled {bundle.weapon_count} weapons, {bundle.attack_count} attacks and {bundle.stat_count} stats into {args.output}")
+
+if __name__ == '__main__':
+    main()
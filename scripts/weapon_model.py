@@ -0,0 +1,521 @@
+import json
+import math
+import os
+import sys
+from operator import itemgetter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from weapon_store import DEFAULT_FORMAT, document_text, file_format, is_weapon_document
+
+# Ints past this don't fit a float64 exactly, they're kept as they are with the strings
+MAX_EXACT_INT = 2 ** 53
+
+# Indices into the pool are this small until it has more numbers than fit
+SMALL_INDEX_LIMIT = 2 ** 16
+
+
+NUMBER, EXTRA = "n", "x"
+
+class ValuePool:
+    """
+    Every distinct number of the weapons of a roster, once, in one float64 array, with whether it was an int.
+    Weapons hold indices into it: the roster repeats the same few hundred timings and damages,
+    so an index is a fraction of the number it stands for. A weapon that changes a stat points at the new number,
+    the old one stays. Numbers added in a scratch are dropped at its end, Roster.compact drops the rest.
+    """
+    __slots__ = ("values", "is_int", "size", "floats", "ints")
+
+    def __init__(self):
+        self.values = np.empty(1024, dtype=np.float64)
+        self.is_int = np.empty(1024, dtype=bool)
+        self.size = 0
+        self.floats: Dict[Any, int] = {}
+        self.ints: Dict[int, int] = {}
+
+    @staticmethod
+    def key(number: Union[int, float]) -> Any:
+        # -0.0 == 0.0, but they're different numbers in a json file
+        return number if type(number) is int or number != 0 or math.copysign(1.0, number) > 0 else "-0.0"
+
+    def add(self, numbers: List[Union[int, float]]) -> List[int]:
+        indices = []
+        for number in numbers:
+            is_int = type(number) is int
+            positions = self.ints if is_int else self.floats
+            key = ValuePool.key(number)
+            position = positions.get(key)
+            if position is None:
+                self.grow(1)
+                position = self.size
+                self.values[position] = number
+                self.is_int[position] = is_int
+                positions[key] = position
+                self.size += 1
+            indices.append(position)
+        return indices
+
+    def add_array(self, values: np.ndarray, is_int: np.ndarray) -> np.ndarray:
+        """
+        add for many numbers at once, ints where is_int. They're deduplicated by their float64 bits first,
+        which tell -0.0 from 0.0 too, so only the distinct ones are looked up.
+        """
+        indices = np.empty(len(values), dtype=np.int64)
+        for (flag, positions) in [(True, self.ints), (False, self.floats)]:
+            mask = is_int == flag
+            if not mask.any():
+                continue
+            (bits, inverse) = np.unique(values[mask].view(np.int64), return_inverse=True)
+            distinct = bits.view(np.float64)
+            numbers = [int(number) for number in distinct.tolist()] if flag else distinct.tolist()
+            found = np.array([positions.get(ValuePool.key(number), -1) for number in numbers], dtype=np.int64)
+            new = np.flatnonzero(found < 0)
+            if len(new) > 0:
+                self.grow(len(new))
+                found[new] = np.arange(self.size, self.size + len(new))
+                self.values[self.size:self.size + len(new)] = distinct[new]
+                self.is_int[self.size:self.size + len(new)] = flag
+                self.size += len(new)
+                positions.update((ValuePool.key(numbers[i]), position) for (i, position) in zip(new.tolist(), found[new].tolist()))
+            indices[mask] = found[inverse]
+        return indices
+
+    def grow(self, count: int):
+        """Make room for count more numbers."""
+        while self.size + count > len(self.values):
+            self.values = np.concatenate([self.values, np.empty(len(self.values), dtype=np.float64)])
+            self.is_int = np.concatenate([self.is_int, np.empty(len(self.is_int), dtype=bool)])
+
+    def truncate(self, size: int):
+        """Drop every number added after the pool had size numbers."""
+        for (value, is_int) in zip(self.values[size:self.size].tolist(), self.is_int[size:self.size].tolist()):
+            if is_int:
+                del self.ints[int(value)]
+            else:
+                del self.floats[ValuePool.key(value)]
+        self.size = size
+
+    @contextmanager
+    def scratch(self):
+        """Numbers added inside are dropped at the end, so only weapons made inside may point at them."""
+        size = self.size
+        try:
+            yield self
+        finally:
+            self.truncate(size)
+
+    def numbers(self, indices: np.ndarray) -> List[Union[int, float]]:
+        """The numbers at indices as json had them, ints as ints."""
+        return [int(value) if is_int else value for (value, is_int) in zip(self.values[indices].tolist(), self.is_int[indices].tolist())]
+
+    def index_dtype(self):
+        return np.uint16 if self.size <= SMALL_INDEX_LIMIT else np.uint32
+
+class Layout:
+    """
+    Shape of one json object: its keys in order, and for each whether it's a number, something else (a string, a bool,
+    a list...) or another object. Numbers and other values are numbered in file order, relative to the object, so the
+    same layout fits every light attack of every weapon. Layouts are interned, a roster only has a handful.
+    """
+    __slots__ = ("entries", "numbers", "extras", "stat_slots")
+
+    def __init__(self, signature: Tuple):
+        # Key -> (NUMBER, offset), (EXTRA, offset) or (child layout, number offset, extra offset)
+        self.entries: Dict[str, Tuple] = {}
+        (numbers, extras) = (0, 0)
+        for key, child in signature:
+            if child == NUMBER:
+                self.entries[key] = (NUMBER, numbers)
+                numbers += 1
+            elif child == EXTRA:
+                self.entries[key] = (EXTRA, extras)
+                extras += 1
+            else:
+                self.entries[key] = (child, numbers, extras)
+                numbers += child.numbers
+                extras += child.extras
+        self.numbers = numbers
+        self.extras = extras
+        self.stat_slots: Dict[str, np.ndarray] = {}
+
+    def slots_of(self, stat: str) -> np.ndarray:
+        """Offsets of every number called stat in the object and the objects inside it."""
+        slots = self.stat_slots.get(stat)
+        if slots is None:
+            found = []
+            for key, entry in self.entries.items():
+                if entry[0] == NUMBER:
+                    if key == stat:
+                        found.append(entry[1])
+                elif entry[0] != EXTRA:
+                    found += (entry[0].slots_of(stat) + entry[1]).tolist()
+            slots = np.array(sorted(found), dtype=np.intp)
+            self.stat_slots[stat] = slots
+        return slots
+
+# Every layout in use, by signature. Shared by every roster, there are only as many as there are shapes of weapon file
+LAYOUTS: Dict[Tuple, Layout] = {}
+
+def freeze(value):
+    """Lists become tuples, so weapons can share their extras until one of them changes. Strings are shared too."""
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return sys.intern(value) if isinstance(value, str) else value
+
+def thaw(value):
+    return [thaw(item) for item in value] if isinstance(value, tuple) else value
+
+def flatten(data: Dict, numbers: List[Union[int, float]], extras: List[Any]) -> Layout:
+    """Layout of data, appending its numbers and other values in file order."""
+    signature = []
+    for key, value in data.items():
+        if isinstance(value, dict):
+            signature.append((key, flatten(value, numbers, extras)))
+        elif type(value) is float or (type(value) is int and -MAX_EXACT_INT <= value <= MAX_EXACT_INT):
+            signature.append((key, NUMBER))
+            numbers.append(value)
+        else:
+            signature.append((key, EXTRA))
+            extras.append(freeze(value))
+    return interned_layout(tuple(signature))
+
+def interned_layout(signature: Tuple) -> Layout:
+    layout = LAYOUTS.get(signature)
+    if layout is None:
+        layout = Layout(signature)
+        LAYOUTS[signature] = layout
+    return layout
+
+class Shape:
+    """
+    What flatten does with every object that has the same keys and the same types of value, worked out once.
+    Its values are taken in runs between the objects inside it, the numbers of a run with one itemgetter.
+    Every int is taken as a number, Weapon.from_document checks that they all fit a float64.
+    """
+    __slots__ = ("steps", "kinds", "layout", "layouts")
+
+    def __init__(self, keys: Tuple[str, ...], types: Tuple[type, ...]):
+        # (getter of the numbers of a run, whether each is an int, positions of the extras of the run, position of the object after it)
+        self.steps: List[Tuple] = []
+        self.kinds: List[Tuple[str, Any]] = []
+        run: List[Tuple[int, type]] = []
+        for position, (key, kind) in enumerate(zip(keys, types)):
+            if issubclass(kind, dict):
+                self.add_step(run, position)
+                self.kinds.append((key, None))
+                run = []
+            else:
+                run.append((position, kind))
+                self.kinds.append((key, NUMBER if kind is float or kind is int else EXTRA))
+        self.add_step(run, None)
+        # Objects without objects inside always have the same layout, the others one per layout of those
+        self.layout = interned_layout(tuple(self.kinds)) if all(kind is not None for (_, kind) in self.kinds) else None
+        self.layouts: Dict[Tuple, Layout] = {}
+        if self.layout is not None:
+            # Only needed to put together the layouts of objects with objects inside
+            self.kinds = ()
+
+    def add_step(self, run: List[Tuple[int, type]], child: Optional[int]):
+        numbers = [position for (position, kind) in run if kind is float or kind is int]
+        getter = None
+        if len(numbers) == 1:
+            getter = (lambda values, position=numbers[0]: (values[position],))
+        elif len(numbers) > 1:
+            getter = itemgetter(*numbers)
+        is_int = tuple(kind is int for (_, kind) in run if kind is float or kind is int)
+        extras = tuple(position for (position, kind) in run if not (kind is float or kind is int))
+        if getter is not None or len(extras) > 0 or child is not None:
+            self.steps.append((getter, is_int, extras, child))
+
+# Shapes by the keys of an object and the types of its values
+SHAPES: Dict[Tuple, Shape] = {}
+
+def flatten_shaped(data: Dict, numbers: List[Union[int, float]], is_int: List[bool], extras: List[Any]) -> Layout:
+    """flatten, with the number and extra positions of each object looked up by its shape instead of found value by value."""
+    values = tuple(data.values())
+    key = (tuple(data), tuple(map(type, values)))
+    shape = SHAPES.get(key)
+    if shape is None:
+        shape = Shape(*key)
+        SHAPES[key] = shape
+
+    children = []
+    for (getter, flags, extra_positions, child) in shape.steps:
+        if getter is not None:
+            numbers.extend(getter(values))
+            is_int.extend(flags)
+        for position in extra_positions:
+            extras.append(freeze(values[position]))
+        if child is not None:
+            children.append(flatten_shaped(values[child], numbers, is_int, extras))
+    if shape.layout is not None:
+        return shape.layout
+
+    children = tuple(children)
+    layout = shape.layouts.get(children)
+    if layout is None:
+        child_layouts = iter(children)
+        layout = interned_layout(tuple((key, kind if kind is not None else next(child_layouts)) for (key, kind) in shape.kinds))
+        shape.layouts[children] = layout
+    return layout
+
+def build(layout: Layout, numbers: List, extras: Tuple, number_base: int, extra_base: int) -> Dict:
+    data = {}
+    for key, entry in layout.entries.items():
+        if entry[0] == NUMBER:
+            data[key] = numbers[number_base + entry[1]]
+        elif entry[0] == EXTRA:
+            data[key] = thaw(extras[extra_base + entry[1]])
+        else:
+            data[key] = build(entry[0], numbers, extras, number_base + entry[1], extra_base + entry[2])
+    return data
+
+class Value:
+    """A field of a weapon or attack, read from the pool or the weapon's extras. None when the file doesn't have it."""
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, view, owner=None):
+        if view is None:
+            return self
+        return view.get(self.name)
+
+    def __set__(self, view, value):
+        view.set(self.name, value)
+
+class Stats:
+    """View on one object of a weapon file, whose numbers and extras start at number_base and extra_base."""
+    __slots__ = ("weapon", "layout", "number_base", "extra_base")
+
+    def __init__(self, weapon: "Weapon", layout: Layout, number_base: int = 0, extra_base: int = 0):
+        self.weapon = weapon
+        self.layout = layout
+        self.number_base = number_base
+        self.extra_base = extra_base
+
+    def keys(self) -> List[str]:
+        return list(self.layout.entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.layout.entries
+
+    def __getitem__(self, key: str):
+        """Like the dict it stands for, so helpers written for weapon dicts can read it too."""
+        if key not in self.layout.entries:
+            raise KeyError(key)
+        return self.get(key)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self.get(key)) for key in self.layout.entries]
+
+    def get(self, key: str, default=None):
+        entry = self.layout.entries.get(key)
+        if entry is None:
+            return default
+        if entry[0] == NUMBER:
+            (pool, index) = (self.weapon.pool, self.weapon.index[self.number_base + entry[1]])
+            return int(pool.values[index]) if pool.is_int[index] else float(pool.values[index])
+        if entry[0] == EXTRA:
+            return thaw(self.weapon.extras[self.extra_base + entry[1]])
+        return self.view(entry[0], self.number_base + entry[1], self.extra_base + entry[2])
+
+    def set(self, key: str, value):
+        entry = self.layout.entries.get(key)
+        if entry is None or entry[0] not in [NUMBER, EXTRA]:
+            raise KeyError(f"{key} is not a value of this weapon's layout")
+        if entry[0] == EXTRA:
+            extras = list(self.weapon.extras)
+            extras[self.extra_base + entry[1]] = freeze(value)
+            self.weapon.extras = tuple(extras)
+        elif type(value) not in [int, float]:
+            raise TypeError(f"Expected a number for {key}, got {value!r}")
+        else:
+            self.weapon.point([self.number_base + entry[1]], [value])
+
+    def update(self, values: Dict[str, Any]):
+        for key, value in values.items():
+            self.set(key, value)
+
+    def view(self, layout: Layout, number_base: int, extra_base: int) -> "Stats":
+        return Stats(self.weapon, layout, number_base, extra_base)
+
+    def to_dict(self) -> Dict:
+        numbers = self.weapon.pool.numbers(self.weapon.index[self.number_base:self.number_base + self.layout.numbers])
+        return build(self.layout, numbers, self.weapon.extras, 0, self.extra_base)
+
+class MeleeAttack(Stats):
+    __slots__ = ()
+    damage = Value()
+    staminaDamage = Value()
+    holding = Value()
+    windup = Value()
+    release = Value()
+    recovery = Value()
+    combo = Value()
+    thwack = Value()
+    riposte = Value()
+    cleaveOverride = Value()
+    damageTypeOverride = Value()
+    turnLimitStrength = Value()
+    verticalTurnLimitStrength = Value()
+    reverseTurnLimitStrength = Value()
+
+class SpecialAttack(MeleeAttack):
+    __slots__ = ()
+    range = Value()
+
+class Swing(Stats):
+    __slots__ = ()
+    range = Value()
+    altRange = Value()
+    light = Value()
+    heavy = Value()
+
+    def view(self, layout: Layout, number_base: int, extra_base: int) -> Stats:
+        return MeleeAttack(self.weapon, layout, number_base, extra_base)
+
+class Weapon(Stats):
+    """
+    A weapon file, mirroring src/weapon.ts. Its numbers are indices into the pool of its roster and everything else
+    sits in a tuple, both laid out by shared Layouts. Copying is one array copy, and scale changes a stat of
+    every attack with one gather and one multiply. to_document gives back the exact json the weapon was loaded from.
+    """
+    __slots__ = ("index", "extras", "pool")
+
+    id = Value()
+    name = Value()
+    aliases = Value()
+    classes = Value()
+    subclasses = Value()
+    weaponTypes = Value()
+    damageType = Value()
+    staminaDamageNegation = Value()
+
+    def __init__(self, layout: Layout, index: np.ndarray, extras: Tuple, pool: ValuePool):
+        self.layout = layout
+        (self.number_base, self.extra_base) = (0, 0)
+        self.index = index
+        self.extras = extras
+        self.pool = pool
+
+    @property
+    def weapon(self) -> "Weapon":
+        # Rather than a reference to itself, which would keep every weapon alive until the garbage collector runs
+        return self
+
+    @classmethod
+    def from_document(cls, document: Dict, pool: Optional[ValuePool] = None) -> "Weapon":
+        """The weapon of a parsed file, its numbers added to pool. Without one the weapon gets a pool of its own."""
+        return cls.from_documents([document], pool if pool is not None else ValuePool())[0]
+
+    @classmethod
+    def from_documents(cls, documents: List[Dict], pool: ValuePool) -> List["Weapon"]:
+        """The weapons of parsed files, with the numbers of all of them added to pool at once."""
+        (numbers, is_int, flattened) = ([], [], [])
+        for document in documents:
+            (start, extras) = (len(numbers), [])
+            layout = flatten_shaped(document, numbers, is_int, extras)
+            flattened.append((layout, start, len(numbers), tuple(extras)))
+        try:
+            values = np.array(numbers, dtype=np.float64)
+        except OverflowError:
+            values = None
+        is_int = np.array(is_int, dtype=bool)
+        if values is None or np.any(np.abs(values[is_int]) >= MAX_EXACT_INT):
+            # Ints too big for a float64 are extras, which flatten tells apart number by number
+            return [cls.from_flattened(document, pool) for document in documents]
+
+        # Each weapon's index is its own slice of one array
+        indices = pool.add_array(values, is_int).astype(pool.index_dtype())
+        return [cls(layout, indices[start:stop], extras, pool) for (layout, start, stop, extras) in flattened]
+
+    @classmethod
+    def from_flattened(cls, document: Dict, pool: ValuePool) -> "Weapon":
+        (numbers, extras) = ([], [])
+        layout = flatten(document, numbers, extras)
+        return cls(layout, np.array(pool.add(numbers), dtype=pool.index_dtype()), tuple(extras), pool)
+
+    @property
+    def values(self) -> np.ndarray:
+        """Every number of the weapon as a float, in file order."""
+        return self.pool.values[self.index]
+
+    def copy(self) -> "Weapon":
+        # Extras are immutable, writes replace the tuple
+        return Weapon(self.layout, self.index.copy(), self.extras, self.pool)
+
+    def point(self, slots, numbers: List[Union[int, float]]):
+        indices = self.pool.add(numbers)
+        if self.index.dtype != self.pool.index_dtype():
+            self.index = self.index.astype(self.pool.index_dtype())
+        self.index[slots] = indices
+
+    @property
+    def attacks(self) -> Dict[str, Union[Swing, SpecialAttack]]:
+        attacks = self.get("attacks")
+        return {name: self.attack(name) for name in attacks.keys()} if isinstance(attacks, Stats) else {}
+
+    def attack(self, name: str) -> Optional[Union[Swing, SpecialAttack]]:
+        attacks = self.get("attacks")
+        entry = attacks.layout.entries.get(name) if isinstance(attacks, Stats) else None
+        if entry is None or entry[0] in [NUMBER, EXTRA]:
+            return None
+        view = Swing if "light" in entry[0].entries else SpecialAttack
+        return view(self, entry[0], attacks.number_base + entry[1], attacks.extra_base + entry[2])
+
+    def scale(self, stat: str, factor: Union[int, float]):
+        """Multiply stat in every attack by factor, in place. Ints stay ints only when factor is an int, like in python."""
+        entry = self.layout.entries.get("attacks")
+        if entry is None or entry[0] in [NUMBER, EXTRA]:
+            return
+        slots = entry[0].slots_of(stat) + entry[1]
+        indices = self.index[slots]
+        scaled = (self.pool.values[indices] * factor).tolist()
+        if type(factor) is int:
+            scaled = [int(value) if is_int else value for (value, is_int) in zip(scaled, self.pool.is_int[indices].tolist())]
+        self.point(slots, scaled)
+
+    def to_document(self) -> Dict:
+        return build(self.layout, self.pool.numbers(self.index), self.extras, 0, 0)
+
+    def dumps(self, line_format: Dict = DEFAULT_FORMAT) -> str:
+        """The text of the weapon file, before line endings are translated, like weapon_store.document_text."""
+        return document_text(self.to_document(), line_format)
+
+@dataclass
+class Roster:
+    """Weapons by file name, the line format of each file like read_weapons_dir, and the pool their numbers live in."""
+    pool: ValuePool = field(default_factory=ValuePool)
+    weapons: Dict[str, Weapon] = field(default_factory=dict)
+    formats: Dict[str, Dict] = field(default_factory=dict)
+
+    def compact(self):
+        """
+        Move the weapons of the roster to a new pool with only the numbers they use. Copies that aren't in the roster
+        keep the old pool, which goes away with the last of them.
+        """
+        pool = ValuePool()
+        indices = {file: pool.add(self.pool.numbers(weapon.index)) for file, weapon in self.weapons.items()}
+        for file, weapon in self.weapons.items():
+            (weapon.index, weapon.pool) = (np.array(indices[file], dtype=pool.index_dtype()), pool)
+        self.pool = pool
+
+def load_roster(weapons_dir: str, pool: Optional[ValuePool] = None) -> Roster:
+    """Every weapon file of a directory as a Weapon. With a pool, the weapons share it with the ones already in it."""
+    roster = Roster(pool if pool is not None else ValuePool())
+    documents = {}
+    for file in sorted(os.listdir(weapons_dir)):
+        if not file.endswith(".json"):
+            continue
+        with open(os.path.join(weapons_dir, file), "r", newline="") as f:
+            text = f.read()
+        document = json.loads(text)
+        if is_weapon_document(document):
+            documents[file] = document
+            roster.formats[file] = file_format(text)
+    roster.weapons = dict(zip(documents, Weapon.from_documents(list(documents.values()), roster.pool)))
+    return roster
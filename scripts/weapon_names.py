@@ -0,0 +1,168 @@
+import argparse
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from weapon_store import read_weapons_dir
+
+# Names that don't lead to their weapon file by themselves, alias -> file.
+# Weapon files can add their own with an "aliases" list.
+NAME_ALIASES = {
+    # Range test saves
+    "CANDELABRA": "carryable__candelabra.json",
+    "FIST": "fists.json",
+    "MALLET": "throwing_mallet.json",
+    "Lions Bane": "greatsword__malric.json",
+    "Argon's Sword": "longsword__argon__citadel.json",
+}
+
+# Display names of weapons whose name in the abilities override doesn't read well
+DISPLAY_NAMES = {
+    "Longsword_Argon_Citadel": "Argon's Sword",
+    "Greatsword_Malric": "Lion's Bane",
+    "Carryable_Candelabra": "Candelabra",
+}
+
+CAPITALS = re.compile(r'(?<!^)(?=[A-Z])')
+NOT_ALPHANUMERIC = re.compile(r'[^0-9a-z]+')
+
+# Suggestions have to share at least this much of their trigrams with the name
+MIN_SIMILARITY = 0.3
+
+def pascal_to_camel(s: str) -> str:
+    return CAPITALS.sub('_', s).lower()
+
+def pascal_to_space(s: str) -> str:
+    return CAPITALS.sub(' ', s).replace("  ", " ")
+
+def raw_file_name(raw_name: str) -> str:
+    """File a weapon of the abilities override is written to, LongswordArgon -> longsword_argon.json."""
+    return pascal_to_camel(raw_name) + ".json"
+
+def display_name(raw_name: str) -> str:
+    return DISPLAY_NAMES[raw_name] if raw_name in DISPLAY_NAMES else pascal_to_space(raw_name)
+
+def range_name(file: str) -> str:
+    """Name a weapon goes by in the range output, carryable__candelabra.json -> CARRYABLE  CANDELABRA."""
+    return os.path.splitext(file)[0].replace("_", " ").upper()
+
+def name_key(name: str) -> str:
+    """Case, spaces and punctuation don't tell weapons apart: "Lions Bane", "Lion's Bane" and "LIONS_BANE" are the same key."""
+    return NOT_ALPHANUMERIC.sub("", name.lower())
+
+def trigrams(key: str) -> List[str]:
+    padded = f"  {key} "
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+class NameIndex:
+    """
+    Every name a weapon goes by, file name, id, display name or alias, mapped to its file.
+    resolve tries the name as is, then as an abilities override name, then its name_key, all dict lookups.
+    Names that resolve to nothing are kept, with suggestions, for report.
+    """
+
+    def __init__(self, files: Iterable[str], documents: Optional[Dict[str, Any]] = None, aliases: Dict[str, str] = NAME_ALIASES):
+        documents = documents or {}
+        files = sorted(set(files) | {file for file in documents if file.endswith(".json")})
+        self.files = files
+        self.names: Dict[str, str] = {}
+        self.keys: Dict[str, str] = {}
+        self.ambiguous: Dict[str, List[str]] = {}
+        self.unresolved: Dict[str, Dict[str, Any]] = {}
+
+        # Earlier tiers win, so a file name is never shadowed by another weapon's display name, or a display name by
+        # the looser aliases weapon files list (Lion's Bane goes by "Greatsword" too)
+        tiers = [
+            [(file, [file, os.path.splitext(file)[0]]) for file in files],
+            [(file, [alias]) for alias, file in aliases.items() if file in files]
+            + [(file, [document["name"]]) for file, document in self.weapon_documents(documents) if isinstance(document.get("name"), str)],
+            [(file, [name for name in document.get("aliases", []) if isinstance(name, str)]) for file, document in self.weapon_documents(documents) if isinstance(document.get("aliases"), list)],
+        ]
+        self.key_tiers: Dict[str, int] = {}
+        for tier, named in enumerate(tiers):
+            for (file, names) in named:
+                for name in names:
+                    self.names.setdefault(name, file)
+                    self.add_key(name_key(name), file, tier)
+        # Ids are a letter or two, too short to match loosely
+        for file, document in self.weapon_documents(documents):
+            if isinstance(document.get("id"), str):
+                self.names.setdefault(document["id"], file)
+
+        self.trigram_keys: Dict[str, List[str]] = {}
+        self.trigram_counts: Dict[str, int] = {}
+        for key in self.keys:
+            self.trigram_counts[key] = len(trigrams(key))
+            for trigram in trigrams(key):
+                self.trigram_keys.setdefault(trigram, []).append(key)
+
+    @staticmethod
+    def weapon_documents(documents: Dict[str, Any]):
+        return [(file, document) for file, document in sorted(documents.items()) if isinstance(document, dict)]
+
+    def add_key(self, key: str, file: str, tier: int):
+        if key == "" or self.key_tiers.setdefault(key, tier) < tier:
+            return
+        if key in self.ambiguous:
+            self.ambiguous[key] = sorted(set(self.ambiguous[key]) | {file})
+        elif self.keys.setdefault(key, file) != file:
+            # Two weapons of the same tier share the key, only their exact names lead to them
+            self.ambiguous[key] = sorted({self.keys.pop(key), file})
+
+    def resolve(self, name: str, source: Optional[str] = None) -> Optional[str]:
+        """File of the weapon called name, or None. With a source, a name that doesn't resolve is recorded for report."""
+        file = self.names.get(name) or self.names.get(raw_file_name(name)) or self.keys.get(name_key(name))
+        if file is None and source is not None:
+            entry = self.unresolved.setdefault(name, {"sources": [], "count": 0})
+            entry["count"] += 1
+            if source not in entry["sources"]:
+                entry["sources"].append(source)
+        return file
+
+    def suggest(self, name: str, limit: int = 3) -> List[str]:
+        """Files whose names share the most trigrams with name, best first."""
+        query = trigrams(name_key(name))
+        shared = Counter(key for trigram in query for key in self.trigram_keys.get(trigram, []))
+        scores = {}
+        for key, count in shared.items():
+            similarity = count / (len(query) + self.trigram_counts[key] - count)
+            if similarity >= MIN_SIMILARITY:
+                file = self.keys[key]
+                scores[file] = max(scores.get(file, 0), similarity)
+        return sorted(scores, key=lambda file: (-scores[file], file))[:limit]
+
+    def report(self) -> str:
+        """Every name that didn't resolve, where it came from and what it might have meant."""
+        lines = []
+        for name in sorted(self.unresolved):
+            entry = self.unresolved[name]
+            suggestions = self.suggest(name)
+            lines.append(f"{name} ({', '.join(entry['sources'])}, {entry['count']}x)" + (f": did you mean {', '.join(suggestions)}?" if len(suggestions) > 0 else ""))
+        return "".join(line + "\n" for line in lines)
+
+def load_name_index(weapons_dir: str, documents: Optional[Dict[str, Any]] = None) -> NameIndex:
+    """
+    Index of a weapons directory. Only the documents given are read for display names and aliases,
+    the others are known by file name, which is what the ingest scripts match on.
+    Without documents every file is read.
+    """
+    if documents is None:
+        (documents, _) = read_weapons_dir(weapons_dir)
+    return NameIndex([file for file in os.listdir(weapons_dir) if file.endswith(".json")] if os.path.isdir(weapons_dir) else [], documents)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the weapon file of any weapon name: file name, id, display name, save file name or alias")
+    parser.add_argument("names", nargs="+", help="Names to look up")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "weapons"), help="Path to the weapons directory")
+    args = parser.parse_args()
+
+    index = load_name_index(args.weapons_dir)
+    for name in args.names:
+        file = index.resolve(name, "command line")
+        if file is not None:
+            print(f"{name}: {file}")
+    print(index.report(), end="")
+
+if __name__ == '__main__':
+    main()
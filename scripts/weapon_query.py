@@ -0,0 +1,327 @@
+import argparse
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from generate_matchups import load_weapons
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fields with an inverted index, each holds a string or a list of strings
+TAG_FIELDS = ["damageType", "weaponTypes", "classes", "subclasses"]
+SWING_VARIANTS = ["light", "heavy"]
+
+# Checking one weapon on a walk costs about as much as intersecting this many posting entries
+WALK_STEP_COST = 64
+
+@dataclass
+class Query:
+    """
+    Weapons matching every where field (any of the values given for a field) and every range, both ends inclusive
+    and None for open. Sorted by the sort keys in order, a leading - sorts descending, weapons without a key last.
+    """
+    where: Dict[str, List[str]] = field(default_factory=dict)
+    ranges: Dict[str, Tuple[Optional[float], Optional[float]]] = field(default_factory=dict)
+    sort: List[str] = field(default_factory=list)
+    limit: Optional[int] = None
+
+    @staticmethod
+    def from_dict(data: Dict) -> "Query":
+        """{"where": {"classes": "Knight"}, "range": {"slash.heavy.damage": [50, null]}, "sort": ["-slash.heavy.damage"], "limit": 5}"""
+        where = {key: value if isinstance(value, list) else [value] for key, value in data.get("where", {}).items()}
+        ranges = {key: (low, high) for key, (low, high) in data.get("range", {}).items()}
+        return Query(where, ranges, list(data.get("sort", [])), data.get("limit"))
+
+def numeric_stats(weapon: Dict) -> Dict[str, float]:
+    """Every number of a weapon keyed by its path, slash.heavy.windup, slash.range, special.damage or staminaDamageNegation."""
+    stats = {}
+
+    def add(key, value):
+        if type(value) in [int, float]:
+            stats[key] = value
+
+    for key, value in weapon.items():
+        add(key, value)
+    for attack_name, attack in weapon["attacks"].items():
+        for stat, value in attack.items():
+            if stat in SWING_VARIANTS and isinstance(value, dict):
+                for variant_stat, variant_value in value.items():
+                    add(f"{attack_name}.{stat}.{variant_stat}", variant_value)
+            else:
+                add(f"{attack_name}.{stat}", value)
+    return stats
+
+def stat_key(key: str) -> str:
+    """attacks.slash.heavy.windup and slash.heavy.windup are the same stat."""
+    return key[len("attacks."):] if key.startswith("attacks.") else key
+
+class WeaponIndex:
+    """
+    The roster, parsed once, with a sorted index per numeric stat and an inverted index per tag field.
+    Range predicates are two binary searches, tag lookups a dict hit, and top-k walks a sorted index
+    from the right end, so a query costs about log(weapons) plus the size of its answer.
+    """
+
+    def __init__(self, weapons: List[Dict]):
+        self.weapons = weapons
+        self.names = [weapon["name"] for weapon in weapons]
+        count = len(weapons)
+
+        columns: Dict[str, Dict[int, float]] = {}
+        for w, weapon in enumerate(weapons):
+            for key, value in numeric_stats(weapon).items():
+                columns.setdefault(key, {})[w] = value
+
+        # Per stat: values ascending and the weapons they belong to (roster order among equals), each weapon's value
+        # (NaN without the stat), and its dense rank per direction, count for weapons without the stat so they sort last
+        self.sorted_values: Dict[str, np.ndarray] = {}
+        self.sorted_weapons: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        self.ranks: Dict[Tuple[str, bool], np.ndarray] = {}
+        # Per stat and direction, (values, weapons) as lists for top() to walk, descending keeps roster order among equals
+        self.walks: Dict[Tuple[str, bool], Tuple[List[float], List[int]]] = {}
+        for key, column in columns.items():
+            weapon_ids = np.fromiter(column.keys(), dtype=np.intp, count=len(column))
+            values = np.fromiter(column.values(), dtype=np.float64, count=len(column))
+            order = np.lexsort((weapon_ids, values))
+            (values, weapon_ids) = (values[order], weapon_ids[order])
+            self.sorted_values[key] = values
+            self.sorted_weapons[key] = weapon_ids
+
+            self.values[key] = np.full(count, np.nan)
+            self.values[key][weapon_ids] = values
+            ranks = np.full(count, count, dtype=np.intp)
+            ranks[weapon_ids] = np.concatenate(([0], np.cumsum(values[1:] != values[:-1])))
+            self.ranks[(key, False)] = ranks
+            self.ranks[(key, True)] = np.where(ranks == count, count, ranks[weapon_ids].max(initial=0) - ranks)
+
+            self.walks[(key, False)] = (values.tolist(), weapon_ids.tolist())
+            descending = np.lexsort((weapon_ids, -values))
+            self.walks[(key, True)] = (values[descending].tolist(), weapon_ids[descending].tolist())
+
+        # Per tag field: lowercased value -> ascending weapon ids
+        self.tags: Dict[str, Dict[str, np.ndarray]] = {}
+        for tag_field in TAG_FIELDS:
+            postings: Dict[str, List[int]] = {}
+            for w, weapon in enumerate(weapons):
+                values = weapon.get(tag_field, [])
+                for value in values if isinstance(values, list) else [values]:
+                    if isinstance(value, str):
+                        postings.setdefault(value.lower(), []).append(w)
+            self.tags[tag_field] = {value: np.array(weapon_ids, dtype=np.intp) for value, weapon_ids in postings.items()}
+
+        # The same postings as masks, so a walk over a sorted index can check a weapon without intersecting anything
+        self.tag_masks: Dict[str, Dict[str, np.ndarray]] = {}
+        for tag_field, postings in self.tags.items():
+            self.tag_masks[tag_field] = {}
+            for value, weapon_ids in postings.items():
+                self.tag_masks[tag_field][value] = np.zeros(count, dtype=bool)
+                self.tag_masks[tag_field][value][weapon_ids] = True
+
+    @property
+    def stats(self) -> List[str]:
+        return sorted(self.sorted_values)
+
+    def check_stat(self, key: str) -> str:
+        key = stat_key(key)
+        if key not in self.sorted_values:
+            raise KeyError(f"Unknown stat {key}")
+        return key
+
+    def tagged(self, tag_field: str, values: List[str]) -> np.ndarray:
+        """Ascending ids of the weapons with any of the values in tag_field."""
+        if tag_field not in self.tags:
+            raise KeyError(f"Unknown field {tag_field}, expected one of {', '.join(TAG_FIELDS)}")
+        postings = [self.tags[tag_field].get(value.lower(), np.empty(0, dtype=np.intp)) for value in values]
+        return postings[0] if len(postings) == 1 else np.unique(np.concatenate(postings))
+
+    def range_bounds(self, key: str, low: Optional[float] = None, high: Optional[float] = None) -> Tuple[int, int]:
+        """Slice of the sorted index of key holding low <= key <= high."""
+        values = self.sorted_values[self.check_stat(key)]
+        start = 0 if low is None else int(np.searchsorted(values, low, side="left"))
+        end = len(values) if high is None else int(np.searchsorted(values, high, side="right"))
+        return (start, max(start, end))
+
+    def in_range(self, key: str, low: Optional[float] = None, high: Optional[float] = None) -> np.ndarray:
+        """Ids of the weapons with low <= key <= high, ascending by the stat."""
+        (start, end) = self.range_bounds(key, low, high)
+        return self.sorted_weapons[self.check_stat(key)][start:end]
+
+    def matcher(self, query: Query) -> Callable[[int], bool]:
+        """Whether a single weapon passes every where and range of query, without looking at any other weapon."""
+        tag_masks = []
+        for tag_field, values in query.where.items():
+            if tag_field not in self.tags:
+                raise KeyError(f"Unknown field {tag_field}, expected one of {', '.join(TAG_FIELDS)}")
+            tag_masks.append([self.tag_masks[tag_field][value.lower()] for value in values if value.lower() in self.tag_masks[tag_field]])
+        ranges = [(self.values[self.check_stat(key)], low, high) for key, (low, high) in query.ranges.items()]
+
+        def matches(w: int) -> bool:
+            for masks in tag_masks:
+                if not any(mask[w] for mask in masks):
+                    return False
+            for (values, low, high) in ranges:
+                value = values[w]
+                # NaN, the weapon doesn't have the stat, fails every comparison
+                if not (value == value and (low is None or value >= low) and (high is None or value <= high)):
+                    return False
+            return True
+        return matches
+
+    def sort_ranks(self, sort: List[str]) -> List[np.ndarray]:
+        """Per sort key, every weapon's dense rank in that key's order."""
+        ranks = []
+        for key in sort:
+            descending = key.startswith("-")
+            ranks.append(self.ranks[(self.check_stat(key[1:] if descending else key), descending)])
+        return ranks
+
+    def order(self, candidates: np.ndarray, sort: List[str]) -> np.ndarray:
+        """candidates sorted by every key, roster order breaking the last ties."""
+        if len(sort) == 0:
+            return candidates
+        ranks = self.sort_ranks(sort)
+        # lexsort sorts by its last key first
+        return candidates[np.lexsort([candidates] + [rank[candidates] for rank in reversed(ranks)])]
+
+    def top(self, sort: List[str], limit: int, matches: Optional[Callable[[int], bool]] = None, max_steps: Optional[int] = None) -> Optional[np.ndarray]:
+        """
+        The first limit weapons in sort order that matches accepts (every weapon if it's None). Walks the first key's
+        index from the front, only gathering the ties of the last weapon taken, then sorts that handful by every key.
+        Gives up and returns None once it has looked at max_steps weapons.
+        """
+        descending = sort[0].startswith("-")
+        key = self.check_stat(sort[0][1:] if descending else sort[0])
+        (values, weapon_ids) = self.walks[(key, descending)]
+
+        taken = []
+        last_value = None
+        for step, (value, w) in enumerate(zip(values, weapon_ids)):
+            if len(taken) >= limit and value != last_value:
+                break
+            if max_steps is not None and step >= max_steps:
+                return None
+            if matches is None or matches(w):
+                taken.append(w)
+                last_value = value
+
+        if len(taken) < limit:
+            # Not enough weapons have the first key, the rest come after them
+            missing = np.flatnonzero(np.isnan(self.values[key]))
+            if matches is not None:
+                missing = np.array([w for w in missing.tolist() if matches(w)], dtype=np.intp)
+            taken += self.order(missing, sort[1:]).tolist()
+        return self.order(np.array(taken, dtype=np.intp), sort)[:limit]
+
+    def query(self, query: Query) -> np.ndarray:
+        """
+        Ids of the weapons matching query, in order. A top-k query whose filters are loose walks the sort index and
+        checks weapons one at a time, one whose filters are tight intersects them first, whichever touches fewer weapons.
+        """
+        sizes = [sum(len(self.tags[tag_field].get(value.lower(), ())) for value in values) if tag_field in self.tags else 0 for tag_field, values in query.where.items()]
+        sizes += [end - start for (start, end) in (self.range_bounds(key, low, high) for key, (low, high) in query.ranges.items())]
+
+        if query.limit is not None and len(query.sort) > 0:
+            if len(sizes) == 0:
+                return self.top(query.sort, query.limit)
+            count = max(1, len(self.weapons))
+            # Weapons the walk passes before it has limit matches, if the filters are independent. They aren't always,
+            # so the walk stops once it has cost as much as intersecting would have
+            expected_matches = count * float(np.prod([size / count for size in sizes]))
+            max_steps = sum(sizes) // WALK_STEP_COST
+            if expected_matches > 0 and query.limit * count / expected_matches < max_steps:
+                result = self.top(query.sort, query.limit, self.matcher(query), max_steps)
+                if result is not None:
+                    return result
+
+        filters = [self.tagged(tag_field, values) for tag_field, values in query.where.items()]
+        filters += [np.sort(self.in_range(key, low, high)) for key, (low, high) in query.ranges.items()]
+        candidates = np.arange(len(self.weapons))
+        for (i, matched) in enumerate(sorted(filters, key=len)):
+            candidates = matched if i == 0 else np.intersect1d(candidates, matched, assume_unique=True)
+
+        result = self.order(candidates, query.sort)
+        return result if query.limit is None else result[:query.limit]
+
+    def rows(self, weapon_ids: np.ndarray, columns: List[str]) -> List[Dict]:
+        """name and the given stats or tag fields of each weapon, None where a weapon doesn't have the stat."""
+        keys = [column if column in TAG_FIELDS else self.check_stat(column) for column in columns]
+        rows = []
+        for w in weapon_ids.tolist():
+            row = {"name": self.names[w]}
+            for column, key in zip(columns, keys):
+                if key in TAG_FIELDS:
+                    row[column] = self.weapons[w].get(key)
+                    continue
+                value = float(self.values[key][w])
+                row[column] = None if np.isnan(value) else value
+            rows.append(row)
+        return rows
+
+def load_index(weapons_location: str) -> WeaponIndex:
+    """Every weapon with an id in a weapons directory or weapon store."""
+    weapons_location = weapons_location + "/" if weapons_location[-1] != "/" and not os.path.isfile(weapons_location) else weapons_location
+    return WeaponIndex([weapon for weapon in load_weapons(weapons_location) if "id" in weapon])
+
+def parse_range(text: str) -> Tuple[str, Tuple[Optional[float], Optional[float]]]:
+    """slash.heavy.damage=50:70, either end can be left out."""
+    (key, bounds) = text.split("=", 1)
+    (low, high) = bounds.split(":", 1) if ":" in bounds else (bounds, bounds)
+    return (key, (float(low) if low else None, float(high) if high else None))
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter and sort the weapon roster from in-memory indexes")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(ROOT, "src", "weapons"), help="Path to the weapons directory, or to a weapon store built by weapon_store.py")
+    parser.add_argument("--where", action="append", default=[], help="field=value on damageType, weaponTypes, classes or subclasses. Repeat a field to match any of its values")
+    parser.add_argument("--range", action="append", default=[], help="stat=low:high, e.g. slash.heavy.damage=50: or overhead.range=:200")
+    parser.add_argument("--sort", action="append", default=[], help="Stat to sort by, -stat for descending. Repeat for tie breakers")
+    parser.add_argument("-k", "--limit", type=int, help="Only the first k weapons")
+    parser.add_argument("-c", "--columns", default="", help="Comma separated stats to print next to each weapon, the sort and range stats by default")
+    parser.add_argument("--batch", help="File with a json query per line (- for stdin), written to stdout as a json result per line")
+    parser.add_argument("--stats", action="store_true", help="List every stat that can be ranged or sorted on")
+    args = parser.parse_args()
+
+    index = load_index(args.weapons_dir)
+
+    if args.stats:
+        print("\n".join(index.stats))
+        return
+
+    if args.batch:
+        lines = sys.stdin if args.batch == "-" else open(args.batch)
+        with lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                try:
+                    query = Query.from_dict(data)
+                    print(json.dumps(index.rows(index.query(query), data.get("columns", [key.lstrip("-") for key in query.sort]))))
+                except KeyError as e:
+                    print(json.dumps({"error": e.args[0]}))
+        return
+
+    where = {}
+    for condition in args.where:
+        (tag_field, value) = condition.split("=", 1)
+        where.setdefault(tag_field, []).append(value)
+    query = Query(where, dict(parse_range(text) for text in args.range), args.sort, args.limit)
+
+    try:
+        result = index.query(query)
+        columns = [column for column in args.columns.split(",") if column] or list(dict.fromkeys([key.lstrip("-") for key in query.sort] + list(query.ranges)))
+        rows = index.rows(result, columns)
+    except KeyError as e:
+        parser.error(e.args[0])
+
+    print("".join(f"{column:<28}" for column in ["name"] + columns))
+    for row in rows:
+        print("".join(f"{'-' if row[column] is None else row[column]:<28}" if column != "name" else f"{row[column]:<28}" for column in ["name"] + columns))
+    print(f"{len(rows)} weapons")
+
+if __name__ == '__main__':
+    main()
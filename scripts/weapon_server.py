@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import csv
+import gzip
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+import generate_matchups
+import kill_matrix
+from weapon_names import NameIndex
+from weapon_store import read_weapons_dir, stat_files
+
+RELOAD_INTERVAL = 1.0
+# Requests with a bigger head than this are refused
+MAX_HEADER_BYTES = 16384
+# Request bodies are read and thrown away, bigger ones than this aren't worth reading and the connection is closed
+MAX_BODY_BYTES = 16384
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+@dataclass
+class Response:
+    """A body serialized once, with its gzip encoding and a strong ETag for each."""
+    body: bytes
+    gzipped: bytes
+    etag: str
+    gzip_etag: str
+    content_type: str = "application/json"
+
+def make_response(data, content_type: str = "application/json") -> Response:
+    body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    # Strong ETags name exact bytes, so the gzip encoding gets its own
+    return Response(body, gzip.compress(body, mtime=0), f'"{digest}"', f'"{digest}-gzip"', content_type)
+
+def number(value: str):
+    """Matchup csv cells back to numbers, anything else stays a string."""
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """
+    Whether an Accept-Encoding header allows gzip: "gzip" (or the old "x-gzip") with a q-value above 0, or failing
+    that a "*" with one. "gzip;q=0" refuses it, and a q-value that isn't a number counts as 0.
+    """
+    qualities = {}
+    for part in accept_encoding.split(","):
+        (coding, *parameters) = [field.strip() for field in part.split(";")]
+        coding = coding.lower()
+        if coding == "":
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            (name, _, value) = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value.strip())
+                except ValueError:
+                    quality = 0.0
+        qualities["gzip" if coding == "x-gzip" else coding] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+def body_length(headers: Dict[str, str]) -> Optional[int]:
+    """Bytes of body that follow a request head, None for a body that can't be skipped (chunked, or too big)."""
+    if "transfer-encoding" in headers:
+        return None
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        return None
+    return length if 0 <= length <= MAX_BODY_BYTES else None
+
+def read_matchups(path: str) -> List[Dict]:
+    with open(path, newline="") as f:
+        return [{key: number(value) if key != "name" else value for key, value in row.items()} for row in csv.DictReader(f)]
+
+def watched_files(weapons_dir: str, matchups_path: Optional[str]) -> Dict[str, List[int]]:
+    """(size, mtime) of everything the responses are built from, a reload happens when it changes."""
+    stats = stat_files(weapons_dir, sorted(file for file in os.listdir(weapons_dir) if file.endswith(".json")))
+    if matchups_path is not None:
+        stats[matchups_path] = stat_files(os.path.dirname(os.path.abspath(matchups_path)), [os.path.basename(matchups_path)])[os.path.basename(matchups_path)]
+    return stats
+
+def build_responses(weapons_dir: str, matchups_path: Optional[str]) -> Tuple[Dict[str, Response], NameIndex]:
+    """
+    Every response the server can give, keyed by path, and the names of the weapons. /weapons is the roster,
+    /weapons/<id or file name> one weapon, /matchups the generate_matchups table (read from matchups_path, or computed
+    if there's none) and /kill-matrix the kill_matrix table.
+    """
+    (documents, _) = read_weapons_dir(weapons_dir)
+    weapons = {file: document for file, document in sorted(documents.items()) if isinstance(document, dict) and "id" in document}
+
+    responses = {"/weapons": make_response(list(weapons.values()))}
+    for file, weapon in weapons.items():
+        response = make_response(weapon)
+        responses[f"/weapons/{weapon['id']}"] = response
+        responses[f"/weapons/{os.path.splitext(file)[0]}"] = response
+
+    matchups = read_matchups(matchups_path) if matchups_path is not None else generate_matchups.calculate_matchups(list(weapons.values()))
+    responses["/matchups"] = make_response(matchups)
+
+    targets = kill_matrix.load_targets()
+    packed = kill_matrix.pack_attacks(list(weapons.values()))
+    responses["/kill-matrix"] = make_response({"targets": [target.name for target in targets], "rows": kill_matrix.matrix_rows(packed, targets, *kill_matrix.kill_matrix(packed, targets))})
+    return (responses, NameIndex(weapons, weapons))
+
+class WeaponServer:
+    """Serves the precomputed responses, swapping in a new set whenever the files behind them change."""
+
+    def __init__(self, weapons_dir: str, matchups_path: Optional[str] = None, reload_interval: float = RELOAD_INTERVAL):
+        self.weapons_dir = weapons_dir
+        self.matchups_path = matchups_path
+        self.reload_interval = reload_interval
+        self.files = watched_files(weapons_dir, matchups_path)
+        (self.responses, self.names) = build_responses(weapons_dir, matchups_path)
+        self.loaded = time.time()
+
+    async def reload(self) -> bool:
+        """Rebuilds the responses if the files changed, off the event loop. True if they were rebuilt."""
+        loop = asyncio.get_running_loop()
+        files = await loop.run_in_executor(None, watched_files, self.weapons_dir, self.matchups_path)
+        if files == self.files:
+            return False
+        start = time.perf_counter()
+        (self.responses, self.names) = await loop.run_in_executor(None, build_responses, self.weapons_dir, self.matchups_path)
+        self.files = files
+        self.loaded = time.time()
+        print(f"Reloaded {len(self.responses)} responses in {time.perf_counter() - start:.3f} s")
+        return True
+
+    async def watch(self):
+        """Polls the files, requests keep being served from the old responses while they're rebuilt or when that fails."""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                # Most likely a file caught halfway through being written, or broken for a moment. The files aren't
+                # marked as seen, so the next poll tries again
+                print(f"WARNING: Unable to reload: {type(e).__name__}: {e}")
+
+    def respond(self, method: str, path: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        if method not in ["GET", "HEAD"]:
+            return (405, {"Allow": "GET, HEAD"}, b"")
+        path = path.split("?", 1)[0].rstrip("/") or "/"
+        if path == "/":
+            return (200, {"Content-Type": "application/json"}, json.dumps({"paths": sorted(self.responses), "loaded": self.loaded}).encode("utf-8"))
+
+        response = self.responses.get(path)
+        if response is None and path.startswith("/weapons/"):
+            # Any other name of a weapon, /weapons/Lion's%20Bane
+            file = self.names.resolve(unquote(path[len("/weapons/"):]))
+            response = self.responses.get("/weapons/" + os.path.splitext(file)[0]) if file is not None else None
+        if response is None:
+            return (404, {"Content-Type": "application/json"}, b'{"error":"not found"}')
+
+        gzipped = accepts_gzip(headers.get("accept-encoding", ""))
+        (body, etag) = (response.gzipped, response.gzip_etag) if gzipped else (response.body, response.etag)
+        response_headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache", "Content-Type": response.content_type}
+        if gzipped:
+            response_headers["Content-Encoding"] = "gzip"
+
+        if_none_match = headers.get("if-none-match")
+        # If-None-Match compares weakly, W/"abc" matches "abc"
+        if if_none_match is not None and (if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+            return (304, response_headers, b"")
+        return (200, response_headers, body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """One connection, kept alive for as many requests as the client sends."""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    return
+
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split(" ")
+                if len(parts) != 3:
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    return
+                (method, path, version) = parts
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        (name, value) = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                # A body left unread would be taken for the next request
+                length = body_length(headers)
+                if length is None:
+                    writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                    return
+                try:
+                    await reader.readexactly(length)
+                except asyncio.IncompleteReadError:
+                    return
+
+                (status, response_headers, body) = self.respond(method, path, headers)
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" and (version == "HTTP/1.1" or connection == "keep-alive")
+
+                head = [f"HTTP/1.1 {status} {REASONS[status]}"]
+                head += [f"{name}: {value}" for name, value in response_headers.items()]
+                head.append(f"Content-Length: {len(body)}")
+                head.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+async def serve(server: WeaponServer, host: str, port: int):
+    listener = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES)
+    watcher = asyncio.create_task(server.watch())
+    print(f"Serving {len(server.responses)} responses on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        watcher.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only HTTP server for the weapons, matchups and kill matrix, with every response precomputed")
+    parser.add_argument("-w", "--weapons_dir", default=os.path.join(kill_matrix.SRC_DIR, "weapons"), help="Path to the weapons directory")
+    parser.add_argument("-m", "--matchups", help="Matchup csv written by generate_matchups.py. Computed from the weapons when not given")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--reload_interval", type=float, default=RELOAD_INTERVAL, help="Seconds between checks for changed files")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    server = WeaponServer(args.weapons_dir, args.matchups, args.reload_interval)
+    print(f"Built {len(server.responses)} responses in {time.perf_counter() - start:.3f} s")
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import profiling
+
+# Bump when the layout of the saved arrays changes
+STORE_VERSION = 1
+
+# Row variants. Swings have a base row (range, altRange) plus a light and heavy row, every other attack only has a base row.
+VARIANTS = ["base", "light", "heavy"]
+BASE, LIGHT, HEAVY = 0, 1, 2
+
+# Cell kinds, per stat column
+MISSING, INT, FLOAT, OTHER = 0, 1, 2, 3
+
+# How json.dump(indent=2) writes a file on linux
+DEFAULT_FORMAT = {"newline": "\n", "trailingNewline": False}
+
+# How the ingest scripts write weapon files, the way json.dump always wrote them in the platform's line endings
+WRITE_FORMAT = {"newline": os.linesep, "trailingNewline": False}
+DEFAULT_WRITE_WORKERS = 8
+
+class WeaponStore:
+    """
+    Every stat of every attack of every weapon, one float64 column per stat.
+    Rows are (weapon, attack, variant) records, described by the weapon, attack and variant index arrays.
+    kinds records whether a cell is missing, an int, a float, or something else (strings, bools, null), which live in extras.
+    Key order, line endings, non weapon files and everything outside of the attacks is kept so the json files round trip byte for byte.
+    """
+
+    def __init__(self, files: List[str], fields: List[Dict], formats: List[Dict], attack_names: List[str],
+                 weapon: np.ndarray, attack: np.ndarray, variant: np.ndarray, layout: np.ndarray, layouts: List[List[str]],
+                 columns: Dict[str, np.ndarray], kinds: Dict[str, np.ndarray], extras: Dict[Tuple[int, str], Any],
+                 file_stats: Optional[Dict[str, List[int]]] = None):
+        self.files = files
+        self.fields = fields
+        self.formats = formats
+        self.attack_names = attack_names
+        self.weapon = weapon
+        self.attack = attack
+        self.variant = variant
+        self.layout = layout
+        self.layouts = layouts
+        self.columns = columns
+        self.kinds = kinds
+        self.extras = extras
+        self.file_stats = file_stats if file_stats is not None else {}
+        self._documents = None
+
+    @property
+    def stats(self) -> List[str]:
+        return list(self.columns.keys())
+
+    def rows(self, attack: Optional[str] = None, variant: Optional[str] = None) -> np.ndarray:
+        """Boolean row mask for an attack name and/or variant name."""
+        mask = np.ones(len(self.weapon), dtype=bool)
+        if attack is not None:
+            if attack not in self.attack_names:
+                return np.zeros(len(self.weapon), dtype=bool)
+            mask &= self.attack == self.attack_names.index(attack)
+        if variant is not None:
+            mask &= self.variant == VARIANTS.index(variant)
+        return mask
+
+    def column(self, stat: str, attack: Optional[str] = None, variant: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(weapon index, value) of every numeric cell of a stat, optionally limited to one attack and variant."""
+        mask = self.rows(attack, variant) & ((self.kinds[stat] == INT) | (self.kinds[stat] == FLOAT))
+        return self.weapon[mask], self.columns[stat][mask]
+
+    def documents(self) -> Dict[str, Any]:
+        """Dict view, file name -> the parsed json of that file."""
+        if self._documents is None:
+            self._documents = rebuild_documents(self)
+        return self._documents
+
+    def weapons(self) -> List[Dict]:
+        """Dict view of every weapon, in file order. Files without attacks (e.g. changelog.json) are left out."""
+        documents = self.documents()
+        return [documents[file] for file in self.files if isinstance(documents[file], dict) and isinstance(documents[file].get("attacks"), dict)]
+
+def is_weapon_document(document) -> bool:
+    return isinstance(document, dict) and isinstance(document.get("attacks"), dict)
+
+def build_store(documents: Dict[str, Any], formats: Optional[Dict[str, Dict]] = None) -> WeaponStore:
+    """Build the columns from file name -> parsed json. formats holds each file's newline style, see read_weapons_dir."""
+    formats = formats if formats is not None else {}
+
+    files = list(documents.keys())
+    fields = []
+    attack_names = []
+    layouts = []
+    layout_ids = {}
+    rows = []
+
+    def add_row(w, attack_name, variant, values):
+        keys = list(values.keys())
+        layout_id = layout_ids.setdefault(tuple(keys), len(layouts))
+        if layout_id == len(layouts):
+            layouts.append(keys)
+        if attack_name not in attack_names:
+            attack_names.append(attack_name)
+        rows.append((w, attack_names.index(attack_name), variant, layout_id, values))
+
+    for w, file in enumerate(files):
+        document = documents[file]
+        if not is_weapon_document(document):
+            # Kept whole, there are no attacks to put in columns
+            fields.append({"document": document})
+            continue
+
+        attacks_layout = []
+        for attack_name, attack in document["attacks"].items():
+            if isinstance(attack.get("light"), dict) and isinstance(attack.get("heavy"), dict):
+                attacks_layout.append([attack_name, "swing"])
+                # The base row keeps light and heavy as placeholders so the swing's key order survives
+                add_row(w, attack_name, BASE, {key: (None if key in ["light", "heavy"] else value) for key, value in attack.items()})
+                add_row(w, attack_name, LIGHT, attack["light"])
+                add_row(w, attack_name, HEAVY, attack["heavy"])
+            else:
+                attacks_layout.append([attack_name, "flat"])
+                add_row(w, attack_name, BASE, attack)
+
+        fields.append({"weapon": {key: (None if key == "attacks" else value) for key, value in document.items()}, "attacks": attacks_layout})
+
+    stats = []
+    for (_, _, variant, layout_id, _) in rows:
+        for key in layouts[layout_id]:
+            if key not in stats and not (variant == BASE and key in ["light", "heavy"]):
+                stats.append(key)
+
+    columns = {stat: np.zeros(len(rows), dtype=np.float64) for stat in stats}
+    kinds = {stat: np.zeros(len(rows), dtype=np.int8) for stat in stats}
+    extras = {}
+
+    for r, (_, _, variant, _, values) in enumerate(rows):
+        for key, value in values.items():
+            if variant == BASE and key in ["light", "heavy"] and value is None:
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                kinds[key][r] = OTHER
+                extras[(r, key)] = value
+            else:
+                kinds[key][r] = INT if isinstance(value, int) else FLOAT
+                columns[key][r] = value
+
+    return WeaponStore(
+        files, fields, [formats.get(file, DEFAULT_FORMAT) for file in files], attack_names,
+        np.array([row[0] for row in rows], dtype=np.int32),
+        np.array([row[1] for row in rows], dtype=np.int16),
+        np.array([row[2] for row in rows], dtype=np.int8),
+        np.array([row[3] for row in rows], dtype=np.int32),
+        layouts, columns, kinds, extras,
+    )
+
+def cell_value(store: WeaponStore, row: int, key: str):
+    kind = store.kinds[key][row]
+    if kind == INT:
+        return int(store.columns[key][row])
+    elif kind == FLOAT:
+        return float(store.columns[key][row])
+    return store.extras[(row, key)]
+
+def rebuild_documents(store: WeaponStore) -> Dict[str, Any]:
+    # Group row indices per weapon and attack, rows are stored in document order
+    rows_by_attack = {}
+    for r in range(len(store.weapon)):
+        rows_by_attack.setdefault((int(store.weapon[r]), store.attack_names[store.attack[r]]), {})[int(store.variant[r])] = r
+
+    documents = {}
+    for w, file in enumerate(store.files):
+        fields = store.fields[w]
+        if "document" in fields:
+            documents[file] = fields["document"]
+            continue
+
+        attacks = {}
+        for (attack_name, kind) in fields["attacks"]:
+            attack_rows = rows_by_attack[(w, attack_name)]
+            base = attack_rows[BASE]
+            attack = {}
+            for key in store.layouts[store.layout[base]]:
+                if kind == "swing" and key in ["light", "heavy"]:
+                    variant_row = attack_rows[VARIANTS.index(key)]
+                    attack[key] = {variant_key: cell_value(store, variant_row, variant_key) for variant_key in store.layouts[store.layout[variant_row]]}
+                else:
+                    attack[key] = cell_value(store, base, key)
+            attacks[attack_name] = attack
+
+        documents[file] = {key: (attacks if key == "attacks" else value) for key, value in fields["weapon"].items()}
+    return documents
+
+def file_format(text: str) -> Dict:
+    """Line endings of a json file. Most weapon files were written on windows and use \\r\\n."""
+    return {"newline": "\r\n" if "\r\n" in text else "\n", "trailingNewline": text.endswith("\n")}
+
+def read_weapons_dir(weapons_dir: str) -> Tuple[Dict[str, Any], Dict[str, Dict]]:
+    documents = {}
+    formats = {}
+    for weapon_file in os.listdir(weapons_dir):
+        if weapon_file[-5:] != ".json":
+            continue
+        # newline="" keeps \r\n so the file can be written back the same way
+        with open(os.path.join(weapons_dir, weapon_file), "r", newline="") as f:
+            text = f.read()
+        profiling.file_read(os.path.join(weapons_dir, weapon_file))
+        documents[weapon_file] = json.loads(text)
+        formats[weapon_file] = file_format(text)
+    return documents, formats
+
+def document_text(document, line_format: Dict = DEFAULT_FORMAT) -> str:
+    """What write_document puts in the file, before line endings are translated."""
+    return json.dumps(document, indent=2) + ("\n" if line_format["trailingNewline"] else "")
+
+def write_document(path: str, document, line_format: Dict = DEFAULT_FORMAT):
+    # Written next to the file and swapped in, so a failed write never leaves a truncated file behind
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", newline=line_format["newline"]) as f:
+        f.write(document_text(document, line_format))
+    os.replace(temp_path, path)
+    profiling.file_written(path)
+
+def load_document(weapons_dir: str, file: str, documents: Dict[str, Any], formats: Dict[str, Dict], originals: Dict[str, str]) -> Optional[Any]:
+    """
+    The document for file, from documents if it's already loaded, otherwise read from weapons_dir into documents.
+    Its text from before any changes is kept in originals for write_changed_documents. None if there is no such file.
+    """
+    if file not in documents:
+        path = os.path.join(weapons_dir, file)
+        if not os.path.isfile(path):
+            return None
+        with open(path, "r", newline="") as f:
+            text = f.read()
+        profiling.file_read(path)
+        documents[file] = json.loads(text)
+        formats[file] = file_format(text)
+        originals.setdefault(file, text.replace("\r\n", "\n"))
+    else:
+        originals.setdefault(file, document_text(documents[file], formats[file]))
+    return documents[file]
+
+def write_changed_documents(weapons_dir: str, documents: Dict[str, Any], formats: Dict[str, Dict], originals: Dict[str, str],
+                            workers: int = DEFAULT_WRITE_WORKERS) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Write every document loaded through load_document whose text differs from its original, and every
+    document that has no file yet, with WRITE_FORMAT on a thread pool. Line endings alone don't count as
+    a change, so checkouts with either one don't churn. Returns the written, skipped and failed files.
+    """
+    def is_changed(file):
+        if file not in originals:
+            return not os.path.isfile(os.path.join(weapons_dir, file))
+        return document_text(documents[file], WRITE_FORMAT) != originals[file]
+
+    def write(file):
+        try:
+            with profiling.span("write", file=file):
+                write_document(os.path.join(weapons_dir, file), documents[file], WRITE_FORMAT)
+            formats[file] = WRITE_FORMAT
+            return True
+        except OSError as e:
+            print(f"WARNING: Unable to write {os.path.join(weapons_dir, file)}: {e}")
+            return False
+
+    with profiling.span("write", documents=len(documents)):
+        changed = [file for file in documents if is_changed(file)]
+        skipped = [file for file in documents if file not in changed]
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(write, changed))
+    written = [file for (file, ok) in zip(changed, results) if ok]
+    failed = [file for (file, ok) in zip(changed, results) if not ok]
+    return written, skipped, failed
+
+def write_weapons_dir(store: WeaponStore, weapons_dir: str):
+    if not os.path.exists(weapons_dir):
+        os.mkdir(weapons_dir)
+    documents = store.documents()
+    for file, line_format in zip(store.files, store.formats):
+        write_document(os.path.join(weapons_dir, file), documents[file], line_format)
+
+def stat_files(weapons_dir: str, files: List[str]) -> Dict[str, List[int]]:
+    """(size, mtime) of every file, used to tell whether a store still matches the json files."""
+    stats = {}
+    for file in files:
+        stat = os.stat(os.path.join(weapons_dir, file))
+        stats[file] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+def is_store_fresh(store: WeaponStore, weapons_dir: str) -> bool:
+    files = [file for file in os.listdir(weapons_dir) if file[-5:] == ".json"]
+    if sorted(files) != sorted(store.files):
+        return False
+    return stat_files(weapons_dir, files) == store.file_stats
+
+def store_from_dir(weapons_dir: str) -> WeaponStore:
+    (documents, formats) = read_weapons_dir(weapons_dir)
+    store = build_store(documents, formats)
+    store.file_stats = stat_files(weapons_dir, store.files)
+    return store
+
+def save_documents(documents: Dict[str, Any], formats: Dict[str, Dict], weapons_dir: str, path: str) -> WeaponStore:
+    """Save documents that were just written to weapons_dir as the store at path, without reading the files back."""
+    store = build_store(documents, formats)
+    store.file_stats = stat_files(weapons_dir, store.files)
+    save_store(store, path)
+    return store
+
+def save_store(store: WeaponStore, path: str):
+    metadata = {
+        "version": STORE_VERSION,
+        "files": store.files,
+        "fields": store.fields,
+        "formats": store.formats,
+        "attackNames": store.attack_names,
+        "layouts": store.layouts,
+        "stats": store.stats,
+        "extras": [[row, key, value] for ((row, key), value) in store.extras.items()],
+        "fileStats": store.file_stats,
+    }
+    arrays = {"weapon": store.weapon, "attack": store.attack, "variant": store.variant, "layout": store.layout}
+    for i, stat in enumerate(store.stats):
+        # Stat names aren't necessarily valid file names inside the archive, so they're stored by position
+        arrays[f"values_{i}"] = store.columns[stat]
+        arrays[f"kinds_{i}"] = store.kinds[stat]
+
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays)
+    os.replace(temp_path, path)
+
+def load_store(path: str) -> WeaponStore:
+    with np.load(path, allow_pickle=False) as archive:
+        metadata = json.loads(str(archive["metadata"]))
+        if metadata["version"] != STORE_VERSION:
+            raise ValueError(f"{path} is a version {metadata['version']} weapon store, expected version {STORE_VERSION}")
+
+        return WeaponStore(
+            metadata["files"], metadata["fields"], metadata["formats"], metadata["attackNames"],
+            archive["weapon"], archive["attack"], archive["variant"], archive["layout"], metadata["layouts"],
+            {stat: archive[f"values_{i}"] for i, stat in enumerate(metadata["stats"])},
+            {stat: archive[f"kinds_{i}"] for i, stat in enumerate(metadata["stats"])},
+            {(row, key): value for (row, key, value) in metadata["extras"]},
+            metadata["fileStats"],
+        )
+
+def load_weapon_store(path: str, weapons_dir: Optional[str] = None) -> WeaponStore:
+    """
+    Load the store at path. When weapons_dir is given and its json files changed since the store
+    was saved (or there is no store yet), the store is rebuilt from the json files and saved again.
+    """
+    if weapons_dir is not None and (not os.path.isfile(path) or not is_store_fresh(load_store(path), weapons_dir)):
+        print(f"Rebuilding weapon store {path} from {weapons_dir}")
+        store = store_from_dir(weapons_dir)
+        save_store(store, path)
+        return store
+    return load_store(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert between the per weapon json files and the columnar weapon store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build the store from a weapons directory")
+    build.add_argument("-w", "--weapons_dir", required=True, help="Path to the weapons directory")
+    build.add_argument("-o", "--output", required=True, help="Where to put the store")
+
+    export = subparsers.add_parser("export", help="Write the json files back out of the store")
+    export.add_argument("-i", "--input", required=True, help="Path to the store")
+    export.add_argument("-w", "--weapons_dir", required=True, help="Where to write the json files")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        store = store_from_dir(args.weapons_dir)
+        save_store(store, args.output)
+        print(f"Stored {len(store.files)} files, {len(store.weapon)} attack rows and {len(store.stats)} stat columns in {args.output}")
+    else:
+        write_weapons_dir(load_store(args.input), args.weapons_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+// Generated by scripts/roster_bundle.py from the weapon files, don't edit by hand
+import BUNDLE_IMPORT from "./roster.bundle.json" assert { type: "json" };
+
+import { Weapon } from "./weapon.js";
+
+type RosterBundle = {
+  version: number;
+  fragments: string[];
+  index: {
+    files: Record<string, number>;
+    ids: Record<string, number>;
+    names: Record<string, number>;
+  };
+  weapons: (string | number)[][];
+};
+
+const BUNDLE = BUNDLE_IMPORT as unknown as RosterBundle;
+if (BUNDLE.version !== 1) {
+  throw new Error("roster.bundle.json doesn't match roster.ts, run scripts/roster_bundle.py again");
+}
+
+export const WEAPON_FILES = [
+  "axe",
+  "battle_axe",
+  "carryable__candelabra",
+  "cudgel",
+  "dagger",
+  "dane_axe",
+  "executioners_axe",
+  "falchion",
+  "fists",
+  "glaive",
+  "goedendag",
+  "greatsword",
+  "greatsword__malric",
+  "halberd",
+  "hatchet",
+  "heavy_cavalry_sword",
+  "heavy_mace",
+  "highland_sword",
+  "javelin",
+  "katars",
+  "knife",
+  "longsword",
+  "longsword__argon__citadel",
+  "mace",
+  "maul",
+  "messer",
+  "morning_star",
+  "one_handed_spear",
+  "pickaxe",
+  "pole_axe",
+  "polehammer",
+  "quarterstaff",
+  "rapier",
+  "short_sword",
+  "shovel",
+  "sledgehammer",
+  "spear",
+  "sword",
+  "throwing_axe",
+  "throwing_mallet",
+  "two_handed_hammer",
+  "war_axe",
+  "war_club",
+  "warhammer",
+] as const;
+
+export type WeaponFile = (typeof WEAPON_FILES)[number];
+
+const WEAPONS: (Weapon | undefined)[] = [];
+
+function weaponAt(i: number | undefined): Weapon | undefined {
+  if (i === undefined) {
+    return undefined;
+  }
+  let weapon = WEAPONS[i];
+  if (weapon === undefined) {
+    // Pieces of the weapon's json, numbers are fragments shared with other weapons
+    let text = "";
+    for (const piece of BUNDLE.weapons[i]!) {
+      text += typeof piece === "number" ? BUNDLE.fragments[piece]! : piece;
+    }
+    weapon = WEAPONS[i] = JSON.parse(text) as Weapon;
+  }
+  return weapon;
+}
+
+export function weaponByFile(file: WeaponFile): Weapon {
+  return weaponAt(BUNDLE.index.files[file])!;
+}
+
+export function findWeaponById(id: string): Weapon | undefined {
+  return weaponAt(BUNDLE.index.ids[id]);
+}
+
+export function findWeaponByName(name: string): Weapon | undefined {
+  return weaponAt(BUNDLE.index.names[name]);
+}
+
+export function allWeapons(): Weapon[] {
+  return WEAPON_FILES.map((file) => weaponByFile(file));
+}
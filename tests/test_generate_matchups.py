@@ -0,0 +1,34 @@
+import csv
+import json
+import os
+import sys
+
+import pytest
+
+import generate_matchups
+
+WEAPONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "weapons")
+
+def run_sweep(tmp_path, monkeypatch, sweep):
+    sweep_path = tmp_path / "sweep.json"
+    sweep_path.write_text(json.dumps(sweep))
+    output_path = tmp_path / "rankings.csv"
+    monkeypatch.setattr(sys, "argv", ["generate_matchups.py", "-w", WEAPONS_DIR, "-o", str(output_path), "-s", str(sweep_path)])
+    generate_matchups.main()
+    with open(output_path, newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_sweep_with_different_overrides_per_configuration(tmp_path, monkeypatch):
+    rows = run_sweep(tmp_path, monkeypatch, {"configurations": [{"heavy_weight": 2}, {"stat_weights.windup": 0}]})
+
+    assert len(rows) == 2
+    assert list(rows[0])[:3] == ["configuration", "heavy_weight", "stat_weights.windup"]
+    assert (rows[0]["heavy_weight"], rows[0]["stat_weights.windup"]) == ("2", "")
+    assert (rows[1]["heavy_weight"], rows[1]["stat_weights.windup"]) == ("", "0")
+
+@pytest.mark.parametrize("sweep", [{"configurations": []}, {"grid": {"heavy_weight": []}}])
+def test_sweep_without_configurations_is_rejected(tmp_path, sweep):
+    sweep_path = tmp_path / "sweep.json"
+    sweep_path.write_text(json.dumps(sweep))
+    with pytest.raises(ValueError, match="sweep has no configurations"):
+        generate_matchups.load_sweep_configurations(str(sweep_path))
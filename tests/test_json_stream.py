@@ -0,0 +1,102 @@
+import io
+import json
+import os
+import random
+
+import pytest
+
+from json_stream import JsonStream, iter_items_at
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Escapes, a surrogate pair, a lone surrogate and numbers whose prefixes (1, 1., 1.5e) also decode
+TRICKY = {
+    "escapes": "quote \" backslash \\ slash / \b\f\n\r\t \u0001 end\\",
+    "surrogates": "\U0001F5E1 sword \ud83d",
+    "unicode": "Malric's Greatsword é中",
+    "numbers": [0, -0.0, 1, -12, 1.5, 1.5e-07, -2.25e+30, 12345678901234567890],
+    "literals": [True, False, None],
+    "nested": {"a": [[], {}, [{"b": [1, {"c": "]}\"{["}]}]], "": {"": ""}},
+    "empty": {},
+}
+
+# Every chunk size up to here puts a buffer boundary inside every token at least once
+SMALL_CHUNKS = range(1, 24)
+
+def random_value(rng, depth=0):
+    kind = rng.randrange(8 if depth < 4 else 5)
+    if kind == 0:
+        return rng.choice([True, False, None])
+    if kind == 1:
+        return rng.randint(-10**12, 10**12)
+    if kind == 2:
+        return rng.uniform(-1e6, 1e6) * 10 ** rng.randint(-20, 20)
+    if kind in (3, 4):
+        return "".join(rng.choice(['"', "\\", "\n", "a", " ", "{", "]", ",", ":", "é", "\U0001F5E1", "\ud800"]) for _ in range(rng.randrange(8)))
+    if kind in (5, 6):
+        return {f"k{i}{random_value(rng, 4)}": random_value(rng, depth + 1) for i in range(rng.randrange(5))}
+    return [random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+
+def dump_variants(value):
+    yield json.dumps(value)
+    yield json.dumps(value, indent=2, ensure_ascii=False)
+    yield json.dumps(value, separators=(",", ":"))
+
+def items(text, path, chunk_size):
+    return list(iter_items_at(io.StringIO(text), path, chunk_size))
+
+@pytest.mark.parametrize("chunk_size", SMALL_CHUNKS)
+def test_items_match_json_loads_across_buffer_boundaries(chunk_size):
+    for text in dump_variants(TRICKY):
+        assert items(text, [], chunk_size) == list(json.loads(text).items())
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_documents_match_json_loads(seed):
+    rng = random.Random(seed)
+    document = {f"key{i}": random_value(rng) for i in range(10)}
+    for text in dump_variants(document):
+        expected = list(json.loads(text).items())
+        for chunk_size in [1, 2, 3, 5, 8, 13, 64]:
+            assert items(text, [], chunk_size) == expected
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+def test_seek_skips_siblings(chunk_size):
+    # The values before the target are skipped without being decoded, strings with brackets and escapes included
+    document = [TRICKY, {"Name": "x", "Rows": {"before": TRICKY, "Rows": {"a": 1, "b": [TRICKY]}}}]
+    text = json.dumps(document, indent=1)
+
+    assert items(text, [1, "Rows", "Rows"], chunk_size) == list(document[1]["Rows"]["Rows"].items())
+    assert items(text, [0, "nested"], chunk_size) == list(TRICKY["nested"].items())
+
+    stream = JsonStream(io.StringIO(text), chunk_size)
+    stream.seek([1, "Rows", "before"])
+    stream.skip_value()
+    assert stream._peek() == ","
+
+    with pytest.raises(KeyError):
+        items(text, [1, "Rows", "missing"], chunk_size)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 4096])
+def test_read_value_and_iter_array(chunk_size):
+    values = [TRICKY["numbers"], TRICKY["surrogates"], TRICKY["nested"], 7, -0.5]
+    stream = JsonStream(io.StringIO(json.dumps(values)), chunk_size)
+    assert list(stream.iter_array()) == values
+
+    # A bare number at the end of the file is complete without a delimiter after it
+    assert JsonStream(io.StringIO(" 1.5e3"), chunk_size).read_value() == 1.5e3
+
+def test_real_abilities_match_json_loads():
+    path = os.path.join(ROOT, "raw_data", "AbilitiesOverride.json")
+    with open(path, encoding="utf-8") as f:
+        expected = json.load(f)
+    with open(path, encoding="utf-8") as f:
+        assert list(iter_items_at(f, [0, "Rows"], 1000)) == list(expected[0]["Rows"].items())
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 4096])
+def test_truncated_input_raises(chunk_size):
+    text = json.dumps({"before": TRICKY, "rows": {"a": TRICKY, "b": [1, 2.5, "x"]}})
+    # Cut inside every kind of token: strings, escapes, numbers, literals and between brackets.
+    # The outer closing brace is never read, so the cuts stop at the end of "rows".
+    for cut in range(1, len(text) - 1):
+        with pytest.raises(ValueError):
+            items(text[:cut], ["rows"], chunk_size)
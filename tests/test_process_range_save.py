@@ -0,0 +1,16 @@
+import os
+
+import process_range_save
+from weapon_names import load_name_index
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_range_output_names_weapons_after_their_file():
+    names = load_name_index(os.path.join(ROOT, "src", "weapons"), {})
+    weapons = process_range_save.process_directory(os.path.join(ROOT, "raw_data", "range_test_iterations"), names=names)["rangeData"]
+
+    assert all(weapon == weapon.upper() for weapon in weapons)
+    assert {"CARRYABLE  CANDELABRA", "FISTS", "GREATSWORD  MALRIC", "LONGSWORD  ARGON  CITADEL"} <= set(weapons)
+    assert not {"CANDELABRA", "FIST", "Argon's Sword", "Lions Bane"} & set(weapons)
+    # Every name leads back to its file
+    assert all(names.resolve(weapon) is not None for weapon in weapons)
@@ -0,0 +1,51 @@
+import itertools
+import json
+import os
+
+import generate_matchups
+from weapon_model import ValuePool, Weapon, load_roster
+from weapon_store import read_weapons_dir
+
+WEAPONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "weapons")
+
+def test_calculate_matchup_of_models_matches_dicts_and_leaves_the_pool():
+    roster = load_roster(WEAPONS_DIR)
+    (documents, _) = read_weapons_dir(WEAPONS_DIR)
+    files = [file for file in sorted(roster.weapons) if "damageType" in documents[file]][:12]
+    size = roster.pool.size
+
+    for (a, b) in itertools.product(files, files):
+        expected = generate_matchups.calculate_matchup(documents[a], documents[b])
+        matchup = generate_matchups.calculate_matchup(roster.weapons[a], roster.weapons[b])
+        assert (matchup, type(matchup)) == (expected, type(expected))
+    assert roster.pool.size == size
+
+def test_compact_drops_numbers_no_weapon_uses():
+    roster = load_roster(WEAPONS_DIR)
+    weapon = next(iter(roster.weapons.values()))
+    copied = weapon.copy()
+    for factor in [1.5, 2.5, 3.5]:
+        weapon.scale("damage", factor)
+    (document, copied_document, size) = (weapon.to_document(), copied.to_document(), roster.pool.size)
+
+    roster.compact()
+
+    assert roster.pool.size < size
+    assert weapon.to_document() == document
+    # Copies that aren't in the roster keep the pool they were made in
+    assert copied.to_document() == copied_document
+
+def test_documents_round_trip_through_a_shared_pool():
+    documents = [
+        {"id": "a", "name": "A", "negative": -0.0, "zero": 0.0, "int": 0, "flag": True, "list": [1, 2.5], "attacks": {"slash": {"range": 1.5, "light": {"damage": 10, "windup": 200.0}}}},
+        {"id": "b", "name": "B", "negative": 0.0, "zero": -0.0, "int": 2 ** 60, "flag": False, "list": [], "attacks": {"stab": {"range": 1, "light": {"damage": 10.0, "windup": 200}}}},
+    ]
+    pool = ValuePool()
+    weapons = Weapon.from_documents(documents, pool)
+    for (weapon, document) in zip(weapons, documents):
+        assert json.dumps(weapon.to_document()) == json.dumps(document)
+        # The same layout as flattening value by value
+        assert weapon.layout is Weapon.from_flattened(document, ValuePool()).layout
+    # The big int sends both through the value by value path, the first one alone takes the fast one
+    weapon = Weapon.from_document(documents[0], pool)
+    assert (weapon.layout, weapon.index.tolist()) == (weapons[0].layout, weapons[0].index.tolist())
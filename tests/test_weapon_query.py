@@ -0,0 +1,112 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+import synthetic_data
+import weapon_query
+from weapon_query import Query, WeaponIndex, numeric_stats
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Enough weapons that loose top-k queries take the walk instead of intersecting
+SYNTHETIC_WEAPONS = 3000
+
+@pytest.fixture(scope="module")
+def weapons():
+    (_, templates) = synthetic_data.load_templates(os.path.join(ROOT, "raw_data", "AbilitiesOverride.json"), os.path.join(ROOT, "src", "weapons"))
+    roster = [weapon for weapon in synthetic_data.generate_roster(templates, SYNTHETIC_WEAPONS).values() if "id" in weapon]
+    for w, weapon in enumerate(roster):
+        attacks = weapon["attacks"]
+        # Coarse ranges so the sort keys tie, and some weapons without them so they have to sort last
+        for attack in attacks.values():
+            if isinstance(attack, dict) and "range" in attack:
+                attack["range"] = round(attack["range"], -1)
+        if w % 7 == 0:
+            attacks.get("slash", {}).pop("range", None)
+        if w % 11 == 0:
+            attacks.get("stab", {}).get("heavy", {}).pop("damage", None)
+    return roster
+
+@pytest.fixture(scope="module")
+def stats(weapons):
+    return [numeric_stats(weapon) for weapon in weapons]
+
+def brute_force(weapons, stats, query):
+    """Every weapon checked against every filter, then sorted by the keys with roster order last."""
+    matched = []
+    for w, weapon in enumerate(weapons):
+        tags_match = True
+        for tag_field, values in query.where.items():
+            tags = weapon.get(tag_field, [])
+            tags = {tag.lower() for tag in (tags if isinstance(tags, list) else [tags])}
+            tags_match = tags_match and any(value.lower() in tags for value in values)
+        ranges_match = all(key in stats[w] and (low is None or stats[w][key] >= low) and (high is None or stats[w][key] <= high)
+                           for key, (low, high) in query.ranges.items())
+        if tags_match and ranges_match:
+            matched.append(w)
+
+    def sort_key(w):
+        key = []
+        for stat in query.sort:
+            descending = stat.startswith("-")
+            value = stats[w].get(stat.lstrip("-"))
+            key.append((1, 0) if value is None else (0, -value if descending else value))
+        return key + [w]
+    matched.sort(key=sort_key)
+    return matched if query.limit is None else matched[:query.limit]
+
+def random_query(rng, index):
+    stats = ["slash.range", "stab.heavy.damage", "overhead.light.damage", "slash.heavy.windup", "overhead.range"]
+    where = {}
+    for tag_field in rng.sample(["damageType", "weaponTypes", "classes"], rng.randrange(3)):
+        where[tag_field] = rng.sample(sorted(index.tags[tag_field]), rng.randint(1, 2))
+    ranges = {}
+    for key in rng.sample(stats, rng.randrange(3)):
+        values = index.sorted_values[key]
+        (low, high) = sorted(rng.choice(values.tolist()) for _ in range(2))
+        ranges[key] = (rng.choice([low, None]), rng.choice([high, None]))
+    sort = [rng.choice(["", "-"]) + key for key in rng.sample(stats, rng.randint(1, 2))]
+    return Query(where, ranges, sort, rng.choice([1, 3, 10, 50, 5000]))
+
+def test_query_matches_brute_force_on_both_plans(weapons, stats, monkeypatch):
+    index = WeaponIndex(weapons)
+    walks = []
+    top = WeaponIndex.top
+
+    def counted_top(self, sort, limit, matches=None, max_steps=None):
+        result = top(self, sort, limit, matches, max_steps)
+        walks.append((max_steps, result is not None))
+        return result
+    monkeypatch.setattr(weapon_query.WeaponIndex, "top", counted_top)
+
+    rng = random.Random(0)
+    for _ in range(500):
+        query = random_query(rng, index)
+        assert index.query(query).tolist() == brute_force(weapons, stats, query), query
+
+    # Both plans ran: walks that finished, walks that gave up, and intersections
+    finished = [max_steps for (max_steps, done) in walks if max_steps is not None and done]
+    assert len(finished) > 0 and len([done for (_, done) in walks if not done]) > 0
+    assert len([max_steps for (max_steps, _) in walks if max_steps is not None]) < 500
+
+def test_ties_missing_stats_and_short_results(weapons, stats):
+    index = WeaponIndex(weapons)
+    for sort in (["slash.range"], ["-slash.range"], ["-slash.range", "stab.heavy.damage"], ["stab.heavy.damage", "-slash.range"]):
+        for limit in (1, 5, len(weapons) + 10):
+            query = Query(sort=sort, limit=limit)
+            assert index.query(query).tolist() == brute_force(weapons, stats, query)
+
+    # Weapons without the sort stat come last, after every one that has it
+    result = index.query(Query(sort=["-slash.range"], limit=len(weapons) + 10)).tolist()
+    missing = [w for w in result if "range" not in weapons[w]["attacks"]["slash"]]
+    assert len(missing) > 0 and result[-len(missing):] == missing
+    assert len(np.unique(index.values["slash.range"][~np.isnan(index.values["slash.range"])])) < len(weapons) // 10
+
+    # A tight filter with a limit bigger than its matches
+    where = {"classes": [sorted(index.tags["classes"])[0]], "damageType": [sorted(index.tags["damageType"])[0]]}
+    query = Query(where, {"slash.range": (None, float(np.nanmedian(index.values["slash.range"])))}, ["-slash.range"], 5000)
+    expected = brute_force(weapons, stats, query)
+    assert 0 < len(expected) < 5000
+    assert index.query(query).tolist() == expected
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import shutil
+
+import pytest
+
+from weapon_server import WeaponServer, accepts_gzip
+
+WEAPONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "weapons")
+
+def light_slash_damage(server):
+    return json.loads(server.responses["/weapons/axe"].body)["attacks"]["slash"]["light"]["damage"]
+
+def write_axe(weapons_dir, change, mtime):
+    with open(os.path.join(WEAPONS_DIR, "axe.json")) as f:
+        document = json.load(f)
+    change(document)
+    path = os.path.join(weapons_dir, "axe.json")
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    os.utime(path, (mtime, mtime))
+
+@pytest.mark.parametrize("accept_encoding, gzipped", [
+    ("gzip, deflate, br", True),
+    ("GZIP;Q=0.5", True),
+    ("x-gzip", True),
+    ("*", True),
+    ("br;q=1, *;q=0.1", True),
+    ("", False),
+    ("deflate", False),
+    ("notgzip", False),
+    ("gzip;q=0", False),
+    ("gzip; q=0.0, *", False),
+    ("*;q=0", False),
+    ("gzip;q=abc", False),
+])
+def test_accepts_gzip(accept_encoding, gzipped):
+    assert accepts_gzip(accept_encoding) == gzipped
+
+@pytest.fixture
+def weapons_dir(tmp_path):
+    shutil.copytree(WEAPONS_DIR, tmp_path / "weapons")
+    return str(tmp_path / "weapons")
+
+async def wait_for(condition, timeout=10.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+@pytest.mark.parametrize("break_axe", [
+    lambda document: document.update({"attacks": None}),
+    lambda document: document["attacks"]["slash"].pop("light"),
+])
+def test_watch_keeps_old_responses_through_a_bad_reload(weapons_dir, break_axe, capsys):
+    server = WeaponServer(weapons_dir, reload_interval=0.01)
+
+    async def run():
+        watcher = asyncio.create_task(server.watch())
+        try:
+            write_axe(weapons_dir, break_axe, 1000000000)
+            assert await wait_for(lambda: "Unable to reload" in capsys.readouterr().out)
+            assert light_slash_damage(server) == 50
+
+            write_axe(weapons_dir, lambda document: document["attacks"]["slash"]["light"].update({"damage": 99}), 1000000001)
+            assert await wait_for(lambda: light_slash_damage(server) == 99)
+            assert not watcher.done()
+        finally:
+            watcher.cancel()
+    asyncio.run(run())
+
+def exchange(server, request):
+    """Everything the server answers on one connection to request, until it closes it or goes quiet."""
+    async def run():
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        async with listener:
+            (reader, writer) = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+            writer.write(request)
+            await writer.drain()
+            received = b""
+            try:
+                while True:
+                    data = await asyncio.wait_for(reader.read(65536), 0.5)
+                    if data == b"":
+                        break
+                    received += data
+            except asyncio.TimeoutError:
+                pass
+            writer.close()
+            return received
+    return asyncio.run(run())
+
+def test_request_body_is_not_taken_for_the_next_request():
+    server = WeaponServer(WEAPONS_DIR)
+    body = b"GET / HTTP/1.1\r\n\r\nxx"
+    received = exchange(server, b"POST /weapons HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body + b"HEAD /weapons/axe HTTP/1.1\r\n\r\n")
+
+    assert received.count(b"HTTP/1.1 ") == 2
+    assert received.startswith(b"HTTP/1.1 405 ")
+    assert b"HTTP/1.1 200 OK" in received and b'"paths"' not in received
+
+def test_chunked_request_closes_the_connection():
+    server = WeaponServer(WEAPONS_DIR)
+    received = exchange(server, b"POST /weapons HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n14\r\nGET / HTTP/1.1\r\n\r\nxx\r\n0\r\n\r\n")
+
+    assert received == b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+def test_if_none_match_compares_weakly():
+    server = WeaponServer(WEAPONS_DIR)
+    etag = server.respond("GET", "/weapons/axe", {})[1]["ETag"]
+
+    assert server.respond("GET", "/weapons/axe", {"if-none-match": f'"other", W/{etag}'})[0] == 304
+    assert server.respond("GET", "/weapons/axe", {"if-none-match": '"other"'})[0] == 200